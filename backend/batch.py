@@ -0,0 +1,57 @@
+import asyncio
+import os
+import time
+import uuid
+import zipfile
+from llm_service import generate_ppt_content
+from render_cache import render_cached
+from retention import artifact_path
+
+# === 批量生成 ===
+# LLM 调用用信号量限制并发 (避免触发 OpenAI 限流)，渲染交给渲染进程池；
+# 模板缓存 / 图片磁盘缓存 / 大纲缓存在整个批次间自动共享。
+
+BATCH_LLM_CONCURRENCY = int(os.getenv("BATCH_LLM_CONCURRENCY", 4))
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", 100))
+
+
+async def _run_item(index: int, item, semaphore: asyncio.Semaphore) -> dict:
+    result = {"index": index, "topic": item.topic, "theme": item.theme, "status": "success"}
+    started = time.perf_counter()
+    try:
+        async with semaphore:
+            t0 = time.perf_counter()
+            ppt_data = await generate_ppt_content(item.topic, item.use_ai, slide_length=item.slide_length, cache=item.cache)
+            result["llm_seconds"] = round(time.perf_counter() - t0, 3)
+
+        t0 = time.perf_counter()
+        result["filename"] = await render_cached(ppt_data, item.theme)
+        result["render_seconds"] = round(time.perf_counter() - t0, 3)
+        result["slide_count"] = len(ppt_data.slides)
+    except Exception as e:
+        print(f"❌ [Batch] 第 {index} 项失败 ({item.topic}): {e}")
+        result["status"] = "failed"
+        result["error"] = f"{type(e).__name__}: {e}"
+    result["total_seconds"] = round(time.perf_counter() - started, 3)
+    return result
+
+
+async def run_batch(items: list, llm_concurrency: int = None) -> list:
+    """
+    并发生成多份 PPT，单项失败不影响其他项。
+    :return: 每项的结果 (与输入顺序一致)
+    """
+    semaphore = asyncio.Semaphore(llm_concurrency or BATCH_LLM_CONCURRENCY)
+    print(f"📚 [Batch] 开始批量生成 {len(items)} 份 PPT")
+    return await asyncio.gather(*[_run_item(i, item, semaphore) for i, item in enumerate(items)])
+
+
+def zip_results(results: list) -> str:
+    """把成功的 PPT 打包成一个 zip (放在 generated_ppts 下)，返回 zip 文件名"""
+    zip_name = f"{uuid.uuid4()}.zip"
+    with zipfile.ZipFile(artifact_path(zip_name), "w", zipfile.ZIP_STORED) as zf:
+        for r in results:
+            if r["status"] == "success":
+                safe_topic = "".join(c for c in r["topic"] if c.isalnum() or c in " -_").strip() or "deck"
+                zf.write(artifact_path(r["filename"]), f"{r['index'] + 1:03d}_{safe_topic}.pptx")
+    return zip_name
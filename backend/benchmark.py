@@ -0,0 +1,243 @@
+"""
+渲染性能基准测试 (离线运行，不访问网络)
+
+用法:
+    python benchmark.py                                  # 默认: 5/20/50/200 页 x 三个主题
+    python benchmark.py --sizes 5 50 --themes academic   # 指定规模和主题
+    python benchmark.py --output bench.json              # 保存结果
+    python benchmark.py --compare bench.json             # 和之前的结果对比，报告变慢的项
+
+每个 PPT 都是按固定随机种子合成的，布局混合了 LAYOUT_CONFIG 里的所有类型，
+图片用本地生成的固定图片代替 get_image_stream。
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import defaultdict
+from io import BytesIO
+from PIL import Image
+
+# 基准测试只看汇总结果，默认关掉逐阶段的 JSON 日志
+os.environ.setdefault("LOG_FORMAT", "off")
+import ppt_engine
+from models import PresentationData
+
+LAYOUT_MIX = ["content_list", "content_list", "two_column", "chart", "table", "image_page", "content_list"]
+
+WORDS = ("market growth platform revenue customer adoption latency throughput strategy pipeline "
+         "quarterly margin efficiency automation infrastructure retention scalability forecast").split()
+CJK = "人工智能驱动的数据分析平台显著提升了运营效率并降低成本市场份额持续增长"
+
+
+# === 1. 合成数据 ===
+def _sentence(rng, words):
+    text = " ".join(rng.choice(WORDS) for _ in range(words)).capitalize() + "."
+    if rng.random() < 0.3:
+        text += " " + "".join(rng.choice(CJK) for _ in range(rng.randint(10, 40)))
+    return text
+
+
+def make_deck(n_slides: int, seed: int = 0) -> PresentationData:
+    """合成一份 n_slides 页的 PPT (第 1 页为封面，其余按 LAYOUT_MIX 轮换)"""
+    rng = random.Random(seed + n_slides)
+    slides = [{"id": 1, "layout": "title_cover", "title": "Benchmark Deck", "subtitle": f"{n_slides} slides"}]
+    for i in range(2, n_slides + 1):
+        layout = LAYOUT_MIX[(i - 2) % len(LAYOUT_MIX)]
+        slide = {"id": i, "layout": layout, "title": _sentence(rng, 4)[:40]}
+        if layout == "content_list":
+            if i % 2:
+                slide["content"] = {"text_body": " ".join(_sentence(rng, 25) for _ in range(5))}
+                slide["visual"] = {"need_image": True, "image_prompt": f"decor image {i % 5}"}
+            else:
+                slide["content"] = {"bullet_points": [_sentence(rng, rng.randint(20, 45)) for _ in range(rng.randint(3, 6))]}
+        elif layout == "two_column":
+            slide["content"] = {
+                "content_left": [_sentence(rng, 12) for _ in range(3)],
+                "content_right": [_sentence(rng, 12) for _ in range(3)],
+            }
+        elif layout == "chart":
+            labels = [str(2015 + k) for k in range(rng.randint(4, 12))]
+            slide["chart_data"] = {"title": "Revenue", "labels": labels, "values": [round(rng.uniform(10, 500), 1) for _ in labels]}
+        elif layout == "table":
+            cols = rng.randint(2, 5)
+            slide["table_data"] = {
+                "headers": [rng.choice(WORDS).title() for _ in range(cols)],
+                "rows": [[rng.choice(WORDS) if c == 0 else rng.randint(1, 9999) for c in range(cols)] for _ in range(rng.randint(3, 12))],
+            }
+        elif layout == "image_page":
+            slide["visual"] = {"need_image": True, "image_prompt": f"hero image {i % 7}", "caption": _sentence(rng, 8)}
+        slides.append(slide)
+    return PresentationData(topic="Benchmark", slides=slides)
+
+
+def _fixture_image(prompt: str) -> bytes:
+    """按 prompt 生成一张确定性的 1280x720 JPEG (模拟 Pollinations 的返回)"""
+    rng = random.Random(prompt)
+    img = Image.new("RGB", (1280, 720), tuple(rng.randint(0, 255) for _ in range(3)))
+    for _ in range(40):
+        x, y = rng.randint(0, 1200), rng.randint(0, 650)
+        img.paste(tuple(rng.randint(0, 255) for _ in range(3)), (x, y, x + rng.randint(20, 300), y + rng.randint(20, 200)))
+    buf = BytesIO()
+    img.save(buf, "JPEG", quality=90)
+    return buf.getvalue()
+
+
+# === 2. 单次测量 ===
+def _max_rss():
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss if sys.platform == "darwin" else rss * 1024
+
+
+def _render_deck(data: PresentationData, theme: str, path: str):
+    """完整渲染一次并保存，返回 (各阶段耗时, 各布局逐页耗时)"""
+    stages = {}
+    per_layout = defaultdict(list)
+
+    t0 = time.perf_counter()
+    prs, layout_map = ppt_engine.open_deck(theme)
+    stages["template_load"] = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    images = ppt_engine.prefetch_images(data)
+    stages["image_prefetch"] = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    normalized = {}  # 和 create_pptx_file 一样，整份 PPT 共用压缩后的图片
+    for slide_data in data.slides:
+        ts = time.perf_counter()
+        ppt_engine.render_slide(prs, layout_map, slide_data, images, normalized=normalized)
+        per_layout[slide_data.layout].append(time.perf_counter() - ts)
+    stages["render_slides"] = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    prs.save(path)
+    stages["save"] = time.perf_counter() - t0
+    return stages, per_layout
+
+
+def bench_once(data: PresentationData, theme: str, out_dir: str) -> dict:
+    """计时 (不开 tracemalloc，它对每次分配都有额外开销，会把耗时放大)"""
+    path = os.path.join(out_dir, f"{theme}-{len(data.slides)}.pptx")
+    stages, per_layout = _render_deck(data, theme, path)
+    return {
+        "stages": stages,
+        "total": sum(stages.values()),
+        "per_layout": {k: {"count": len(v), "total": sum(v), "mean": statistics.mean(v)} for k, v in per_layout.items()},
+        "file_size_bytes": os.path.getsize(path),
+    }
+
+
+def measure_memory(data: PresentationData, theme: str, out_dir: str) -> dict:
+    """单独渲染一次测峰值内存，这一次的耗时不计入结果"""
+    path = os.path.join(out_dir, f"{theme}-{len(data.slides)}-mem.pptx")
+    tracemalloc.start()
+    try:
+        _render_deck(data, theme, path)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {
+        # tracemalloc 只统计 Python 层的分配 (lxml 的 C 内存不在其中)，另附进程 RSS 峰值供参考
+        "peak_memory_bytes": peak,
+        "max_rss_bytes": _max_rss(),
+    }
+
+
+def run(sizes, themes, repeat: int) -> dict:
+    fixtures = {}
+
+    def fake_get_image_stream(query):
+        if query not in fixtures:
+            fixtures[query] = _fixture_image(query)
+        return BytesIO(fixtures[query])
+
+    ppt_engine.get_image_stream = fake_get_image_stream
+    ppt_engine.preload_templates()
+
+    results = {}
+    with tempfile.TemporaryDirectory() as out_dir:
+        for theme in themes:
+            for n in sizes:
+                data = make_deck(n)
+                # 固定图片提前生成好，不计入图片阶段耗时
+                for slide in data.slides:
+                    if slide.visual and slide.visual.need_image:
+                        fake_get_image_stream(slide.visual.image_prompt)
+                runs = [bench_once(data, theme, out_dir) for _ in range(repeat)]
+                # 取总耗时中位数的那一次作为代表
+                best = sorted(runs, key=lambda r: r["total"])[len(runs) // 2]
+                best["total_runs"] = [round(r["total"], 4) for r in runs]
+                best.update(measure_memory(data, theme, out_dir))
+                results[f"{theme}/{n}"] = best
+                print(f"   {theme:<9} {n:>4} 页  总计 {best['total'] * 1000:8.1f} ms  "
+                      + "  ".join(f"{k}={v * 1000:.1f}ms" for k, v in best["stages"].items())
+                      + f"  峰值内存 {best['peak_memory_bytes'] / 1024 / 1024:.1f} MB  文件 {best['file_size_bytes'] / 1024:.0f} KB")
+    return results
+
+
+# === 3. 对比 ===
+def compare(current: dict, baseline: dict, threshold: float) -> list:
+    """返回比基线慢 / 大超过 threshold (比例) 的指标"""
+    regressions = []
+    for case, cur in current["results"].items():
+        base = baseline.get("results", {}).get(case)
+        if not base:
+            continue
+        checks = [("total", cur["total"], base["total"]), ("file_size_bytes", cur["file_size_bytes"], base["file_size_bytes"])]
+        checks += [(f"stages.{k}", v, base["stages"].get(k)) for k, v in cur["stages"].items()]
+        checks += [(f"per_layout.{k}.mean", v["mean"], base["per_layout"].get(k, {}).get("mean")) for k, v in cur["per_layout"].items()]
+        for name, now, before in checks:
+            if before and now > before * (1 + threshold):
+                regressions.append({"case": case, "metric": name, "baseline": before, "current": now,
+                                    "change": round(now / before - 1, 3)})
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ppt_engine 渲染基准测试")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[5, 20, 50, 200])
+    parser.add_argument("--themes", nargs="+", default=list(ppt_engine.LAYOUT_CONFIG))
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", help="结果保存为 JSON")
+    parser.add_argument("--compare", help="与之前保存的 JSON 结果对比")
+    parser.add_argument("--threshold", type=float, default=0.15, help="判定为退化的幅度 (默认 15%%)")
+    args = parser.parse_args()
+
+    print("⏱️ [Benchmark] 开始渲染基准测试...")
+    current = {
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "results": run(args.sizes, args.themes, args.repeat),
+    }
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(current, f, ensure_ascii=False, indent=2)
+        print(f"💾 结果已保存: {args.output}")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(current, baseline, args.threshold)
+        if regressions:
+            print(f"❌ 发现 {len(regressions)} 项退化 (阈值 {args.threshold:.0%}):")
+            for r in regressions:
+                print(f"   {r['case']:<16} {r['metric']:<32} {r['baseline']:.4g} -> {r['current']:.4g} (+{r['change']:.0%})")
+            sys.exit(1)
+        print("✅ 没有发现性能退化")
+
+
+if __name__ == "__main__":
+    main()
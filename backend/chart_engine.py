@@ -0,0 +1,162 @@
+import os
+import numpy as np
+from pptx.chart.data import CategoryChartData
+from pptx.enum.chart import XL_CHART_TYPE, XL_LEGEND_POSITION
+
+# === 图表引擎 ===
+# - chart_type 映射到真实的图表类型 (支持 XL_CHART_TYPE 名称和 line / bar / pie 等常见别名)
+# - 支持多系列 (ChartData.series)，兼容只有 values 的单系列写法
+# - 点数超过 CHART_MAX_POINTS 时先降采样再写入图表 (内嵌 Excel 和图表 XML 都随点数线性增长):
+#     折线 / 面积图: LTTB (保留形状和极值)，多系列时按归一化后的面积之和选点，保证各系列共用同一组横轴
+#     柱状 / 条形图: 按桶求平均
+#     饼图 / 环形图: 保留最大的几块，其余合并为 "Other"
+
+CHART_MAX_POINTS = int(os.getenv("CHART_MAX_POINTS", 200))
+CHART_PIE_MAX_SLICES = int(os.getenv("CHART_PIE_MAX_SLICES", 8))
+
+ALIASES = {
+    "COLUMN": "COLUMN_CLUSTERED",
+    "BAR": "BAR_CLUSTERED",
+    "STACKED_COLUMN": "COLUMN_STACKED",
+    "STACKED_BAR": "BAR_STACKED",
+    "LINE_CHART": "LINE",
+    "TREND": "LINE",
+    "AREA_CHART": "AREA",
+    "PIE_CHART": "PIE",
+    "DONUT": "DOUGHNUT",
+    "THREE_D_PIE": "PIE",
+}
+# python-pptx 能用分类数据 (CategoryChartData) 写出的图表类型；
+# XL_CHART_TYPE 里的其他成员 (3D / 曲面 / 股价图等) 写入时会报 NotImplementedError 或生成无效 XML
+CATEGORY_TYPES = {
+    "AREA", "AREA_STACKED", "AREA_STACKED_100",
+    "BAR_CLUSTERED", "BAR_STACKED", "BAR_STACKED_100",
+    "COLUMN_CLUSTERED", "COLUMN_STACKED", "COLUMN_STACKED_100",
+    "LINE", "LINE_MARKERS", "LINE_STACKED", "LINE_STACKED_100",
+    "LINE_MARKERS_STACKED", "LINE_MARKERS_STACKED_100",
+    "PIE", "PIE_EXPLODED", "DOUGHNUT", "DOUGHNUT_EXPLODED",
+    "RADAR", "RADAR_FILLED", "RADAR_MARKERS",
+}
+LINE_LIKE = {"LINE", "LINE_MARKERS", "LINE_STACKED", "LINE_MARKERS_STACKED", "AREA", "AREA_STACKED", "RADAR"}
+PIE_LIKE = {"PIE", "PIE_EXPLODED", "DOUGHNUT", "DOUGHNUT_EXPLODED"}
+# 需要 XY / 气泡数据结构的类型，这里用分类数据画不了，退回折线图
+UNSUPPORTED = {"XY_SCATTER", "BUBBLE"}
+
+
+def resolve_chart_type(name: str) -> str:
+    """把 LLM 给出的 chart_type 规范成 CATEGORY_TYPES 里的成员名，无法识别或写不出的类型用 COLUMN_CLUSTERED"""
+    key = (name or "").strip().upper().replace("-", "_").replace(" ", "_")
+    key = ALIASES.get(key, key)
+    if any(key.startswith(prefix) for prefix in UNSUPPORTED):
+        return "LINE"
+    if key in CATEGORY_TYPES:
+        return key
+    return "COLUMN_CLUSTERED"
+
+
+def _series_of(data):
+    """返回 (系列名列表, 数值矩阵 [系列数, 点数])，长度不一致时按 labels 截断 / 补 0"""
+    if data.series:
+        names = [s.name for s in data.series]
+        columns = [s.values for s in data.series]
+    else:
+        names = [data.title or "Series 1"]
+        columns = [data.values]
+    n = len(data.labels)
+    matrix = np.zeros((len(columns), n), dtype=float)
+    for i, values in enumerate(columns):
+        values = np.asarray(values[:n], dtype=float)
+        matrix[i, :len(values)] = values
+    return names, np.nan_to_num(matrix)
+
+
+# === 1. 降采样 ===
+def lttb_indices(matrix: np.ndarray, n_out: int) -> np.ndarray:
+    """
+    Largest-Triangle-Three-Buckets: 从 n 个点里选 n_out 个最能保留形状的点 (首尾必选)。
+    桶边界和每个桶的均值一次性向量化算好，只有 "依赖上一个选中点" 的部分按桶循环。
+    :param matrix: [系列数, 点数]
+    """
+    n = matrix.shape[1]
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    # 各系列归一化到 [0, 1]，避免数值大的系列主导选点
+    lo, hi = matrix.min(axis=1, keepdims=True), matrix.max(axis=1, keepdims=True)
+    y = (matrix - lo) / np.where(hi > lo, hi - lo, 1)
+    x = np.arange(n, dtype=float)
+
+    # 中间的 n-2 个点分成 n_out-2 个桶
+    edges = np.unique(np.linspace(1, n - 1, n_out - 1).astype(int))
+    counts = np.diff(edges)
+    avg_x = np.add.reduceat(x[:n - 1], edges[:-1]) / counts
+    avg_y = np.add.reduceat(y[:, :n - 1], edges[:-1], axis=1) / counts
+    # 每个桶的 "下一个桶均值"，最后一个桶用最后一个点
+    next_x = np.append(avg_x[1:], x[-1])
+    next_y = np.concatenate([avg_y[:, 1:], y[:, -1:]], axis=1)
+
+    selected = np.empty(len(counts) + 2, dtype=int)
+    selected[0], selected[-1] = 0, n - 1
+    a = 0
+    for i in range(len(counts)):
+        start, end = edges[i], edges[i + 1]
+        ax, ay = x[a], y[:, a:a + 1]
+        # 三角形面积 (省略 1/2)，多系列求和
+        area = np.abs((ax - next_x[i]) * (y[:, start:end] - ay)
+                      - (ax - x[start:end]) * (next_y[:, i:i + 1] - ay)).sum(axis=0)
+        a = start + int(area.argmax())
+        selected[i + 1] = a
+    return selected
+
+
+def bucket_means(matrix: np.ndarray, n_out: int):
+    """等宽分桶求平均，返回 (每个桶的起始下标, 聚合后的矩阵)"""
+    n = matrix.shape[1]
+    edges = np.unique(np.linspace(0, n, n_out + 1).astype(int))[:-1]
+    counts = np.diff(np.append(edges, n))
+    return edges, np.add.reduceat(matrix, edges, axis=1) / counts
+
+
+def downsample(chart_type: str, labels: list, matrix: np.ndarray, max_points: int = None):
+    """按图表类型选择降采样方式，返回 (labels, matrix)"""
+    max_points = max_points or CHART_MAX_POINTS
+    n = matrix.shape[1]
+
+    if chart_type in PIE_LIKE:
+        # 饼图只画第一个系列
+        values = matrix[0]
+        if n <= CHART_PIE_MAX_SLICES:
+            return labels, matrix[:1]
+        order = np.argsort(values)[::-1]
+        keep = np.sort(order[:CHART_PIE_MAX_SLICES - 1])
+        other = values[order[CHART_PIE_MAX_SLICES - 1:]].sum()
+        return [labels[i] for i in keep] + ["Other"], np.append(values[keep], other)[None, :]
+
+    if n <= max_points:
+        return labels, matrix
+    if chart_type in LINE_LIKE:
+        idx = lttb_indices(matrix, max_points)
+        return [labels[i] for i in idx], matrix[:, idx]
+    starts, means = bucket_means(matrix, max_points)
+    return [labels[i] for i in starts], means
+
+
+# === 2. 绘制 ===
+def add_chart(slide, data, left, top, width, height):
+    """把 ChartData 画成图表，返回 chart 对象"""
+    chart_type = resolve_chart_type(data.chart_type)
+    names, matrix = _series_of(data)
+    labels, matrix = downsample(chart_type, list(data.labels), matrix)
+
+    chart_data = CategoryChartData()
+    chart_data.categories = labels
+    for name, values in zip(names, matrix):
+        chart_data.add_series(name, values.tolist())
+
+    graphic_frame = slide.shapes.add_chart(getattr(XL_CHART_TYPE, chart_type), left, top, width, height, chart_data)
+    chart = graphic_frame.chart
+    # 多系列 / 饼图才需要图例
+    if len(matrix) > 1 or chart_type in PIE_LIKE:
+        chart.has_legend = True
+        chart.legend.position = XL_LEGEND_POSITION.BOTTOM
+        chart.legend.include_in_layout = False
+    return chart
@@ -0,0 +1,234 @@
+"""
+本地假服务: OpenAI Chat Completions + 图床 (压测用，不消耗 OpenAI 额度，也不访问 Pollinations)
+
+用法:
+    python fake_services.py --port 9000 --llm-latency 2.0 --llm-error-rate 0.02
+
+然后让后端指向它:
+    OPENAI_BASE_URL=http://127.0.0.1:9000/v1
+    IMAGE_API_URL=http://127.0.0.1:9000/prompt
+    IMAGE_BACKUP_URL=http://127.0.0.1:9000/backup/1280/720
+
+- POST /v1/chat/completions: 支持 JSON 模式和 stream=True (SSE)，返回合法的 PresentationData JSON
+  (页数取自 system prompt 里的 "Target N slides"，主题取自 user 消息)；
+  也能应答两阶段生成的骨架请求和逐页内容请求；usage 按 4 字符 ≈ 1 token 估算，
+  并模拟服务端前缀缓存 (与最近的 system prompt 相同的前缀按 128 token 粒度计入 cached_tokens，至少 1024 token)
+- GET /prompt/{query}: 按 query 生成确定性的 JPEG；GET /backup/{w}/{h}: 备用图源
+- 延迟服从对数正态分布 (中位数 + sigma)，错误按比例随机返回 500 / 429
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import re
+import time
+import uuid
+import zlib
+from functools import lru_cache
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from benchmark import make_deck, _fixture_image
+
+# 运行参数 (命令行覆盖)
+config = {
+    "llm_latency": 1.5,       # LLM 完整响应耗时中位数 (秒)
+    "llm_sigma": 0.3,         # 对数正态分布的 sigma，0 = 固定延迟
+    "llm_per_slide": 0.0,     # 每生成一页额外的耗时 (秒)，模拟输出越长越慢；骨架每页按 1/10 计
+    "llm_error_rate": 0.0,    # 返回错误的比例
+    "stream_chunk_chars": 40, # 流式输出每个 chunk 的字符数
+    "image_latency": 0.5,
+    "image_sigma": 0.3,
+    "image_error_rate": 0.0,
+    "unique_images": False,   # True=图片 prompt 带上主题，每个主题都要重新下载图片
+}
+
+app = FastAPI(title="Fake OpenAI & Image Host")
+stats = {"llm_requests": 0, "llm_errors": 0, "image_requests": 0, "image_errors": 0}
+_recent_prompts = []  # 最近的 system prompt，用于模拟前缀缓存
+
+
+def _latency(median: float, sigma: float) -> float:
+    if median <= 0:
+        return 0.0
+    if sigma <= 0:
+        return median
+    return random.lognormvariate(math.log(median), sigma)
+
+
+def _maybe_error(rate: float):
+    """按比例返回一个错误响应 (OpenAI 的错误格式)，否则 None"""
+    if random.random() >= rate:
+        return None
+    status, kind = random.choice([(500, "server_error"), (429, "rate_limit_exceeded")])
+    return JSONResponse(status_code=status, content={"error": {"message": f"fake {kind}", "type": kind, "code": kind}})
+
+
+# === 1. Chat Completions ===
+def _usage(messages: list, content: str) -> dict:
+    system = next((m["content"] for m in messages if m.get("role") == "system"), "")
+    prompt_chars = sum(len(m.get("content") or "") for m in messages)
+    common = max((len(os.path.commonprefix([system, p])) for p in _recent_prompts), default=0)
+    cached = (common // 4) // 128 * 128
+    cached = cached if cached >= 1024 else 0
+    _recent_prompts.append(system)
+    del _recent_prompts[:-16]
+    prompt_tokens = prompt_chars // 4
+    completion_tokens = len(content) // 4
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens,
+        "prompt_tokens_details": {"cached_tokens": cached},
+    }
+
+
+def _build_outline(messages: list):
+    """返回 (JSON 文本, 按页数折算的输出量)"""
+    system = next((m["content"] for m in messages if m.get("role") == "system"), "")
+    user = next((m["content"] for m in messages if m.get("role") == "user"), "")
+    requested = re.search(r"Write the full content of these slides: (\[.*\])", user, re.S)
+    if requested:
+        # 两阶段的逐页内容请求: 页数 = 大纲行数，主题取自 "Topic: '...'"，和骨架阶段用同一份 deck
+        match = re.search(r"Topic: '(.+?)'\n", user)
+        topic = match.group(1) if match else "Untitled"
+        slide_count = len(re.findall(r"^\d+\. \[", user, re.M))
+    else:
+        match = re.search(r"Target (\d+) slides", system)
+        slide_count = int(match.group(1)) if match else 8
+        match = re.search(r"主题 '(.+)'", user)
+        topic = match.group(1) if match else user[:40] or "Untitled"
+
+    data = make_deck(max(1, slide_count), seed=zlib.crc32(topic.encode("utf-8")) % 1000).model_dump(mode="json", exclude_none=True)
+    data["topic"] = topic
+    data["slides"][0]["title"] = topic
+    if config["unique_images"]:
+        for slide in data["slides"]:
+            visual = slide.get("visual")
+            if visual and visual.get("image_prompt"):
+                visual["image_prompt"] = f"{visual['image_prompt']} {topic}"
+
+    if requested:
+        by_id = {s["id"]: s for s in data["slides"]}
+        slides = []
+        for skel in json.loads(requested.group(1)):
+            slide = dict(by_id.get(skel["id"]) or data["slides"][-1])
+            slide.update(id=skel["id"], layout=skel["layout"], title=skel.get("title"))
+            slides.append(slide)
+        return json.dumps({"slides": slides}, ensure_ascii=False), len(slides)
+    if "Output ONLY the skeleton" in system:
+        keys = ("id", "layout", "title", "subtitle")
+        data["slides"] = [{k: s[k] for k in keys if k in s} for s in data["slides"]]
+        return json.dumps(data, ensure_ascii=False), len(data["slides"]) / 10
+    return json.dumps(data, ensure_ascii=False), len(data["slides"])
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    stats["llm_requests"] += 1
+    delay = _latency(config["llm_latency"], config["llm_sigma"])
+
+    error = _maybe_error(config["llm_error_rate"])
+    if error is not None:
+        stats["llm_errors"] += 1
+        await asyncio.sleep(delay * random.random())
+        return error
+
+    messages = body.get("messages", [])
+    content, output_slides = _build_outline(messages)
+    delay += config["llm_per_slide"] * output_slides
+    usage = _usage(messages, content)
+    completion_id = f"chatcmpl-{uuid.uuid4().hex[:24]}"
+    created = int(time.time())
+    model = body.get("model", "gpt-3.5-turbo")
+
+    if not body.get("stream"):
+        await asyncio.sleep(delay)
+        return {
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": created,
+            "model": model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": usage,
+        }
+
+    # 流式: 把总延迟平均摊到每个 chunk 上
+    size = config["stream_chunk_chars"]
+    chunks = [content[i:i + size] for i in range(0, len(content), size)]
+    per_chunk = delay / max(1, len(chunks))
+
+    def chunk_event(delta: dict, finish_reason=None, usage_only: bool = False) -> str:
+        payload = {
+            "id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model,
+            "choices": [] if usage_only else [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+        }
+        if usage_only:
+            payload["usage"] = usage
+        return f"data: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+    async def event_source():
+        yield chunk_event({"role": "assistant", "content": ""})
+        for piece in chunks:
+            await asyncio.sleep(per_chunk)
+            yield chunk_event({"content": piece})
+        yield chunk_event({}, "stop")
+        if (body.get("stream_options") or {}).get("include_usage"):
+            yield chunk_event({}, usage_only=True)
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(event_source(), media_type="text/event-stream")
+
+
+# === 2. 图床 ===
+@lru_cache(maxsize=256)
+def _image_bytes(key: str) -> bytes:
+    return _fixture_image(key)
+
+
+async def _serve_image(key: str):
+    stats["image_requests"] += 1
+    await asyncio.sleep(_latency(config["image_latency"], config["image_sigma"]))
+    if random.random() < config["image_error_rate"]:
+        stats["image_errors"] += 1
+        return Response(status_code=random.choice([500, 502, 503]))
+    return Response(await asyncio.to_thread(_image_bytes, key), media_type="image/jpeg")
+
+
+@app.get("/prompt/{query:path}")
+async def prompt_image(query: str):
+    return await _serve_image(query)
+
+
+@app.get("/backup/{width}/{height}")
+async def backup_image(width: int, height: int):
+    return await _serve_image(f"backup-{random.randint(0, 9)}")
+
+
+@app.get("/stats")
+async def get_stats():
+    return {"config": config, **stats}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="假 OpenAI + 假图床")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    for key, value in config.items():
+        flag = "--" + key.replace("_", "-")
+        if isinstance(value, bool):
+            parser.add_argument(flag, action="store_true")
+        else:
+            parser.add_argument(flag, type=type(value), default=value)
+    args = parser.parse_args()
+    config.update({key: getattr(args, key) for key in config})
+
+    print(f"🧪 [FakeServices] http://{args.host}:{args.port}  配置: {config}")
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+import os
+from io import BytesIO
+from PIL import Image
+
+# === 图片预处理 ===
+# 在插入 PPT 前把图片缩放到实际显示尺寸 (按 DPI 计算)，重新压缩并去掉 EXIF 等元数据。
+# 1280x720 的原图插成 3 英寸宽的小图时，体积可以缩小好几倍。
+
+IMAGE_DPI = int(os.getenv("IMAGE_DPI", 150))
+IMAGE_JPEG_QUALITY = int(os.getenv("IMAGE_JPEG_QUALITY", 82))
+
+
+def normalize_image(img_bytes: bytes, width_in: float, height_in: float = None, dpi: int = None) -> BytesIO:
+    """
+    把图片处理成适合嵌入的大小和格式。
+    :param width_in: 图片在幻灯片上的显示宽度 (英寸)
+    :param height_in: 显示高度 (英寸)，不传时按原图比例
+    :return: 处理后的图片流；处理失败时原样返回
+    """
+    dpi = dpi or IMAGE_DPI
+    try:
+        img = Image.open(BytesIO(img_bytes))
+        img.load()
+    except Exception as e:
+        print(f"   ⚠️ [Image] 图片无法解析，跳过压缩: {e}")
+        return BytesIO(img_bytes)
+
+    # 1. 计算目标像素尺寸 (只缩小，不放大)
+    target_w = int(width_in * dpi)
+    if height_in:
+        target_h = int(height_in * dpi)
+    else:
+        target_h = int(target_w * img.height / img.width)
+    if target_w < img.width or target_h < img.height:
+        img = img.resize((min(target_w, img.width), min(target_h, img.height)), Image.LANCZOS)
+
+    # 2. 有透明通道用 PNG，其余一律 JPEG (不传 exif，即去掉元数据)
+    out = BytesIO()
+    has_alpha = img.mode in ("RGBA", "LA") or (img.mode == "P" and "transparency" in img.info)
+    if has_alpha:
+        img.save(out, format="PNG", optimize=True)
+    else:
+        img.convert("RGB").save(out, format="JPEG", quality=IMAGE_JPEG_QUALITY, optimize=True, progressive=True)
+
+    # 3. 处理后反而更大时 (原图已经很小)，保留原图
+    if out.tell() >= len(img_bytes):
+        return BytesIO(img_bytes)
+    out.seek(0)
+    return out
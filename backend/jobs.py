@@ -0,0 +1,303 @@
+import asyncio
+import json
+import os
+import socket
+import sqlite3
+import time
+import uuid
+from llm_service import generate_ppt_content
+from models import PresentationData
+from pipeline import generate_pipelined
+from render_cache import render_cached
+import telemetry
+
+# === 异步任务队列 ===
+# POST 只负责登记任务并立即返回 job_id，后台 worker 依次执行:
+#   queued -> running (已领取) -> outline -> images (k/n) -> rendering -> saved / failed
+# 任务状态存在 SQLite 里，多个 uvicorn worker 共用同一个库:
+#   - worker 用条件 UPDATE (WHERE status = 'queued') 原子地领取任务，同一任务只会被一个进程执行
+#   - 执行中的任务带租约 (lease_until)，执行进程每 JOB_LEASE/3 秒续期一次
+#   - 租约过期 (执行它的进程已退出) 的任务才会被重新排队，正在别的进程里执行的任务不受影响
+# 排队中的任务数达到 JOB_QUEUE_SIZE 时拒绝新任务 (接口返回 429 + Retry-After)。
+
+JOBS_DB_PATH = os.getenv("JOBS_DB_PATH", "jobs.db")
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", 2))
+JOB_QUEUE_SIZE = int(os.getenv("JOB_QUEUE_SIZE", 20))
+JOB_RETRY_AFTER = int(os.getenv("JOB_RETRY_AFTER", 15))
+JOB_LEASE = float(os.getenv("JOB_LEASE", 60))
+
+_OWNER = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"  # 当前进程的身份，记在领取的任务上
+_queue = None
+_workers = []
+
+
+class QueueFullError(Exception):
+    """排队任务已满"""
+    def __init__(self, retry_after: int):
+        super().__init__(f"job queue is full, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+# === 1. SQLite 存储 ===
+# sqlite3 是同步调用，写冲突时最多会等 10 秒: 协程里一律通过 _db() 放到线程里执行，不阻塞事件循环
+def _connect():
+    conn = sqlite3.connect(JOBS_DB_PATH, timeout=10)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+def init_db():
+    with _connect() as conn:
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                kind TEXT NOT NULL,
+                status TEXT NOT NULL,
+                progress TEXT NOT NULL DEFAULT '{}',
+                request TEXT NOT NULL,
+                result TEXT,
+                error TEXT,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL,
+                owner TEXT,
+                lease_until REAL
+            )
+        """)
+        # 旧版本建的表没有租约字段，补上 (多个进程同时启动时可能已被别人加过)
+        columns = {row["name"] for row in conn.execute("PRAGMA table_info(jobs)")}
+        for name, sql_type in (("owner", "TEXT"), ("lease_until", "REAL")):
+            if name not in columns:
+                try:
+                    conn.execute(f"ALTER TABLE jobs ADD COLUMN {name} {sql_type}")
+                except sqlite3.OperationalError:
+                    pass
+
+
+def _update(job_id: str, **fields):
+    fields["updated_at"] = time.time()
+    for key in ("progress", "result"):
+        if key in fields and fields[key] is not None:
+            fields[key] = json.dumps(fields[key], ensure_ascii=False)
+    cols = ", ".join(f"{k} = ?" for k in fields)
+    with _connect() as conn:
+        conn.execute(f"UPDATE jobs SET {cols} WHERE id = ?", (*fields.values(), job_id))
+
+
+async def _db(fn, *args, **kwargs):
+    return await asyncio.to_thread(fn, *args, **kwargs)
+
+
+async def get_job(job_id: str):
+    return await _db(_get_job, job_id)
+
+
+def _get_job(job_id: str):
+    with _connect() as conn:
+        row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+    if row is None:
+        return None
+    return {
+        "job_id": row["id"],
+        "kind": row["kind"],
+        "status": row["status"],
+        "progress": json.loads(row["progress"]),
+        "result": json.loads(row["result"]) if row["result"] else None,
+        "error": row["error"],
+        "created_at": row["created_at"],
+        "updated_at": row["updated_at"],
+    }
+
+
+def _claim(job_id: str):
+    """原子地领取一个排队中的任务，返回任务行；已被别的进程领走时返回 None"""
+    now = time.time()
+    with _connect() as conn:
+        cur = conn.execute(
+            "UPDATE jobs SET status = 'running', owner = ?, lease_until = ?, updated_at = ? WHERE id = ? AND status = 'queued'",
+            (_OWNER, now + JOB_LEASE, now, job_id),
+        )
+        if cur.rowcount != 1:
+            return None
+        return conn.execute("SELECT kind, request FROM jobs WHERE id = ?", (job_id,)).fetchone()
+
+
+def _renew(job_id: str) -> bool:
+    with _connect() as conn:
+        cur = conn.execute(
+            "UPDATE jobs SET lease_until = ? WHERE id = ? AND owner = ? AND status NOT IN ('saved', 'failed')",
+            (time.time() + JOB_LEASE, job_id, _OWNER),
+        )
+        return cur.rowcount == 1
+
+
+def _recover() -> list:
+    """把租约已过期的执行中任务重新置为 queued，返回由本进程重置的任务 id"""
+    now = time.time()
+    expired = "status NOT IN ('queued', 'saved', 'failed') AND (lease_until IS NULL OR lease_until < ?)"
+    recovered = []
+    with _connect() as conn:
+        rows = conn.execute(f"SELECT id FROM jobs WHERE {expired} ORDER BY created_at", (now,)).fetchall()
+        for row in rows:
+            # 条件 UPDATE: 多个进程同时恢复时只有一个成功
+            cur = conn.execute(
+                f"UPDATE jobs SET status = 'queued', progress = '{{}}', owner = NULL, lease_until = NULL WHERE id = ? AND {expired}",
+                (row["id"], now),
+            )
+            if cur.rowcount == 1:
+                recovered.append(row["id"])
+    return recovered
+
+
+# === 2. 提交 & 执行 ===
+async def submit(kind: str, request: dict) -> str:
+    """
+    登记一个任务并放入队列。
+    :param kind: "generate" (主题 -> PPT) 或 "render" (大纲 -> PPT)
+    :raises QueueFullError: 排队任务已满
+    """
+    job_id = uuid.uuid4().hex
+    if not await _db(_insert, job_id, kind, request):
+        raise QueueFullError(JOB_RETRY_AFTER)
+    _queue.put_nowait(job_id)
+    print(f"📥 [Jobs] 新任务 {job_id} ({kind})")
+    return job_id
+
+
+def _insert(job_id: str, kind: str, request: dict) -> bool:
+    """排队任务未满时登记任务，返回是否登记成功"""
+    now = time.time()
+    with _connect() as conn:
+        # 计数和插入在同一个写事务里，并发提交不会超过 JOB_QUEUE_SIZE
+        conn.execute("BEGIN IMMEDIATE")
+        cur = conn.execute(
+            "INSERT INTO jobs (id, kind, status, progress, request, created_at, updated_at) "
+            "SELECT ?, ?, 'queued', '{}', ?, ?, ? WHERE (SELECT COUNT(*) FROM jobs WHERE status = 'queued') < ?",
+            (job_id, kind, json.dumps(request, ensure_ascii=False), now, now, JOB_QUEUE_SIZE),
+        )
+        return cur.rowcount == 1
+
+
+async def _run_job(job_id: str, row):
+    # 任务在后台执行，日志里用 job_id 作为 request_id
+    telemetry.request_id_var.set(job_id)
+    kind, request = row["kind"], json.loads(row["request"])
+    # 延迟导入: python-pptx 等渲染依赖只在真正执行任务时加载
+    from ppt_engine import prefetch_images, changed_slides
+    # 流水线模式: 大纲生成和图片下载交叠进行，没有单独的阶段进度
+    if kind == "generate" and request.get("pipeline"):
+        await _db(_update, job_id, status="outline", progress={"stage": "pipeline"})
+        ppt_data, filename = await generate_pipelined(
+            request["topic"], request.get("theme", "academic"), use_ai=request.get("use_ai", True),
+            slide_length=request.get("slide_length", 10), cache=request.get("cache", "prefer"),
+            prompt=request.get("prompt"),
+        )
+        await _save(job_id, ppt_data, filename)
+        return
+
+    # 1. 大纲
+    if kind == "generate":
+        await _db(_update, job_id, status="outline", progress={"stage": "outline"})
+        ppt_data = await generate_ppt_content(
+            request["topic"], request.get("use_ai", True),
+            slide_length=request.get("slide_length", 10), cache=request.get("cache", "prefer"),
+            prompt=request.get("prompt"),
+        )
+    else:
+        ppt_data = PresentationData(**request["ppt_data"])
+
+    # 2. 图片: 只在渲染缓存未命中时下载，而且只下载需要重新渲染的页 (其余页从片段还原)
+    #    在线程里下载，每完成一张更新一次进度；回调在下载线程里执行，可以直接写库
+    theme = request.get("theme", "academic")
+
+    def on_progress(done, total):
+        _update(job_id, progress={"stage": "images", "images_done": done, "images_total": total})
+
+    def fetch():
+        return prefetch_images(changed_slides(ppt_data, theme), on_progress=on_progress)
+
+    async def prefetch():
+        await _db(_update, job_id, status="images", progress={"stage": "images", "images_done": 0})
+        images = await asyncio.to_thread(fetch)
+        # 3. 渲染
+        await _db(_update, job_id, status="rendering", progress={"stage": "rendering", "images_total": len(images)})
+        return images
+
+    filename = await render_cached(ppt_data, theme, prefetch=prefetch)
+    await _save(job_id, ppt_data, filename)
+
+
+async def _save(job_id: str, ppt_data: PresentationData, filename: str):
+    await _db(_update, job_id, status="saved", progress={"stage": "saved"}, result={
+        "topic": ppt_data.topic,
+        "filename": filename,
+        "slide_count": len(ppt_data.slides),
+    })
+    print(f"✅ [Jobs] 任务完成 {job_id}")
+
+
+async def _heartbeat(job_id: str):
+    """任务执行期间定期续租，防止被其他进程当成无人执行的任务重新排队"""
+    while True:
+        await asyncio.sleep(JOB_LEASE / 3)
+        if not await _db(_renew, job_id):
+            return
+
+
+async def _worker():
+    while True:
+        job_id = await _queue.get()
+        heartbeat = None
+        try:
+            row = await _db(_claim, job_id)
+            if row is None:
+                # 已被别的进程领取 (或已完成)
+                continue
+            heartbeat = asyncio.create_task(_heartbeat(job_id))
+            await _run_job(job_id, row)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"❌ [Jobs] 任务失败 {job_id}: {e}")
+            await _db(_update, job_id, status="failed", error=f"{type(e).__name__}: {e}")
+        finally:
+            if heartbeat is not None:
+                heartbeat.cancel()
+            _queue.task_done()
+
+
+async def _reaper():
+    """定期把租约过期的任务 (执行它的进程已崩溃) 重新排队"""
+    while True:
+        await asyncio.sleep(JOB_LEASE)
+        for job_id in await _db(_recover):
+            print(f"🔁 [Jobs] 任务 {job_id} 租约过期，重新排队")
+            _queue.put_nowait(job_id)
+
+
+# === 3. 生命周期 ===
+def _queued_ids() -> list:
+    with _connect() as conn:
+        return [row["id"] for row in conn.execute("SELECT id FROM jobs WHERE status = 'queued' ORDER BY created_at")]
+
+
+
+async def start():
+    """启动 worker，把租约过期的任务和仍在排队的任务放进本进程的队列 (领取是原子的，多进程重复放入没有影响)"""
+    global _queue
+    await _db(init_db)
+    _queue = asyncio.Queue()
+    recovered = await _db(_recover)
+    for job_id in await _db(_queued_ids):
+        _queue.put_nowait(job_id)
+    if recovered:
+        print(f"🔁 [Jobs] 恢复 {len(recovered)} 个中断的任务")
+    for _ in range(JOB_WORKERS):
+        _workers.append(asyncio.create_task(_worker()))
+    _workers.append(asyncio.create_task(_reaper()))
+
+
+async def stop():
+    for task in _workers:
+        task.cancel()
+    await asyncio.gather(*_workers, return_exceptions=True)
+    _workers.clear()
@@ -0,0 +1,325 @@
+import asyncio
+import json
+import os
+import random
+import re
+import time
+from collections import deque
+import telemetry
+
+# === 带超时 / 重试 / 对冲 / 熔断的 LLM 调用层 ===
+# - 超时: 每次尝试最多 LLM_TIMEOUT 秒，整个调用 (含重试) 不超过 LLM_DEADLINE 秒
+# - 重试: 只重试超时 / 连接错误 / 429 / 5xx / JSON 无法解析，最多 LLM_MAX_RETRIES 次，指数退避 + 随机抖动
+# - 对冲: 设置了 LLM_HEDGE_PERCENTILE 时，请求耗时超过最近成功请求的该分位数仍未返回，
+#         就再发一个相同请求，谁先成功用谁 (默认关闭，会增加 token 消耗)
+# - JSON 修复: 去掉 Markdown 代码块、截取最外层对象、删除多余逗号、补齐被截断的括号
+# - 熔断: 连续失败 LLM_BREAKER_THRESHOLD 次后熔断 LLM_BREAKER_COOLDOWN 秒，期间直接抛 LLMUnavailable
+#         (调用方立即走 Mock 兜底，不用每个请求都等一遍超时)；冷却后放一个请求试探 (半开)
+# 熔断器和延迟统计是进程内的，每个 worker 各自一份。
+
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", 60))
+LLM_DEADLINE = float(os.getenv("LLM_DEADLINE", 150))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", 2))
+LLM_BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", 0.5))
+LLM_BACKOFF_MAX = float(os.getenv("LLM_BACKOFF_MAX", 8))
+LLM_HEDGE_PERCENTILE = float(os.getenv("LLM_HEDGE_PERCENTILE", 0))  # 例如 0.95；0 = 不对冲
+LLM_HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", 20))
+LLM_STREAM_IDLE_TIMEOUT = float(os.getenv("LLM_STREAM_IDLE_TIMEOUT", 30))
+LLM_BREAKER_THRESHOLD = int(os.getenv("LLM_BREAKER_THRESHOLD", 5))
+LLM_BREAKER_COOLDOWN = float(os.getenv("LLM_BREAKER_COOLDOWN", 30))
+
+RETRYABLE_STATUS = {408, 409, 429}
+
+
+class LLMUnavailable(Exception):
+    """熔断中，或重试用尽仍然失败"""
+
+
+class LLMJSONError(ValueError):
+    """返回内容修复后仍不是合法 JSON"""
+
+
+# === 1. 熔断器 ===
+class CircuitBreaker:
+    def __init__(self, threshold: int, cooldown: float):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.cooldown:
+            return "half_open"
+        return "open"
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half_open" and not self.probing:
+            # 冷却结束，只放一个请求去试探
+            self.probing = True
+            return True
+        return False
+
+    def record_success(self):
+        if self.opened_at is not None:
+            print("🟢 [LLM] 熔断恢复")
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+
+    def release_probe(self):
+        """试探请求没有得出结论 (被取消 / 请求本身有误) 时让出名额，下一个请求继续试探"""
+        self.probing = False
+
+    def record_failure(self):
+        self.failures += 1
+        if self.probing or (self.opened_at is None and self.failures >= self.threshold):
+            print(f"🔴 [LLM] 连续失败 {self.failures} 次，熔断 {self.cooldown:.0f}s")
+            telemetry.inc("ppt_llm_breaker_open_total")
+            self.opened_at = time.monotonic()
+        self.probing = False
+
+
+breaker = CircuitBreaker(LLM_BREAKER_THRESHOLD, LLM_BREAKER_COOLDOWN)
+_latencies = deque(maxlen=200)  # 最近成功请求的耗时 (秒)，用于计算对冲时机
+
+
+# === 2. JSON 修复 ===
+_FENCE_RE = re.compile(r"^\s*```(?:json)?\s*|\s*```\s*$", re.I)
+_TRAILING_COMMA_RE = re.compile(r",\s*([}\]])")
+
+
+def _close_truncated(text: str) -> str:
+    """补齐被截断的字符串和括号 (输出达到 max_tokens 时常见)"""
+    stack = []
+    in_string = escaped = False
+    for ch in text:
+        if in_string:
+            if escaped:
+                escaped = False
+            elif ch == "\\":
+                escaped = True
+            elif ch == '"':
+                in_string = False
+        elif ch == '"':
+            in_string = True
+        elif ch in "{[":
+            stack.append("}" if ch == "{" else "]")
+        elif ch in "}]" and stack:
+            stack.pop()
+    if in_string:
+        text += '"'
+    # 截断在 "key": 或逗号后面时，去掉这半个元素
+    text = re.sub(r'(,\s*"[^"]*"\s*:?\s*|,\s*)$', "", text)
+    return text + "".join(reversed(stack))
+
+
+def parse_json(text: str) -> dict:
+    """解析 LLM 返回的 JSON，失败时逐步修复；仍然失败抛 LLMJSONError"""
+    try:
+        return json.loads(text)
+    except (TypeError, ValueError):
+        pass
+    candidate = _FENCE_RE.sub("", text or "")
+    start = candidate.find("{")
+    if start == -1:
+        raise LLMJSONError("no JSON object in response")
+    end = candidate.rfind("}")
+    attempts = []
+    if end > start:
+        attempts.append(candidate[start:end + 1])
+    attempts.append(candidate[start:])
+    for attempt in attempts:
+        for fixed in (attempt, _TRAILING_COMMA_RE.sub(r"\1", attempt),
+                      _TRAILING_COMMA_RE.sub(r"\1", _close_truncated(attempt))):
+            try:
+                data = json.loads(fixed)
+            except ValueError:
+                continue
+            telemetry.inc("ppt_llm_json_repaired_total")
+            print("   🩹 [LLM] 返回的 JSON 已自动修复")
+            return data
+    raise LLMJSONError("response is not valid JSON after repair")
+
+
+# === 3. 重试 & 对冲 ===
+def _is_retryable(e: BaseException) -> bool:
+    if isinstance(e, (asyncio.TimeoutError, LLMJSONError)):
+        return True
+    status = getattr(e, "status_code", None)
+    if status is None:
+        # 连接错误 / 超时之类 (openai.APIConnectionError、APITimeoutError 都没有 status_code)
+        return type(e).__name__ in ("APIConnectionError", "APITimeoutError", "ConnectError", "ReadTimeout")
+    return status in RETRYABLE_STATUS or status >= 500
+
+
+def _hedge_delay():
+    if LLM_HEDGE_PERCENTILE <= 0 or len(_latencies) < LLM_HEDGE_MIN_SAMPLES:
+        return None
+    ordered = sorted(_latencies)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * LLM_HEDGE_PERCENTILE))]
+
+
+async def _hedged(call, timeout: float):
+    """执行 call()；超过对冲时机还没返回就再发一个，先成功的胜出"""
+    primary = asyncio.create_task(call())
+    delay = _hedge_delay()
+    if delay is None or delay >= timeout:
+        try:
+            return await asyncio.wait_for(primary, timeout)
+        finally:
+            primary.cancel()
+
+    tasks = [primary]
+    started = time.monotonic()
+    try:
+        done, _ = await asyncio.wait(tasks, timeout=delay)
+        if not done:
+            telemetry.inc("ppt_llm_hedges_total")
+            print(f"   🔀 [LLM] 超过 {delay:.1f}s 未返回，发出对冲请求")
+            tasks.append(asyncio.create_task(call()))
+        last_error = None
+        while tasks:
+            remaining = timeout - (time.monotonic() - started)
+            if remaining <= 0:
+                raise asyncio.TimeoutError()
+            done, _ = await asyncio.wait(tasks, timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                raise asyncio.TimeoutError()
+            for task in done:
+                tasks.remove(task)
+                if task.exception() is None:
+                    if task is not primary:
+                        telemetry.inc("ppt_llm_hedge_wins_total")
+                    return task.result()
+                last_error = task.exception()
+        raise last_error
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+async def _call_with_retries(call, deadline: float = None, hedge: bool = True):
+    """
+    带熔断 / 超时 / 重试执行 call()。
+    :raises LLMUnavailable: 熔断中或所有尝试都失败 (__cause__ 为最后一次的异常)
+    """
+    probe = breaker.state == "half_open"
+    if not breaker.allow():
+        telemetry.inc("ppt_llm_short_circuit_total")
+        raise LLMUnavailable("LLM circuit breaker is open")
+    try:
+        return await _attempt_all(call, deadline, hedge)
+    except asyncio.CancelledError:
+        # 试探请求被取消 (客户端断开、两阶段生成的其他页面失败等) 时不能一直占着半开名额
+        if probe:
+            breaker.release_probe()
+        raise
+
+
+async def _attempt_all(call, deadline: float, hedge: bool):
+    deadline_at = time.monotonic() + (deadline or LLM_DEADLINE)
+    last_error = None
+    for attempt in range(LLM_MAX_RETRIES + 1):
+        remaining = deadline_at - time.monotonic()
+        if remaining <= 0:
+            break
+        timeout = min(LLM_TIMEOUT, remaining)
+        started = time.monotonic()
+        try:
+            result = await (_hedged(call, timeout) if hedge else asyncio.wait_for(call(), timeout))
+        except Exception as e:
+            last_error = e
+            retry = _is_retryable(e) and attempt < LLM_MAX_RETRIES
+            print(f"   ⚠️ [LLM] 第 {attempt + 1} 次调用失败 ({type(e).__name__}: {e})" + ("，准备重试" if retry else ""))
+            if not retry:
+                break
+            telemetry.inc("ppt_llm_retries_total", reason=type(e).__name__)
+            # 指数退避 + 全抖动，且不超过剩余的截止时间
+            backoff = random.uniform(0, min(LLM_BACKOFF_MAX, LLM_BACKOFF_BASE * 2 ** attempt))
+            await asyncio.sleep(max(0.0, min(backoff, deadline_at - time.monotonic())))
+            continue
+        _latencies.append(time.monotonic() - started)
+        breaker.record_success()
+        return result
+
+    if last_error is None or _is_retryable(last_error):
+        breaker.record_failure()
+    else:
+        # 400 / 401 / 422 之类是这个请求本身的问题，不代表上游不可用，不计入熔断
+        breaker.release_probe()
+    if last_error is None:
+        last_error = asyncio.TimeoutError(f"LLM deadline of {deadline or LLM_DEADLINE}s exceeded")
+    raise LLMUnavailable(f"LLM call failed: {type(last_error).__name__}: {last_error}") from last_error
+
+
+# === 4. 对外接口 ===
+def add_usage(usage: dict, reported):
+    """把响应里的 usage (prompt / completion token 数) 累加到 usage 字典"""
+    if usage is None or reported is None:
+        return
+    for key in ("prompt_tokens", "completion_tokens"):
+        usage[key] = usage.get(key, 0) + (getattr(reported, key, None) or 0)
+    details = getattr(reported, "prompt_tokens_details", None)
+    cached = getattr(details, "cached_tokens", None) if details is not None else None
+    usage["cached_prompt_tokens"] = usage.get("cached_prompt_tokens", 0) + (cached or 0)
+    usage["calls"] = usage.get("calls", 0) + 1
+
+
+async def chat_json(client, deadline: float = None, usage: dict = None, **kwargs) -> dict:
+    """
+    调用 chat.completions.create 并把返回内容解析成 JSON (自动修复，修不好就重试)。
+    传入 usage 字典时累加每次成功响应的 token 用量 (包括 JSON 解析失败后被重试掉的那次)。
+    """
+    async def call():
+        response = await client.chat.completions.create(timeout=LLM_TIMEOUT, **kwargs)
+        add_usage(usage, getattr(response, "usage", None))
+        return parse_json(response.choices[0].message.content)
+    return await _call_with_retries(call, deadline)
+
+
+async def open_stream(client, deadline: float = None, usage: dict = None, **kwargs):
+    """
+    打开流式响应 (建立连接这一步有超时 / 重试 / 熔断)，返回逐个 chunk 的异步迭代器。
+    读取过程中两个 chunk 之间超过 LLM_STREAM_IDLE_TIMEOUT 秒抛 asyncio.TimeoutError。
+    流已经开始输出后不再重试 (页面已经推给了前端)。
+    传入 usage 字典时请求服务端在最后一个 chunk 里附带 token 用量并累加进去。
+    """
+    if usage is not None:
+        kwargs.setdefault("stream_options", {"include_usage": True})
+
+    async def call():
+        return await client.chat.completions.create(timeout=LLM_TIMEOUT, stream=True, **kwargs)
+    # 流式请求不对冲: 两路流不好合并，而且首包延迟通常很短
+    stream = await _call_with_retries(call, deadline, hedge=False)
+
+    async def iterate():
+        iterator = stream.__aiter__()
+        try:
+            while True:
+                try:
+                    chunk = await asyncio.wait_for(iterator.__anext__(), LLM_STREAM_IDLE_TIMEOUT)
+                except StopAsyncIteration:
+                    return
+                add_usage(usage, getattr(chunk, "usage", None))
+                yield chunk
+        except Exception:
+            # 流读到一半断掉 / 卡住也算一次失败
+            breaker.record_failure()
+            raise
+    return iterate()
+
+
+def get_stats() -> dict:
+    return {
+        "breaker": breaker.state,
+        "consecutive_failures": breaker.failures,
+        "hedge_delay": _hedge_delay(),
+        "samples": len(_latencies),
+    }
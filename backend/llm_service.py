@@ -1,18 +1,45 @@
+import asyncio
+import copy
 import json
+import logging
 import os
-from openai import AsyncOpenAI
+import time
+from functools import lru_cache
 from dotenv import load_dotenv
-from models import PresentationData
 
-# 加载 .env 环境变量
+# 加载 .env 环境变量 (要在下面这些读取配置的模块之前)
 load_dotenv(override=True)
-client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+
+from models import PresentationData, Slide
+import llm_client
+import outline_cache
+import singleflight
+import telemetry
+from outline_cache import OutlineCacheMiss
+
+LLM_MODEL = os.getenv("OPENAI_MODEL", "gpt-3.5-turbo") # 如果有 gpt-4 效果更好
+_client = None
+
+
+def get_client():
+    """首次调用时才导入 openai 并创建客户端 (openai 包本身导入就要几百毫秒，冷启动时不必付出)"""
+    global _client
+    if _client is None:
+        from openai import AsyncOpenAI
+        # 超时 / 重试由 llm_client 统一控制，关掉 SDK 自带的重试，避免两层重试叠加
+        _client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"), max_retries=0)
+    return _client
 
 # === B. 真实 AI 模式 (你的逻辑融合) ===
     # 核心 Prompt: 融合了 backend2 的 JSON 指令和 backend 的数据结构
-def build_system_prompt(slide_count: int):
+# Prompt 布局: [静态前缀 (规则 + 示例，按 变体 缓存)] + [请求参数 (页数)]，主题放在 user 消息里。
+# 前缀在所有请求之间逐字相同，OpenAI 等服务端的前缀缓存 (prompt caching) 才能命中，输入 token 更便宜、首 token 更快。
+# 变体: full = 完整规则 + 完整示例 deck；compact = 精简规则 + 一行 schema，输入 token 约少 2/3
+LLM_PROMPT_VARIANT = os.getenv("LLM_PROMPT_VARIANT", "full")
+PROMPT_VARIANTS = ("full", "compact")
 
-    return f"""
+# 内容规则 (角色 / 文案密度 / 各布局要求 / JSON 示例) 与页数无关，整份大纲和逐页生成共用
+CONTENT_RULES = """
     # Role
     You are the "Lead Content & Design Strategist" at a premier global consulting firm. 
     Your goal is to transform brief user ideas into high-impact, professional-grade PPTX structures in English.
@@ -88,99 +115,120 @@ def build_system_prompt(slide_count: int):
     7. **chart (Data Visualization):**
    - The list lengths of `"labels"` (X-axis) and `"values"` (Y-axis) must be **perfectly aligned**.
    - Numerical values must follow a logical trend appropriate for the topic.
+   - `"chart_type"` must be one of: COLUMN_CLUSTERED, BAR_CLUSTERED, COLUMN_STACKED, LINE, AREA, PIE, DOUGHNUT. Use LINE for trends over time and PIE only for shares of a whole.
+   - To compare several metrics, replace `"values"` with `"series": [{"name": "Metric A", "values": [...]}, ...]`; every series must have as many values as `"labels"`.
 
     # JSON Schema (Output Format)
     You must output a valid JSON object matching EXACTLY this structure. Do NOT invent new keys.
 
     ```json
-    {{
+    {
     "topic": "Your Topic",
     "slides": [
-        {{
+        {
             "id": 1, 
             "layout": "title_cover", 
             "title": "Main Title", 
             "subtitle": "Subtitle" 
-        }},
-        {{ 
+        },
+        { 
             "id": 2, 
             "layout": "content_list", 
             "title": "Agenda / Context", 
-            "content": {{ 
+            "content": { 
                 "bullet_points": [
                 "The global specialty coffee market is projected to expand at a CAGR of 11.3% from 2024 to 2030, driven significantly by the rising consumer preference for ethically sourced, single-origin beans in the Asia-Pacific region.",
                 "Supply chain disruptions, exacerbated by climate change impact on Arabica yields in Brazil and Vietnam, have necessitated a 15% price increase in wholesale green coffee futures over the last fiscal quarter."
                 ]
-            }} 
-        }},
-        {{ 
+            } 
+        },
+        { 
             "id": 3, 
             "layout": "two_column", 
             "title": "Deep Analysis", 
-            "content": {{ 
+            "content": { 
                 "content_left": ["Left item 1...", "Left item 2..."], 
                 "content_right": ["Right item 1...", "Right item 2..."] 
-            }} 
-        }},
-        {{ 
+            } 
+        },
+        { 
             "id": 4, 
             "layout": "image_page", 
             "title": "Concept Art", 
-            "visual": {{ 
+            "visual": { 
                 "need_image": true, 
                 "image_prompt": "Specific English prompt...", 
                 "caption": "Caption description..." 
-            }} 
-        }},
-        {{ 
+            } 
+        },
+        { 
             "id": 5, 
             "layout": "table", 
             "title": "Data Comparison", 
-            "table_data": {{ 
+            "table_data": { 
                 "headers": ["Metric", "Value"], 
                 "rows": [["Efficiency", "High"], ["Cost", "Low"]] 
-            }} 
-        }},
-        {{ 
+            } 
+        },
+        { 
             "id": 6, 
             "layout": "chart", 
             "title": "Growth Trend", 
-            "chart_data": {{ 
+            "chart_data": { 
                 "title": "Yearly Revenue", 
                 "chart_type": "COLUMN_CLUSTERED", 
                 "labels": ["2023", "2024"], 
                 "values": [10, 20] 
-            }} 
-        }},
-        {{ 
+            } 
+        },
+        { 
             "id": 7, 
             "layout": "content_list", 
             "title": "Executive Summary", 
-            "content": {{ 
+            "content": { 
                 "text_body": "A very detailed paragraph containing approximately 100-200 words explaining the core concept..." 
-            }} 
-        }},
-        {{ 
+            } 
+        },
+        { 
             "id": 8, 
             "layout": "content_list", 
             "title": "Executive Summary", 
-            "content": {{ 
+            "content": { 
                 "text_body": "A very detailed paragraph containing approximately 100-200 words explaining the core concept..." 
-            }},
-            "visual": {{ 
+            },
+            "visual": { 
                 "need_image": true, 
                 "image_prompt": "Specific English prompt...", 
                 "caption": "Caption description..." 
-            }}  
-        }}
+            }  
+        }
     ]
-    }}
+    }
+"""
 
+
+COMPACT_CONTENT_RULES = """
+    # Role
+    You are a senior consulting strategist. Turn the user's topic into a professional, data-rich PPTX outline in English.
+
+    # Content Rules
+    - content_list: either "bullet_points" (4-5 bullets of 25-40 words, "Claim + Evidence + Impact") or "text_body" (100-200 analytical words); may add a "visual".
+    - two_column: balanced "content_left" / "content_right" lists for comparisons (e.g. Current vs. Future State).
+    - title_cover: a title of at most 40 characters and a subtitle stating the scope.
+    - image_page: "visual" with "need_image": true, a specific English "image_prompt" (subject, style, lighting, render quality) and a "caption".
+    - table: "headers" and every row in "rows" have the same number of columns.
+    - chart: "labels" and "values" have the same length; "chart_type" is one of COLUMN_CLUSTERED, BAR_CLUSTERED, COLUMN_STACKED, LINE, AREA, PIE, DOUGHNUT (LINE for trends, PIE for shares); several metrics go in "series": [{"name": str, "values": [number]}].
+    - Back every claim with realistic figures. No Markdown, no conversational filler.
+
+    # JSON Schema (Output Format, "?" = optional, do NOT invent other keys)
+    {"topic": str, "slides": [{"id": int, "layout": str, "title": str, "subtitle"?: str, "content"?: {"bullet_points"?: [str], "text_body"?: str, "content_left"?: [str], "content_right"?: [str]}, "visual"?: {"need_image": bool, "image_prompt": str, "caption": str}, "table_data"?: {"headers": [str], "rows": [[str]]}, "chart_data"?: {"title": str, "chart_type": str, "labels": [str], "values": [number]}}]}
+"""
+
+STRUCTURE_RULES = """
     # Structure Constraints
 
-    1. **Total Slide Count:** Target {slide_count} slides. 
-    - A variation of ±1 slide is allowed if necessary for better content flow. 
-    - The output JSON slides array must contain between {slide_count} - 1 and {slide_count} + 1 objects.
+    1. **Total Slide Count:** Use the target given under "Request Parameters" at the end of this prompt.
+    - A variation of ±1 slide is allowed if necessary for better content flow.
 
     2. **Mandatory Layout Inclusion:** To ensure visual variety, the presentation MUST include:
     - **At least ONE** data visualization chart slide (use either layout `'chart'` ).
@@ -202,48 +250,515 @@ def build_system_prompt(slide_count: int):
     Output ONLY a valid JSON object. No conversational filler.
 """
 
-async def generate_ppt_content(topic: str, use_ai: bool = True, slide_length: int = 10) -> PresentationData:
+
+def _content_rules(variant: str) -> str:
+    return COMPACT_CONTENT_RULES if variant == "compact" else CONTENT_RULES
+
+
+def _request_params(slide_count: int) -> str:
+    # 唯一随请求变化的部分，放在最后，不破坏前面的公共前缀
+    return f"""
+    # Request Parameters
+    Target {slide_count} slides: the slides array must contain between {slide_count - 1} and {slide_count + 1} objects.
+"""
+
+
+@lru_cache(maxsize=None)
+def _static_prefix(kind: str, variant: str) -> str:
+    """outline / skeleton / slides 三种请求的静态前缀，每个 (类型, 变体) 只拼接一次"""
+    if kind == "skeleton":
+        return SKELETON_RULES + STRUCTURE_RULES
+    if kind == "slides":
+        return _content_rules(variant) + SLIDE_RULES
+    return _content_rules(variant) + STRUCTURE_RULES
+
+
+def build_system_prompt(slide_count: int, variant: str = "full"):
+    return _static_prefix("outline", variant) + _request_params(slide_count)
+
+
+# === B2. 两阶段模式: 先要骨架 (每页 id / layout / 标题)，再并发生成每页内容 ===
+# 页数多时一次生成整份大纲很慢且容易被截断；拆开后总耗时取决于最慢的那一组页面，而不是总输出 token 数。
+LLM_TWO_PHASE_MIN_SLIDES = int(os.getenv("LLM_TWO_PHASE_MIN_SLIDES", 16))  # 页数 >= 该值时自动启用，0 = 关闭
+LLM_SLIDE_CONCURRENCY = int(os.getenv("LLM_SLIDE_CONCURRENCY", 6))          # 同时进行的逐页内容请求数
+LLM_SLIDES_PER_CALL = int(os.getenv("LLM_SLIDES_PER_CALL", 2))              # 每个内容请求生成几页
+
+SKELETON_RULES = """
+    # Role
+    You are the "Lead Content & Design Strategist" at a premier global consulting firm.
+    Your goal is to plan the storyline of a professional-grade PPTX presentation in English.
+
+    # Task
+    Output ONLY the skeleton of the deck: for every slide give its "id", "layout" and a specific, insight-driven "title".
+    Available layouts: title_cover, content_list, two_column, image_page, table, chart.
+    The title_cover slide also gets its "subtitle". Do NOT write bullet points, text bodies, tables, chart data or image prompts;
+    they are written in a second step from your titles, so each title must make the slide's message unambiguous.
+
+    # JSON Schema (Output Format)
+    {"topic": "Your Topic", "slides": [{"id": 1, "layout": "title_cover", "title": "Main Title", "subtitle": "Subtitle"}, {"id": 2, "layout": "content_list", "title": "Specific Slide Title"}]}
+"""
+
+SLIDE_RULES = """
+    # Task
+    The outline of the deck is already fixed. You are writing the full content of a few of its slides.
+    Return a JSON object {"slides": [...]} containing exactly the requested slides in the requested order, each following the JSON Schema above.
+    Keep every slide's "id", "layout" and "title" unchanged, and do not repeat content that belongs to other slides of the outline.
+    Output ONLY a valid JSON object. No conversational filler.
+"""
+
+
+def build_skeleton_prompt(slide_count: int):
+    return _static_prefix("skeleton", "full") + _request_params(slide_count)
+
+
+def build_slide_prompt(variant: str = "full"):
+    return _static_prefix("slides", variant)
+
+
+def _prompt_variant(prompt: str = None) -> str:
+    variant = prompt or LLM_PROMPT_VARIANT
+    return variant if variant in PROMPT_VARIANTS else "full"
+
+
+def _record_usage(usage: dict, topic: str, mode: str, variant: str):
+    """每份大纲的 token 用量: 累加到 /metrics 并写一条日志"""
+    if not usage.get("calls"):
+        return
+    for kind in ("prompt", "completion", "cached_prompt"):
+        telemetry.inc("ppt_llm_tokens_total", usage.get(f"{kind}_tokens", 0), kind=kind, mode=mode, prompt=variant)
+    telemetry.log("llm_usage", topic=topic, mode=mode, prompt=variant, model=LLM_MODEL, **usage)
+    print(f"   🧾 [LLM] tokens: prompt={usage.get('prompt_tokens', 0)} (cached {usage.get('cached_prompt_tokens', 0)}), "
+          f"completion={usage.get('completion_tokens', 0)}, calls={usage['calls']}")
+
+
+def _use_two_phase(slide_length: int, two_phase) -> bool:
+    if two_phase is not None:
+        return two_phase
+    return 0 < LLM_TWO_PHASE_MIN_SLIDES <= slide_length
+
+
+async def _generate_skeleton(topic: str, slide_length: int, usage: dict = None) -> dict:
+    with telemetry.stage("llm_call", mode="skeleton", model=LLM_MODEL, log_fields={"topic": topic}):
+        skeleton = await llm_client.chat_json(
+            get_client(),
+            usage=usage,
+            model=LLM_MODEL,
+            messages=[
+                {"role": "system", "content": build_skeleton_prompt(slide_count=slide_length)},
+                {"role": "user", "content": f"请为主题 '{topic}' 生成一份专业的 PPT 大纲。"}
+            ],
+            temperature=0.7,
+            response_format={"type": "json_object"}
+        )
+    slides = [s for s in skeleton.get("slides") or [] if isinstance(s, dict) and s.get("layout")]
+    if not slides:
+        raise ValueError("skeleton contains no slides")
+    # 重新编号，保证 id 唯一且连续 (第二阶段按 id 对回结果)
+    for i, s in enumerate(slides, 1):
+        s["id"] = i
+    return {"topic": skeleton.get("topic") or topic, "slides": slides}
+
+
+async def _generate_slide_chunk(topic: str, outline: str, chunk: list, semaphore: asyncio.Semaphore,
+                                variant: str = "full", usage: dict = None):
+    """生成一组页面的完整内容，返回 (Slide 列表, 失败页数)；失败的页面保留骨架 (只有标题)"""
+    # 封面的标题 / 副标题在骨架里就已经齐了
+    pending = [s for s in chunk if s["layout"] != "title_cover"]
+    results = {}
+    if pending:
+        try:
+            async with semaphore:
+                with telemetry.stage("llm_call", mode="slides", model=LLM_MODEL):
+                    response = await llm_client.chat_json(
+                        get_client(),
+                        usage=usage,
+                        model=LLM_MODEL,
+                        messages=[
+                            {"role": "system", "content": build_slide_prompt(variant)},
+                            {"role": "user", "content": (
+                                f"Topic: '{topic}'\nDeck outline:\n{outline}\n\n"
+                                f"Write the full content of these slides: {json.dumps(pending, ensure_ascii=False)}"
+                            )}
+                        ],
+                        temperature=0.7,
+                        response_format={"type": "json_object"}
+                    )
+            returned = [s for s in response.get("slides") or [] if isinstance(s, dict)]
+            by_id = {s.get("id"): s for s in returned}
+            for i, skel in enumerate(pending):
+                # 优先按 id 对应，id 被改掉时按顺序对应
+                results[skel["id"]] = by_id.get(skel["id"]) or (returned[i] if i < len(returned) else None)
+        except Exception as e:
+            print(f"   ⚠️ [LLM] 第 {pending[0]['id']}-{pending[-1]['id']} 页内容生成失败: {e}")
+
+    slides, failed = [], 0
+    for skel in chunk:
+        obj = results.get(skel["id"])
+        if obj is not None:
+            try:
+                slides.append(Slide(**{**obj, "id": skel["id"], "layout": skel["layout"],
+                                       "title": obj.get("title") or skel.get("title")}))
+                continue
+            except Exception as e:
+                print(f"   ⚠️ [LLM] 第 {skel['id']} 页校验失败，保留骨架: {e}")
+                telemetry.inc("ppt_two_phase_invalid_slides_total")
+        if skel["layout"] != "title_cover":
+            failed += 1
+        slides.append(Slide(**skel))
+    return slides, failed
+
+
+async def _two_phase_slides(topic: str, slide_length: int, variant: str = "full", usage: dict = None):
+    """
+    两阶段生成，按页码顺序逐页产出 ("slide", Slide)，最后产出 ("done", PresentationData, 是否完整)。
+    各组页面并发生成，前面的页面一完成就能产出，不必等整份大纲。
+    所有页面都失败时抛 LLMUnavailable (调用方回退到 Mock)。
+    """
+    skeleton = await _generate_skeleton(topic, slide_length, usage)
+    skel_slides = skeleton["slides"]
+    print(f"🦴 [LLM] 骨架完成: {len(skel_slides)} 页，开始并发生成内容 (并发 {LLM_SLIDE_CONCURRENCY})")
+    outline = "\n".join(f"{s['id']}. [{s['layout']}] {s.get('title') or ''}" for s in skel_slides)
+    semaphore = asyncio.Semaphore(max(1, LLM_SLIDE_CONCURRENCY))
+    size = max(1, LLM_SLIDES_PER_CALL)
+    tasks = [
+        asyncio.create_task(_generate_slide_chunk(skeleton["topic"], outline, skel_slides[i:i + size], semaphore,
+                                                  variant, usage))
+        for i in range(0, len(skel_slides), size)
+    ]
+    expected = sum(1 for s in skel_slides if s["layout"] != "title_cover")
+    slides, failed = [], 0
+    try:
+        for task in tasks:
+            chunk_slides, chunk_failed = await task
+            failed += chunk_failed
+            if expected and failed == expected:
+                raise llm_client.LLMUnavailable("all slide content requests failed")
+            for slide in chunk_slides:
+                slides.append(slide)
+                yield "slide", slide
+    finally:
+        # 调用方提前停止迭代 (比如客户端断开) 或出错时，取消还没完成的请求
+        for task in tasks:
+            task.cancel()
+    yield "done", PresentationData(topic=skeleton["topic"], slides=slides), failed == 0
+
+
+async def _generate_two_phase(topic: str, slide_length: int, variant: str = "full", usage: dict = None):
+    """两阶段生成完整的 PresentationData，返回 (data, 是否完整)"""
+    async for event in _two_phase_slides(topic, slide_length, variant, usage):
+        if event[0] == "done":
+            return event[1], event[2]
+
+
+@lru_cache(maxsize=1)
+def _read_mock_data() -> dict:
+    current_dir = os.path.dirname(os.path.abspath(__file__))
+    with open(os.path.join(current_dir, "mock_data.json"), "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _load_mock_dict(topic: str) -> dict:
+    # mock_data.json 只读一次，每次返回一份副本
+    data_dict = copy.deepcopy(_read_mock_data())
+    data_dict["topic"] = topic
+    return data_dict
+
+
+def _outline_cache_key(topic: str, slide_length: int, two_phase: bool = False, variant: str = "full") -> str:
+    # Prompt 改动后 hash 随之变化，旧缓存自动失效 (不同变体 / 生成方式各自缓存)
+    if two_phase:
+        prompt = build_skeleton_prompt(slide_count=slide_length) + build_slide_prompt(variant)
+    else:
+        prompt = build_system_prompt(slide_count=slide_length, variant=variant)
+    return outline_cache.make_key(topic, slide_length, LLM_MODEL, prompt)
+
+
+def _lookup_outline_cache(topic: str, slide_length: int, cache: str, two_phase: bool = False, variant: str = "full"):
+    """按 cache 模式查缓存: 命中返回 PresentationData，未命中返回 None (only 模式抛 OutlineCacheMiss)"""
+    if cache == "bypass":
+        return None
+    cached = outline_cache.get(_outline_cache_key(topic, slide_length, two_phase, variant))
+    telemetry.inc("ppt_cache_requests_total", cache="outline", result="hit" if cached else "miss")
+    if cached:
+        print(f"💾 [LLM] 大纲缓存命中: '{topic}'")
+        return PresentationData(**cached)
+    if cache == "only":
+        raise OutlineCacheMiss(f"no cached outline for '{topic}' ({slide_length} slides)")
+    return None
+
+
+def _cached_since(key: str, since: float):
+    """读取 since 之后才写入的大纲缓存 (别的请求刚生成的)，没有返回 None"""
+    cached = outline_cache.get(key, ttl=time.time() - since)
+    return PresentationData(**cached) if cached else None
+
+
+async def _generate_outline(topic: str, slide_length: int, two_phase: bool, variant: str, key: str,
+                            usage: dict) -> PresentationData:
+    """真正调用 LLM 生成大纲，成功后写入大纲缓存；失败直接抛异常"""
+    if two_phase:
+        data, complete = await _generate_two_phase(topic, slide_length, variant, usage)
+        # 有页面只剩骨架时不缓存，下次重新生成
+        if complete:
+            outline_cache.put(key, data.model_dump(), usage=dict(usage))
+        return data
+
+    # 超时 / 重试 / 对冲 / JSON 修复都在 llm_client 里；熔断时直接抛 LLMUnavailable
+    with telemetry.stage("llm_call", mode="json", model=LLM_MODEL, log_fields={"topic": topic}):
+        data_dict = await llm_client.chat_json(
+            get_client(),
+            usage=usage,
+            model=LLM_MODEL,
+            messages=[
+                {"role": "system", "content": build_system_prompt(slide_count=slide_length, variant=variant)},
+                {"role": "user", "content": f"请为主题 '{topic}' 生成一份专业的 PPT 大纲。"}
+            ],
+            temperature=0.7,
+            response_format={"type": "json_object"} # 强制 JSON 模式
+        )
+
+    with telemetry.stage("json_validation", mode="json"):
+        # 转换为 Pydantic 对象进行校验
+        data = PresentationData(**data_dict)
+    # 只缓存真实生成成功的结果 (Mock 回退不缓存)
+    outline_cache.put(key, data.model_dump(), usage=dict(usage))
+    return data
+
+
+async def generate_ppt_content(topic: str, use_ai: bool = True, slide_length: int = 10, cache: str = "prefer",
+                               two_phase: bool = None, prompt: str = None, usage: dict = None) -> PresentationData:
     """
     生成 PPT 内容结构数据。
     :param topic: 用户输入的主题
     :param use_ai: True=调用OpenAI, False=使用本地Mock数据
     :param slide_length: 期望的幻灯片数量
+    :param cache: bypass=不读缓存, prefer=优先读缓存, only=只读缓存 (未命中抛 OutlineCacheMiss)
+    :param two_phase: True=先骨架再并发逐页生成, None=页数 >= LLM_TWO_PHASE_MIN_SLIDES 时自动启用
+    :param prompt: Prompt 变体 full / compact (默认 LLM_PROMPT_VARIANT)
+    :param usage: 传入 dict 时填入本次调用花掉的 token 数 (缓存命中 / Mock 时为空)
     """
     print(f"🧠 [LLM] 正在处理主题: '{topic}' (Use AI: {use_ai})...")
 
     # === A. Mock 模式 (队友的逻辑) ===
     if not use_ai:
         try:
-            current_dir = os.path.dirname(os.path.abspath(__file__))
-            json_path = os.path.join(current_dir, "mock_data.json")
-            with open(json_path, "r", encoding="utf-8") as f:
-                data_dict = json.load(f)
             # 强行覆盖 topic 以显得真实
-            data_dict["topic"] = topic
-            return PresentationData(**data_dict)
+            return PresentationData(**_load_mock_dict(topic))
         except Exception as e:
             print(f"❌ Mock数据读取失败: {e}")
             return PresentationData(topic="Error", slides=[])
-    
+
+    two_phase = _use_two_phase(slide_length, two_phase)
+    variant = _prompt_variant(prompt)
+    cached = _lookup_outline_cache(topic, slide_length, cache, two_phase, variant)
+    if cached:
+        return cached
+
+    usage = {} if usage is None else usage
+    key = _outline_cache_key(topic, slide_length, two_phase, variant)
+    started = time.time()
     try:
-        response = await client.chat.completions.create(
-            model="gpt-3.5-turbo", # 如果有 gpt-4 效果更好
-            messages=[
-                {"role": "system", "content": build_system_prompt(slide_count=slide_length)},
-                {"role": "user", "content": f"请为主题 '{topic}' 生成一份专业的 PPT 大纲。"}
-            ],
-            temperature=0.7,
-            response_format={"type": "json_object"} # 强制 JSON 模式
+        # 同一份大纲的并发请求只调用一次 LLM: 进程内共享结果，跨 worker 通过文件锁 + 大纲缓存
+        # (跟随者拿到的是 leader 的结果，自己的 usage 为空)
+        return await singleflight.run(
+            f"outline:{key}",
+            lambda: _generate_outline(topic, slide_length, two_phase, variant, key, usage),
+            lookup=lambda: _cached_since(key, started),
         )
-        
-        content_str = response.choices[0].message.content
-        data_dict = json.loads(content_str)
-        
-        # 转换为 Pydantic 对象进行校验
-        return PresentationData(**data_dict)
 
     except Exception as e:
         print(f"❌ OpenAI 调用或解析失败: {e}")
         # 如果失败，回退到 Mock 模式防止程序崩溃
         print("🔄 自动回退到 Mock 模式...")
-        return await generate_ppt_content(topic, use_ai=False)
\ No newline at end of file
+        return await generate_ppt_content(topic, use_ai=False)
+    finally:
+        # 失败的调用同样计入 token 用量
+        _record_usage(usage, topic, "two_phase" if two_phase else "json", variant)
+
+
+# === C. 流式模式: 边生成边推送每一页 ===
+class SlideStreamParser:
+    """
+    增量解析 LLM 的流式 JSON 输出。
+    每次 feed 一段文本，返回 "slides" 数组里刚刚完整闭合的页面对象 (dict)。
+    """
+    def __init__(self):
+        self.buffer = ""
+        self.pos = 0
+        self.in_slides = False
+        self.finished = False
+        self.depth = 0
+        self.in_string = False
+        self.escape = False
+        self.obj_start = None
+
+    def feed(self, chunk: str) -> list:
+        self.buffer += chunk
+        results = []
+        if self.finished:
+            return results
+
+        # 1. 先找到 "slides": [ 的位置
+        if not self.in_slides:
+            idx = self.buffer.find('"slides"')
+            if idx < 0:
+                return results
+            bracket = self.buffer.find("[", idx)
+            if bracket < 0:
+                return results
+            self.in_slides = True
+            self.pos = bracket + 1
+
+        # 2. 逐字符扫描，跟踪字符串和括号深度
+        buf = self.buffer
+        i = self.pos
+        while i < len(buf):
+            ch = buf[i]
+            if self.in_string:
+                if self.escape:
+                    self.escape = False
+                elif ch == "\\":
+                    self.escape = True
+                elif ch == '"':
+                    self.in_string = False
+            elif ch == '"':
+                self.in_string = True
+            elif ch in "{[":
+                if self.depth == 0 and ch == "{":
+                    self.obj_start = i
+                self.depth += 1
+            elif ch in "}]":
+                if self.depth == 0 and ch == "]":
+                    self.finished = True
+                    i += 1
+                    break
+                self.depth -= 1
+                if self.depth == 0 and self.obj_start is not None:
+                    try:
+                        results.append(json.loads(buf[self.obj_start:i + 1]))
+                    except json.JSONDecodeError as e:
+                        print(f"   ⚠️ [Stream] 页面 JSON 解析失败: {e}")
+                    self.obj_start = None
+            i += 1
+        self.pos = i
+        return results
+
+
+async def _single_stream_slides(topic: str, slide_length: int, variant: str = "full", usage: dict = None):
+    """一次流式请求生成整份大纲，逐页产出 ("slide", Slide)，最后产出 ("done", PresentationData 或 None, 是否完整)"""
+    parser = SlideStreamParser()
+    slides = []
+    stream = await llm_client.open_stream(
+        get_client(),
+        usage=usage,
+        model=LLM_MODEL,
+        messages=[
+            {"role": "system", "content": build_system_prompt(slide_count=slide_length, variant=variant)},
+            {"role": "user", "content": f"请为主题 '{topic}' 生成一份专业的 PPT 大纲。"}
+        ],
+        temperature=0.7,
+        response_format={"type": "json_object"},
+    )
+    async for chunk in stream:
+        if not chunk.choices:
+            continue
+        delta = chunk.choices[0].delta.content
+        if not delta:
+            continue
+        for obj in parser.feed(delta):
+            try:
+                slide = Slide(**obj)
+            except Exception as e:
+                print(f"   ⚠️ [Stream] 页面校验失败，已跳过: {e}")
+                telemetry.inc("ppt_stream_invalid_slides_total")
+                continue
+            slides.append(slide)
+            yield "slide", slide
+
+    # 整体再校验一次，拿到 LLM 给出的 topic
+    try:
+        with telemetry.stage("json_validation", mode="stream"):
+            data = PresentationData(**llm_client.parse_json(parser.buffer))
+    except Exception:
+        yield "done", None, False
+        return
+    yield "done", data, True
+
+
+async def stream_ppt_content(topic: str, use_ai: bool = True, slide_length: int = 10, cache: str = "prefer",
+                             two_phase: bool = None, prompt: str = None, usage: dict = None):
+    """
+    流式生成 PPT 大纲 (cache / two_phase / prompt / usage 参数同 generate_ppt_content)。
+    逐个产出 ("slide", Slide)，最后产出 ("done", PresentationData)。
+    出错时: 还没推送任何页面就回退到 Mock 数据，否则产出 ("error", 错误信息)。
+    """
+    print(f"🧠 [LLM] 流式生成主题: '{topic}' (Use AI: {use_ai})...")
+    slides = []
+
+    if use_ai:
+        # 缓存命中时直接逐页回放
+        try:
+            two_phase = _use_two_phase(slide_length, two_phase)
+            variant = _prompt_variant(prompt)
+            cached = _lookup_outline_cache(topic, slide_length, cache, two_phase, variant)
+        except OutlineCacheMiss as e:
+            yield "error", str(e)
+            return
+        if cached:
+            for slide in cached.slides:
+                yield "slide", slide
+            yield "done", cached
+            return
+
+        # 流式调用的耗时分两段记录: 首页到达时间 (llm_first_slide) 和整体耗时 (llm_call)
+        started = time.perf_counter()
+        stage_labels = {"mode": "two_phase" if two_phase else "stream", "model": LLM_MODEL}
+        usage = {} if usage is None else usage
+        try:
+            if two_phase:
+                source = _two_phase_slides(topic, slide_length, variant, usage)
+            else:
+                source = _single_stream_slides(topic, slide_length, variant, usage)
+            data, complete = None, False
+            async for event in source:
+                if event[0] == "done":
+                    _, data, complete = event
+                    continue
+                if not slides:
+                    telemetry.observe(telemetry.STAGE_METRIC, time.perf_counter() - started,
+                                      stage="llm_first_slide", outcome="ok", **stage_labels)
+                slides.append(event[1])
+                yield "slide", event[1]
+
+            duration = time.perf_counter() - started
+            telemetry.observe(telemetry.STAGE_METRIC, duration, stage="llm_call", outcome="ok", **stage_labels)
+            telemetry.log("stage", stage="llm_call", outcome="ok", duration_ms=round(duration * 1000, 2),
+                          slides=len(slides), topic=topic, **stage_labels)
+
+            _record_usage(usage, topic, stage_labels["mode"], variant)
+            if complete:
+                outline_cache.put(_outline_cache_key(topic, slide_length, two_phase, variant), data.model_dump(),
+                                  usage=dict(usage))
+            yield "done", data or PresentationData(topic=topic, slides=slides)
+            return
+
+        except Exception as e:
+            print(f"❌ OpenAI 流式调用失败: {e}")
+            telemetry.observe(telemetry.STAGE_METRIC, time.perf_counter() - started,
+                              stage="llm_call", outcome="error", **stage_labels)
+            telemetry.log("stage", logging.WARNING, stage="llm_call", outcome="error", error=str(e), **stage_labels)
+            _record_usage(usage, topic, stage_labels["mode"], variant)
+            if slides:
+                yield "error", str(e)
+                return
+            print("🔄 自动回退到 Mock 模式...")
+
+    # Mock 模式 (或 AI 失败回退): 一次性逐页推送
+    try:
+        data = PresentationData(**_load_mock_dict(topic))
+    except Exception as e:
+        print(f"❌ Mock数据读取失败: {e}")
+        data = PresentationData(topic="Error", slides=[])
+    for slide in data.slides:
+        yield "slide", slide
+    yield "done", data
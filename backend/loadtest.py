@@ -0,0 +1,192 @@
+"""
+端到端压测: 按目标 RPS 向后端发请求，统计吞吐量、延迟分位数和错误率
+
+用法 (先启动 fake_services.py，并让后端指向它，见 README):
+    python loadtest.py --rps 5 --duration 60
+    python loadtest.py --rps 2 --mix outline=1,render=2,generate=1 --output load.json
+
+- 开环发压: 按固定间隔发出请求，不等前一个返回，服务变慢时排队会体现在延迟上
+- 每个请求默认使用不同的主题，避免大纲缓存 / 渲染缓存命中 (--reuse-topics 可关闭)
+- render 请求的每一页标题都带上请求序号，单页片段缓存也不会命中，测的是冷渲染
+- --mock 时 generate 的大纲来自 mock_data.json，除封面外每页内容都相同，大部分页会命中片段缓存 (热缓存数字)
+"""
+import argparse
+import asyncio
+import copy
+import json
+import statistics
+import sys
+import time
+import uuid
+from collections import Counter, defaultdict
+import httpx
+
+ENDPOINTS = {
+    "outline": "/api/generate_outline",
+    "render": "/api/render_pptx",
+    "generate": "/api/generate",
+}
+
+
+def _percentile(values: list, pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered) + 0.5) - 1))
+    return ordered[index]
+
+
+def _parse_mix(text: str) -> dict:
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        if name not in ENDPOINTS:
+            raise SystemExit(f"未知的接口: {name} (可选: {', '.join(ENDPOINTS)})")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+class LoadTest:
+    def __init__(self, base_url: str, mix: dict, theme: str, use_ai: bool, reuse_topics: bool, timeout: float):
+        self.base_url = base_url.rstrip("/")
+        self.mix = mix
+        self.theme = theme
+        self.use_ai = use_ai
+        self.reuse_topics = reuse_topics
+        self.timeout = timeout
+        self.results = defaultdict(list)  # 接口 -> [(状态码或异常名, 耗时秒)]
+        self.template_outline = None
+        self._seq = 0
+
+    def _topic(self) -> str:
+        self._seq += 1
+        return "Load Test Topic" if self.reuse_topics else f"Load Test {self._seq} {uuid.uuid4().hex[:6]}"
+
+    def _payload(self, name: str) -> dict:
+        if name == "outline":
+            return {"topic": self._topic(), "use_ai": self.use_ai, "theme": self.theme}
+        if name == "generate":
+            return {"topic": self._topic(), "use_ai": self.use_ai, "theme": self.theme}
+        # render: 复用预热时拿到的大纲，改一下主题让渲染缓存不命中
+        data = copy.deepcopy(self.template_outline)
+        data["topic"] = self._topic()
+        data["slides"][0]["title"] = data["topic"]
+        if not self.reuse_topics:
+            # 每页内容都改一点，单页片段缓存同样不命中
+            for slide in data["slides"][1:]:
+                slide["title"] = f"{slide.get('title') or ''} #{self._seq}"
+        return {"theme": self.theme, "ppt_data": data}
+
+    async def prepare(self, client: httpx.AsyncClient):
+        """render 接口需要一份大纲，先请求一次 (不计入统计)"""
+        if "render" in self.mix:
+            resp = await client.post(ENDPOINTS["outline"], json={"topic": "Load Test Warmup", "use_ai": self.use_ai})
+            resp.raise_for_status()
+            self.template_outline = resp.json()["data"]
+
+    async def _one(self, client: httpx.AsyncClient, name: str):
+        payload = self._payload(name)
+        started = time.perf_counter()
+        try:
+            resp = await client.post(ENDPOINTS[name], json=payload)
+            outcome = resp.status_code
+        except httpx.HTTPError as e:
+            outcome = type(e).__name__
+        self.results[name].append((outcome, time.perf_counter() - started))
+
+    async def run(self, rps: float, duration: float) -> float:
+        limits = httpx.Limits(max_connections=None, max_keepalive_connections=100)
+        async with httpx.AsyncClient(base_url=self.base_url, timeout=self.timeout, limits=limits) as client:
+            await self.prepare(client)
+            total = int(rps * duration)
+            # 按权重交错分配请求 (确定性，方便多次运行对比)
+            weight_sum = sum(self.mix.values())
+            credit = dict.fromkeys(self.mix, 0.0)
+            schedule = []
+            for _ in range(total):
+                for name, weight in self.mix.items():
+                    credit[name] += weight / weight_sum
+                pick = max(credit, key=credit.get)
+                credit[pick] -= 1
+                schedule.append(pick)
+
+            print(f"🚦 [LoadTest] {self.base_url}  目标 {rps} RPS x {duration}s = {total} 个请求  配比 {self.mix}")
+            tasks = []
+            started = time.perf_counter()
+            for i, name in enumerate(schedule):
+                delay = started + i / rps - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                tasks.append(asyncio.create_task(self._one(client, name)))
+            await asyncio.gather(*tasks)
+            return time.perf_counter() - started
+
+    def report(self, elapsed: float) -> dict:
+        summary = {"elapsed_seconds": round(elapsed, 3), "endpoints": {}}
+        all_latencies, all_errors, all_count = [], 0, 0
+        for name, records in self.results.items():
+            latencies = [t for code, t in records if code == 200]
+            codes = Counter(str(code) for code, _ in records)
+            errors = len(records) - len(latencies)
+            all_latencies += latencies
+            all_errors += errors
+            all_count += len(records)
+            summary["endpoints"][name] = {
+                "requests": len(records),
+                "throughput_rps": round(len(latencies) / elapsed, 3),
+                "error_rate": round(errors / len(records), 4),
+                "status_codes": dict(codes),
+                "latency_seconds": {
+                    "mean": round(statistics.mean(latencies), 4) if latencies else None,
+                    "p50": round(_percentile(latencies, 50), 4),
+                    "p90": round(_percentile(latencies, 90), 4),
+                    "p95": round(_percentile(latencies, 95), 4),
+                    "p99": round(_percentile(latencies, 99), 4),
+                    "max": round(max(latencies), 4) if latencies else None,
+                },
+            }
+        summary["total"] = {
+            "requests": all_count,
+            "throughput_rps": round(len(all_latencies) / elapsed, 3) if elapsed else 0,
+            "error_rate": round(all_errors / all_count, 4) if all_count else 0,
+            "p95_seconds": round(_percentile(all_latencies, 95), 4),
+        }
+
+        print(f"\n{'接口':<10}{'请求':>6}{'吞吐/s':>9}{'错误率':>8}{'p50':>9}{'p90':>9}{'p95':>9}{'p99':>9}   状态码")
+        for name, s in summary["endpoints"].items():
+            lat = s["latency_seconds"]
+            print(f"{name:<10}{s['requests']:>6}{s['throughput_rps']:>9.2f}{s['error_rate']:>8.1%}"
+                  f"{lat['p50']:>9.3f}{lat['p90']:>9.3f}{lat['p95']:>9.3f}{lat['p99']:>9.3f}   {s['status_codes']}")
+        t = summary["total"]
+        print(f"{'total':<10}{t['requests']:>6}{t['throughput_rps']:>9.2f}{t['error_rate']:>8.1%}   p95={t['p95_seconds']:.3f}s")
+        return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="PPT 后端端到端压测")
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--rps", type=float, default=2)
+    parser.add_argument("--duration", type=float, default=30, help="发压时长 (秒)")
+    parser.add_argument("--mix", default="outline=1,render=1,generate=1", help="接口配比，如 outline=2,generate=1")
+    parser.add_argument("--theme", default="academic")
+    parser.add_argument("--mock", action="store_true", help="use_ai=False，不经过 LLM")
+    parser.add_argument("--reuse-topics", action="store_true", help="所有请求用同一个主题 (测缓存命中时的表现)")
+    parser.add_argument("--timeout", type=float, default=180)
+    parser.add_argument("--output", help="结果保存为 JSON")
+    args = parser.parse_args()
+
+    test = LoadTest(args.url, _parse_mix(args.mix), args.theme, not args.mock, args.reuse_topics, args.timeout)
+    elapsed = asyncio.run(test.run(args.rps, args.duration))
+    summary = test.report(elapsed)
+    summary["config"] = vars(args)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(summary, f, ensure_ascii=False, indent=2)
+        print(f"💾 结果已保存: {args.output}")
+    if summary["total"]["error_rate"] > 0:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
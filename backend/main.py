@@ -1,14 +1,51 @@
-from fastapi import FastAPI
-from fastapi.staticfiles import StaticFiles
+import time
+_IMPORT_STARTED = time.perf_counter()  # 启动耗时统计的起点 (要放在其他 import 之前)
+
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import StreamingResponse, FileResponse, PlainTextResponse, JSONResponse
 from pydantic import BaseModel
-from llm_service import generate_ppt_content
-from ppt_engine import create_pptx_file
+from typing import List, Literal, Optional
+from llm_service import generate_ppt_content, stream_ppt_content, OutlineCacheMiss
+import render_pool
+import jobs
+import retention
+import telemetry
+import startup
+from render_pool import RenderTimeoutError
+from render_cache import render_cached
+from pipeline import generate_pipelined, PipelineError
+from batch import run_batch, zip_results, BATCH_MAX_ITEMS
+import asyncio
+import re
+import uuid
 import uvicorn
 import os
+import json
 from models import PresentationData
 from fastapi.middleware.cors import CORSMiddleware
+_IMPORT_SECONDS = time.perf_counter() - _IMPORT_STARTED
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    startup.record("import", _IMPORT_SECONDS)
+    started = time.perf_counter()
+    await jobs.start()
+    startup.record("jobs", time.perf_counter() - started)
+    sweeper = asyncio.create_task(retention.sweeper_loop())
+    # 预热在后台进行，完成前 /ready 返回 503
+    warmup = asyncio.create_task(startup.warmup(app)) if startup.STARTUP_WARMUP else None
+    if warmup is None:
+        startup.mark_ready()
+    yield
+    # 关闭时停止后台任务并回收渲染进程池
+    if warmup is not None:
+        warmup.cancel()
+    sweeper.cancel()
+    await jobs.stop()
+    render_pool.shutdown()
 
-app = FastAPI(title="AI PPT Generator Pro")
+app = FastAPI(title="AI PPT Generator Pro", lifespan=lifespan)
 
 # ✨ 跨域配置 (解决 Failed to fetch 的核心)
 app.add_middleware(
@@ -19,9 +56,58 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# 挂载静态文件目录，用于下载生成的 PPT
-os.makedirs("generated_ppts", exist_ok=True)
-app.mount("/download", StaticFiles(directory="generated_ppts"), name="download")
+# 请求 ID + HTTP 指标: 沿用客户端传入的 X-Request-ID，没有就生成一个，并在响应头里返回
+@app.middleware("http")
+async def request_context(request: Request, call_next):
+    request_id = request.headers.get("X-Request-ID") or uuid.uuid4().hex[:16]
+    token = telemetry.request_id_var.set(request_id)
+    started = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        response.headers["X-Request-ID"] = request_id
+        return response
+    finally:
+        duration = time.perf_counter() - started
+        # 用路由模板 (如 /api/jobs/{job_id}) 作标签，避免每个 ID 一条时间序列
+        route = request.scope.get("route")
+        path = route.path if route is not None else "unmatched"
+        telemetry.observe("ppt_http_request_duration_seconds", duration, method=request.method, path=path)
+        telemetry.inc("ppt_http_requests_total", method=request.method, path=path, status=status)
+        telemetry.log("http_request", method=request.method, path=request.url.path, route=path,
+                      status=status, duration_ms=round(duration * 1000, 2))
+        telemetry.request_id_var.reset(token)
+
+# 就绪探针: 预热完成前返回 503 (负载均衡 / K8s readinessProbe 用)
+@app.get("/ready", include_in_schema=False)
+async def ready():
+    body = {"status": "ready" if startup.state["ready"] else "warming_up", **startup.state}
+    return JSONResponse(body, status_code=200 if startup.state["ready"] else 503)
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    return PlainTextResponse(telemetry.render_prometheus(), media_type="text/plain; version=0.0.4")
+
+# 下载生成的 PPT (文件按名字分片存放，过期删除后返回 410)
+os.makedirs(retention.OUTPUT_DIR, exist_ok=True)
+
+DOWNLOAD_MEDIA_TYPES = {
+    ".pptx": "application/vnd.openxmlformats-officedocument.presentationml.presentation",
+    ".zip": "application/zip",
+}
+
+@app.get("/download/{filename}")
+async def download(filename: str):
+    ext = os.path.splitext(filename)[1]
+    if ext not in DOWNLOAD_MEDIA_TYPES or not re.fullmatch(r"[\w-]+\.\w+", filename):
+        raise HTTPException(status_code=404, detail="文件不存在")
+    state, path = retention.lookup(filename)
+    if state == "gone":
+        raise HTTPException(status_code=410, detail="下载链接已过期，请重新生成")
+    if state == "missing":
+        raise HTTPException(status_code=404, detail="文件不存在")
+    return FileResponse(path, media_type=DOWNLOAD_MEDIA_TYPES[ext], filename=filename)
 
 # --- 接口 A: 生成大纲 (Preview) ---
 class OutlineRequest(BaseModel):
@@ -29,19 +115,50 @@ class OutlineRequest(BaseModel):
     slide_length: int = 8
     theme: str = "academic"
     use_ai: bool = True
+    # 大纲缓存: bypass=强制重新生成, prefer=优先用缓存, only=只用缓存 (没有则 404)
+    cache: Literal["bypass", "prefer", "only"] = "prefer"
+    # Prompt 变体: full=完整规则和示例, compact=精简版 (输入 token 更少、更快)；默认 LLM_PROMPT_VARIANT
+    prompt: Optional[Literal["full", "compact"]] = None
 
 @app.post("/api/generate_outline")
 async def generate_outline(req: OutlineRequest):
     print(f"🧠 [Step 1] 正在构思大纲: Topic={req.topic}")
     # 调用 LLM 服务
-    ppt_data = await generate_ppt_content(req.topic, use_ai=req.use_ai, slide_length=req.slide_length)
+    usage = {}
+    try:
+        ppt_data = await generate_ppt_content(req.topic, use_ai=req.use_ai, slide_length=req.slide_length,
+                                              cache=req.cache, prompt=req.prompt, usage=usage)
+    except OutlineCacheMiss as e:
+        raise HTTPException(status_code=404, detail=str(e))
         
     # 直接返回 Pydantic 对象，FastAPI 会自动转成 JSON
     return {
         "status": "success",
-        "data": ppt_data
+        "data": ppt_data,
+        "usage": usage,  # 本次请求花掉的 token (缓存命中 / Mock 时为空)
     }
 
+# --- 接口 A2: 流式生成大纲 (Server-Sent Events) ---
+# 每生成完一页就推送一个 `event: slide`，最后推送 `event: done` (完整的 PresentationData)
+@app.post("/api/generate_outline/stream")
+async def generate_outline_stream(req: OutlineRequest):
+    print(f"🧠 [Step 1] 流式构思大纲: Topic={req.topic}")
+
+    async def event_source():
+        async for event, payload in stream_ppt_content(req.topic, use_ai=req.use_ai, slide_length=req.slide_length,
+                                                       cache=req.cache, prompt=req.prompt):
+            if event == "error":
+                data = json.dumps({"detail": payload}, ensure_ascii=False)
+            else:
+                data = payload.model_dump_json()
+            yield f"event: {event}\ndata: {data}\n\n"
+
+    return StreamingResponse(
+        event_source(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
 # --- 接口 B: 渲染文件 (Render) ---
 class RenderRequest(BaseModel):
     theme: str = "academic"
@@ -50,9 +167,12 @@ class RenderRequest(BaseModel):
 @app.post("/api/render_pptx")
 async def render_pptx(req: RenderRequest):
     print(f"🎨 [Step 2] 正在渲染文件: Theme={req.theme}, Slides={len(req.ppt_data.slides)}")
-    # 调用渲染引擎
+    # 调用渲染引擎 (在进程池里执行，不阻塞事件循环)
     # 注意：这里 req.data 已经是校验好的 PresentationData 对象了，直接用！
-    filename = create_pptx_file(req.ppt_data, req.theme)
+    try:
+        filename = await render_cached(req.ppt_data, req.theme)
+    except RenderTimeoutError:
+        raise HTTPException(status_code=504, detail="PPT 渲染超时，请稍后重试")
         
     # 拼接下载链接 (实际部署建议配置 BASE_URL)
     download_url = f"http://localhost:8000/download/{filename}"
@@ -68,16 +188,35 @@ class GenRequest(BaseModel):
     topic: str
     theme: str = "academic"
     use_ai: bool = True  # 新增开关: True=真实生成, False=快速测试
+    cache: Literal["bypass", "prefer", "only"] = "prefer"
+    pipeline: bool = False  # True=流式 LLM，生成过程中提前下载图片，生成结束后整份渲染
+    prompt: Optional[Literal["full", "compact"]] = None
 
 @app.post("/api/generate")
 async def generate_ppt(req: GenRequest):
-    print(f"🚀 收到请求: Topic={req.topic}, AI={req.use_ai}")
-    
-    # 1. 调用 LLM 服务生成内容 (融合了 mock 和 real AI)
-    ppt_data = await generate_ppt_content(req.topic, req.use_ai)
-    
-    # 2. 调用渲染引擎生成文件 (融合了图片、表格、自适应文本)
-    filename = create_pptx_file(ppt_data, req.theme)
+    print(f"🚀 收到请求: Topic={req.topic}, AI={req.use_ai}, Pipeline={req.pipeline}")
+
+    if req.pipeline:
+        # 流水线模式: LLM 每产出一页就开始下载该页图片，大纲完整后再交给渲染进程池
+        try:
+            ppt_data, filename = await generate_pipelined(req.topic, req.theme, use_ai=req.use_ai, cache=req.cache,
+                                                             prompt=req.prompt)
+        except PipelineError as e:
+            raise HTTPException(status_code=502, detail=str(e))
+        except RenderTimeoutError:
+            raise HTTPException(status_code=504, detail="PPT 渲染超时，请稍后重试")
+    else:
+        # 1. 调用 LLM 服务生成内容 (融合了 mock 和 real AI)
+        try:
+            ppt_data = await generate_ppt_content(req.topic, req.use_ai, cache=req.cache, prompt=req.prompt)
+        except OutlineCacheMiss as e:
+            raise HTTPException(status_code=404, detail=str(e))
+        
+        # 2. 调用渲染引擎生成文件 (融合了图片、表格、自适应文本)
+        try:
+            filename = await render_cached(ppt_data, req.theme)
+        except RenderTimeoutError:
+            raise HTTPException(status_code=504, detail="PPT 渲染超时，请稍后重试")
     
     # 3. 返回下载链接
     # 注意: localhost 在服务器部署时需要改为服务器 IP
@@ -90,5 +229,70 @@ async def generate_ppt(req: GenRequest):
         "slide_count": len(ppt_data.slides)
     }
 
+# --- 接口 D: 批量生成 ---
+class BatchItem(BaseModel):
+    topic: str
+    theme: str = "academic"
+    use_ai: bool = True
+    slide_length: int = 10
+    cache: Literal["bypass", "prefer", "only"] = "prefer"
+
+class BatchRequest(BaseModel):
+    items: List[BatchItem]
+    llm_concurrency: Optional[int] = None  # 同时进行的 LLM 调用数 (默认 BATCH_LLM_CONCURRENCY)
+    zip: bool = False                      # True=额外打包成一个 zip
+
+@app.post("/api/generate_batch")
+async def generate_batch(req: BatchRequest):
+    if not req.items:
+        raise HTTPException(status_code=400, detail="items 不能为空")
+    if len(req.items) > BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"单次最多 {BATCH_MAX_ITEMS} 项")
+
+    started = time.perf_counter()
+    results = await run_batch(req.items, llm_concurrency=req.llm_concurrency)
+    for r in results:
+        if r["status"] == "success":
+            r["download_url"] = f"http://localhost:8000/download/{r['filename']}"
+
+    succeeded = sum(1 for r in results if r["status"] == "success")
+    response = {
+        "status": "success" if succeeded == len(results) else "partial",
+        "succeeded": succeeded,
+        "failed": len(results) - succeeded,
+        "total_seconds": round(time.perf_counter() - started, 3),
+        "items": results,
+    }
+    if req.zip and succeeded:
+        zip_name = await asyncio.to_thread(zip_results, results)
+        response["zip_url"] = f"http://localhost:8000/download/{zip_name}"
+    return response
+
+# --- 接口 E: 异步任务 (立即返回 job_id，轮询进度) ---
+async def _submit_job(kind: str, request: dict):
+    try:
+        job_id = await jobs.submit(kind, request)
+    except jobs.QueueFullError as e:
+        raise HTTPException(status_code=429, detail="任务队列已满，请稍后重试",
+                            headers={"Retry-After": str(e.retry_after)})
+    return {"status": "queued", "job_id": job_id, "status_url": f"/api/jobs/{job_id}"}
+
+@app.post("/api/jobs/generate", status_code=202)
+async def submit_generate_job(req: GenRequest):
+    return await _submit_job("generate", req.model_dump())
+
+@app.post("/api/jobs/render", status_code=202)
+async def submit_render_job(req: RenderRequest):
+    return await _submit_job("render", req.model_dump())
+
+@app.get("/api/jobs/{job_id}")
+async def get_job_status(job_id: str):
+    job = await jobs.get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="任务不存在")
+    if job["status"] == "saved":
+        job["download_url"] = f"http://localhost:8000/download/{job['result']['filename']}"
+    return job
+
 if __name__ == "__main__":
     uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
\ No newline at end of file
@@ -7,12 +7,18 @@ class TableData(BaseModel):
     headers: List[str] = Field(description="表头")
     rows: List[List[Union[str, int, float]]] = Field(description="表格行数据")
 
+class ChartSeries(BaseModel):
+    """图表中的一个数据系列"""
+    name: str = Field(description="系列名称 (图例)")
+    values: List[float] = Field(description="与 labels 一一对应的数值")
+
 class ChartData(BaseModel):
     """图表数据结构"""
     title: Optional[str] = None
-    chart_type: str = "COLUMN_CLUSTERED"
+    chart_type: str = Field("COLUMN_CLUSTERED", description="图表类型: COLUMN_CLUSTERED, BAR_CLUSTERED, LINE, PIE, AREA, DOUGHNUT 等")
     labels: List[str]
-    values: List[float]
+    values: List[float] = Field(default_factory=list, description="单系列数值 (有 series 时忽略)")
+    series: Optional[List[ChartSeries]] = Field(None, description="多系列数据")
 
 class Content(BaseModel):
     """文本内容组件"""
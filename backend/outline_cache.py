@@ -0,0 +1,98 @@
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
+
+# === 大纲缓存 ===
+# 同一个主题 / 页数 / 模型 / Prompt 版本只调用一次 LLM。
+# 每条缓存是一个 JSON 文件，超过 TTL 视为过期，条目数超过上限时删除最旧的。
+
+OUTLINE_CACHE_DIR = os.getenv("OUTLINE_CACHE_DIR", os.path.join("cache", "outlines"))
+OUTLINE_CACHE_TTL = float(os.getenv("OUTLINE_CACHE_TTL", 24 * 3600))
+OUTLINE_CACHE_MAX_ENTRIES = int(os.getenv("OUTLINE_CACHE_MAX_ENTRIES", 1000))
+
+CACHE_MODES = ("bypass", "prefer", "only")
+
+stats = {"hits": 0, "misses": 0, "writes": 0, "evictions": 0}
+_lock = threading.Lock()
+
+
+class OutlineCacheMiss(LookupError):
+    """cache=only 但缓存里没有可用的大纲"""
+
+
+def make_key(topic: str, slide_length: int, model: str, prompt: str) -> str:
+    normalized = " ".join(topic.lower().split())
+    prompt_hash = hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:16]
+    raw = f"{normalized}|{slide_length}|{model}|{prompt_hash}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def _path(key: str) -> str:
+    return os.path.join(OUTLINE_CACHE_DIR, f"{key}.json")
+
+
+def get(key: str, ttl: float = None):
+    """命中且未过期时返回大纲 dict，否则返回 None"""
+    ttl = OUTLINE_CACHE_TTL if ttl is None else ttl
+    path = _path(key)
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            entry = json.load(f)
+        if time.time() - entry["created_at"] > ttl:
+            raise KeyError("expired")
+    except (OSError, ValueError, KeyError):
+        with _lock:
+            stats["misses"] += 1
+        return None
+    with _lock:
+        stats["hits"] += 1
+    return entry["data"]
+
+
+def put(key: str, data: dict, usage: dict = None):
+    """写入大纲；usage 为生成它花掉的 token 数，和大纲存在一起，便于核算每份大纲的成本"""
+    path = _path(key)
+    try:
+        os.makedirs(OUTLINE_CACHE_DIR, exist_ok=True)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"created_at": time.time(), "data": data, "usage": usage}, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        print(f"   ⚠️ [OutlineCache] 写入缓存失败: {e}")
+        return
+    with _lock:
+        stats["writes"] += 1
+        _evict()
+
+
+def _evict():
+    """条目数超过上限时，按写入时间删除最旧的"""
+    try:
+        names = [n for n in os.listdir(OUTLINE_CACHE_DIR) if n.endswith(".json")]
+    except OSError:
+        return
+    if len(names) <= OUTLINE_CACHE_MAX_ENTRIES:
+        return
+    entries = []
+    for name in names:
+        path = os.path.join(OUTLINE_CACHE_DIR, name)
+        try:
+            entries.append((os.path.getmtime(path), path))
+        except OSError:
+            continue
+    entries.sort()
+    for _, path in entries[:len(entries) - OUTLINE_CACHE_MAX_ENTRIES]:
+        try:
+            os.remove(path)
+            stats["evictions"] += 1
+        except OSError:
+            pass
+
+
+def get_stats() -> dict:
+    with _lock:
+        return dict(stats)
@@ -0,0 +1,67 @@
+import asyncio
+from llm_service import stream_ppt_content
+from models import PresentationData
+from render_cache import render_cached
+
+# === 流水线生成 (图片预取) ===
+# 注意: 这里只把图片下载和 LLM 生成交叠起来，不做逐页渲染；渲染在大纲完整后一次完成。
+# LLM 每流式产出一页，立刻开始并发下载该页图片，
+# 最后一页到达时图片基本都已就绪，再把整份 PPT 交给渲染进程池，总耗时约为 LLM 耗时 + 一次渲染。
+#
+# 渲染和普通模式一样走 render_cache -> render_pool: 在子进程里执行，受 RENDER_TIMEOUT 限制
+# (超时抛 RenderTimeoutError，接口返回 504)，也能复用渲染缓存和单页片段缓存。
+
+
+class PipelineError(Exception):
+    """流式生成中途失败"""
+
+
+async def _fetch_image(prompt: str, semaphore: asyncio.Semaphore):
+    from ppt_engine import get_image_stream, IMAGE_FETCH_DEADLINE
+    async with semaphore:
+        try:
+            stream = await asyncio.wait_for(asyncio.to_thread(get_image_stream, prompt), timeout=IMAGE_FETCH_DEADLINE)
+        except asyncio.TimeoutError:
+            print(f"   ⏰ [Pipeline] 图片超时，已跳过: {prompt}")
+            return None
+    return stream.getvalue() if stream else None
+
+
+async def generate_pipelined(topic: str, theme: str = "academic", use_ai: bool = True,
+                             slide_length: int = 10, cache: str = "prefer", prompt: str = None):
+    """
+    边生成边下载图片，生成结束后渲染。
+    :return: (PresentationData, 文件名)
+    :raises PipelineError: 流式生成失败
+    :raises RenderTimeoutError: 渲染超时
+    """
+    from ppt_engine import IMAGE_FETCH_WORKERS
+    print(f"⚡ [Pipeline] 流水线生成: Topic={topic}, Theme={theme}")
+    semaphore = asyncio.Semaphore(IMAGE_FETCH_WORKERS)
+
+    image_tasks = {}  # prompt -> Task[bytes]
+    slides = []
+    data = None
+
+    try:
+        async for event, payload in stream_ppt_content(topic, use_ai=use_ai, slide_length=slide_length, cache=cache,
+                                                         prompt=prompt):
+            if event == "slide":
+                slides.append(payload)
+                visual = payload.visual
+                if visual and visual.need_image and visual.image_prompt and visual.image_prompt not in image_tasks:
+                    image_tasks[visual.image_prompt] = asyncio.create_task(_fetch_image(visual.image_prompt, semaphore))
+            elif event == "done":
+                data = payload
+            elif event == "error":
+                raise PipelineError(payload)
+
+        data = data or PresentationData(topic=topic, slides=slides)
+        results = await asyncio.gather(*image_tasks.values())
+        images = dict(zip(image_tasks, results))
+        filename = await render_cached(data, theme, images=images)
+        return data, filename
+    finally:
+        # 出错时取消还没完成的下载
+        for task in image_tasks.values():
+            task.cancel()
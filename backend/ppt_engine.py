@@ -1,66 +1,160 @@
-import math 
+import contextvars
+import logging
 import os
 import uuid
 import requests
 from io import BytesIO
-from pptx import Presentation
+from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError as FuturesTimeout
 from pptx.util import Pt, Inches
-from pptx.dml.color import RGBColor
-from pptx.chart.data import CategoryChartData
-from pptx.enum.chart import XL_CHART_TYPE
 from pptx.enum.text import PP_ALIGN
 from models import PresentationData
+import template_cache
+import image_cache
+import retention
+import singleflight
+import chart_engine
+import slide_fragments
+import table_engine
+import telemetry
+from image_processing import normalize_image
+from text_metrics import fit_font_size
+
+# 图片源地址 (压测时可以指向 fake_services.py 提供的本地假图床)
+IMAGE_API_URL = os.getenv("IMAGE_API_URL", "https://image.pollinations.ai/prompt").rstrip("/")
+IMAGE_BACKUP_URL = os.getenv("IMAGE_BACKUP_URL", "https://picsum.photos/1280/720")
 
 # === 1. 辅助函数 ===
 
 def get_image_stream(query):
+    """下载 (或从缓存读取) 一张配图，记录耗时、来源 (pollinations/picsum/none) 和缓存命中情况"""
+    with telemetry.stage("image_fetch", log_fields={"query": query}) as labels:
+        stream = _fetch_image(query, labels)
+        if stream is None:
+            labels["outcome"] = "error"
+        return stream
+
+def _fetch_image(query, labels: dict):
     # 1. 设置请求头（防止被网站拦截）
     headers = {
         "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
     }
     
+    # 先查本地缓存，命中就不走网络
+    cache_key = image_cache.make_key(query, 1280, 720)
+    cached = image_cache.get(cache_key)
+    labels.update(source="pollinations", cache="hit" if cached else "miss")
+    if cached:
+        print(f"   💾 [Image] 缓存命中: {query}")
+        return BytesIO(cached)
+
     # 2. 尝试使用 Pollinations AI (生成图)
     # 将 query 中的空格替换为 %20
     safe_query = query.replace(" ", "%20")
     # 增加 nologo=true 去水印，设置宽高
-    url = f"https://image.pollinations.ai/prompt/{safe_query}?width=1280&height=720&nologo=true"
+    url = f"{IMAGE_API_URL}/{safe_query}?width=1280&height=720&nologo=true"
     
-    print(f"   ⬇️ [Image] 正在下载图片: {query}...")
-
-    try:
-        response = requests.get(url, headers=headers, timeout=15) # 超时稍微给长一点点
-        # 3. 检查状态码，只有 200 才算成功
-        if response.status_code == 200 and len(response.content) > 0:
-            return BytesIO(response.content)
-        else:
+    def download():
+        print(f"   ⬇️ [Image] 正在下载图片: {query}...")
+        try:
+            response = requests.get(url, headers=headers, timeout=15) # 超时稍微给长一点点
+            # 3. 检查状态码，只有 200 才算成功
+            if response.status_code == 200 and len(response.content) > 0:
+                image_cache.put(cache_key, response.content)
+                return response.content
             print(f"   ⚠️ AI绘图失败 (Code: {response.status_code})，准备切换备用源...")
-            
-    except Exception as e:
-        print(f"   ⚠️ AI绘图连接报错: {e}")
+        except Exception as e:
+            print(f"   ⚠️ AI绘图连接报错: {e}")
+        return None
+
+    # 同一 prompt 的并发下载 (同进程的其他线程 / 其他渲染进程) 合并成一次
+    content = singleflight.run_sync(f"image:{cache_key}", download, lookup=lambda: image_cache.get(cache_key))
+    if content:
+        return BytesIO(content)
 
     # --- 4. 兜底方案 (如果上面失败了，用随机图) ---
     print("   🔄 尝试使用备用图源 (Picsum)...")
-    try:
-        # Picsum 是一个非常稳定的随机图源
-        backup_url = "https://picsum.photos/1280/720"
-        backup_resp = requests.get(backup_url, headers=headers, timeout=10)
-        if backup_resp.status_code == 200:
-            return BytesIO(backup_resp.content)
-    except Exception as e:
-        print(f"   ❌ 备用图源也失败了: {e}")
+    # 备用图按 prompt 分别缓存 (同一份 PPT 的各页不会都是同一张图)，和 AI 图的 key 分开，下次主源恢复后仍会优先用 AI 图
+    backup_key = image_cache.make_key(f"__picsum__:{query}", 1280, 720)
+    cached = image_cache.get(backup_key)
+    labels.update(source="picsum", cache="hit" if cached else "miss")
+    if cached:
+        return BytesIO(cached)
+
+    def download_backup():
+        try:
+            # Picsum 是一个非常稳定的随机图源
+            backup_resp = requests.get(IMAGE_BACKUP_URL, headers=headers, timeout=10)
+            if backup_resp.status_code == 200:
+                image_cache.put(backup_key, backup_resp.content)
+                return backup_resp.content
+        except Exception as e:
+            print(f"   ❌ 备用图源也失败了: {e}")
+        return None
+
+    # 相同 prompt 的备用图同样只下载一次
+    content = singleflight.run_sync(f"image:{backup_key}", download_backup, lookup=lambda: image_cache.get(backup_key))
+    if content:
+        return BytesIO(content)
 
     # 5. 实在不行返回 None，渲染引擎里会跳过插图逻辑，防止程序崩溃
+    labels["source"] = "none"
     return None
 
+# 图片预取配置: 并发下载数 & 整个 PPT 的图片下载总时限 (秒)
+IMAGE_FETCH_WORKERS = int(os.getenv("IMAGE_FETCH_WORKERS", 4))
+IMAGE_FETCH_DEADLINE = float(os.getenv("IMAGE_FETCH_DEADLINE", 30))
+
+def prefetch_images(data: PresentationData, max_workers: int = None, deadline: float = None, on_progress=None) -> dict:
+    """
+    并发下载整份 PPT 需要的所有图片，总耗时约等于最慢的一张，而不是所有图片之和。
+    :param on_progress: 可选回调 on_progress(已完成数, 总数)，每张图片完成时调用
+    :return: {image_prompt: 图片字节}，下载失败或超过 deadline 的图片为 None
+    """
+    prompts = []
+    for slide_data in data.slides:
+        if slide_data.visual and slide_data.visual.need_image and slide_data.visual.image_prompt:
+            if slide_data.visual.image_prompt not in prompts:
+                prompts.append(slide_data.visual.image_prompt)
+    if not prompts:
+        return {}
+
+    workers = min(max_workers or IMAGE_FETCH_WORKERS, len(prompts))
+    print(f"   🖼️ [Image] 并发预取 {len(prompts)} 张图片 (并发={workers})")
+    executor = ThreadPoolExecutor(max_workers=workers)
+    # 每个下载线程带上当前上下文 (request_id)
+    futures = {executor.submit(contextvars.copy_context().run, get_image_stream, p): p for p in prompts}
+    finished = 0
+    with telemetry.stage("image_prefetch", log_fields={"images": len(prompts)}) as labels:
+        try:
+            for _ in as_completed(futures, timeout=deadline or IMAGE_FETCH_DEADLINE):
+                finished += 1
+                if on_progress:
+                    on_progress(finished, len(prompts))
+        except FuturesTimeout:
+            print(f"   ⏰ [Image] {len(prompts) - finished} 张图片超过时限，已跳过")
+            labels["outcome"] = "timeout"
+    # 超时的下载不再等待，直接放弃
+    executor.shutdown(wait=False, cancel_futures=True)
+
+    images = {}
+    for fut, prompt in futures.items():
+        stream = fut.result() if fut.done() and not fut.cancelled() and fut.exception() is None else None
+        images[prompt] = stream.getvalue() if stream else None
+    return images
+
+# 自适应字号范围 (pt)
+AUTOFIT_MIN_SIZE = float(os.getenv("AUTOFIT_MIN_SIZE", 18))
+AUTOFIT_MAX_SIZE = float(os.getenv("AUTOFIT_MAX_SIZE", 32))
+
 def auto_fit_text(text_frame, content_list: list, font_name="Microsoft YaHei"):
     if not content_list: return
     text_frame.clear()
     
-    # 1. 获取文本框尺寸 (带更强的安全兜底)
+    # 1. 获取文本框尺寸 (扣掉左右 0.1 英寸、上下 0.05 英寸的默认内边距，带更强的安全兜底)
     try:
         parent = text_frame._parent
-        box_width_pt = parent.width.pt - Pt(10) 
-        box_height_pt = parent.height.pt - Pt(10)
+        box_width_pt = parent.width.pt - 14.4
+        box_height_pt = parent.height.pt - 7.2
         
         # ⚠️ 关键修正：如果获取到的高度太小（比如小于 2英寸）
         # 强制认为它有一个标准正文框的高度 (约 5 英寸)
@@ -72,86 +166,32 @@ def auto_fit_text(text_frame, content_list: list, font_name="Microsoft YaHei"):
         box_width_pt = Inches(8).pt
         box_height_pt = Inches(5).pt
 
-    # 2. 定义字号列表 
-    candidate_sizes = [32, 28, 24]
-    best_size = 24
-
-    # 3. 模拟排版
-    for size in candidate_sizes:
-        avg_char_width = size * 0.6 
-        line_height = size * 1.2
-        
-        chars_per_line = max(1, int(box_width_pt / avg_char_width))
-        
-        total_lines = 0
-        for line_text in content_list:
-            text_len = len(str(line_text))
-            if text_len == 0:
-                total_lines += 1
-                continue
-            lines_needed = math.ceil(text_len / chars_per_line)
-            total_lines += lines_needed
-            
-        estimated_height = total_lines * line_height
-        
-        # 如果能在高度限制内装下，就选用当前这个大字号
-        if estimated_height <= box_height_pt:
-            best_size = size
-            break
+    # 2. 按真实字宽模拟换行，二分查找能放下的最大字号
+    best_size = fit_font_size(
+        content_list, box_width_pt, box_height_pt, font_name=font_name,
+        min_size=AUTOFIT_MIN_SIZE, max_size=AUTOFIT_MAX_SIZE, space_after_pt=10,
+    )
     
-    # 4. 应用字号
-    for line in content_list:
-        p = text_frame.add_paragraph()
+    # 3. 应用字号 (clear() 后会留下一个空段落，直接复用它，避免顶部多出一个空行)
+    for i, line in enumerate(content_list):
+        p = text_frame.paragraphs[0] if i == 0 else text_frame.add_paragraph()
         p.text = str(line)
         p.font.size = Pt(best_size) 
         p.font.name = font_name
         p.space_after = Pt(10)
 
-def create_manual_table(slide, data, font_name="Microsoft YaHei"):
+def create_manual_table(slide, data, font_name="Microsoft YaHei", continue_slide=None) -> list:
     """
     手动创建表格 (处理模板可能没有表格占位符的情况)
+    行高按内容估算；传入 continue_slide 时，放不下的行拆到续页 (重复表头)。
+    :param continue_slide: 无参回调，新建一页续页并返回
+    :return: 表格占用的所有 slide
     """
-    headers = data.headers
-    rows = data.rows
-    
-    # === 动态计算表格高度 ===
-    # 基础行高估算: 表头 0.5英寸 + 每行 0.4英寸
-    row_count = len(rows)
-    estimated_height = 0.5 + (row_count * 0.4)
-    # 限制最大高度，防止画出幻灯片外面 (PPT一般高7.5英寸)
-    final_height = min(estimated_height, 5.0) 
-    
-    left = Inches(1)
-    top = Inches(2.5)
-    width = Inches(8)
-    height = Inches(final_height) 
-
-    # 创建表格形状
-    shape = slide.shapes.add_table(row_count+1, len(headers), left, top, width, height)
-    table = shape.table
-
-    # 1. 填充表头
-    for i, h in enumerate(headers):
-        cell = table.cell(0, i)
-        cell.text = str(h)
-        cell.fill.solid()
-        cell.fill.fore_color.rgb = RGBColor(0, 112, 192) # 经典蓝
-        
-        for p in cell.text_frame.paragraphs:
-            p.font.bold = True
-            p.font.color.rgb = RGBColor(255, 255, 255)
-            p.font.size = Pt(18)      
-            p.font.name = font_name   
-
-    # 2. 填充数据行
-    for r_idx, row in enumerate(rows):
-        for c_idx, val in enumerate(row):
-            if c_idx < len(headers):
-                cell = table.cell(r_idx+1, c_idx)
-                cell.text = str(val)
-                for p in cell.text_frame.paragraphs:
-                    p.font.size = Pt(16)    
-                    p.font.name = font_name 
+    return table_engine.render_table(
+        slide, data.headers, data.rows,
+        left=Inches(1), top=Inches(2.5), width=Inches(8),
+        font_name=font_name, continue_slide=continue_slide,
+    )
 
 # === 2. 布局配置 (来自 backend) ===
 LAYOUT_CONFIG = {
@@ -190,121 +230,205 @@ LAYOUT_CONFIG = {
     }
 }
 
+def preload_templates():
+    """预加载 LAYOUT_CONFIG 里所有主题的模板"""
+    template_cache.preload([cfg["file"] for cfg in LAYOUT_CONFIG.values()])
+
 # === 3. 核心生成函数 ===
-def create_pptx_file(data: PresentationData, theme: str = "academic") -> str:
-    print(f"🎨 [Render] 开始渲染 PPT: {data.topic} (主题: {theme})")
-    
-    config = LAYOUT_CONFIG.get(theme, LAYOUT_CONFIG[theme])
-    template_path = config["file"]
-    
-    if not os.path.exists(template_path):
-        prs = Presentation() # 没有模板就用空白的
-    else:
-        prs = Presentation(template_path)
+def render_slide(prs, layout_map: dict, slide_data, images: dict, font_name: str = "Microsoft YaHei",
+                 normalized: dict = None):
+    """
+    把一页 Slide 渲染到 prs 末尾。
+    :param images: {image_prompt: 图片字节}，缺失的图片直接跳过
+    :param normalized: 可选，同一份 PPT 共用的 dict，缓存压缩后的图片，同一张图在多页出现时只压缩一次
+    :return: 渲染好的 slide；渲染中途出错时返回 None (页面仍会保留)
+    """
+    l_type = slide_data.layout
+    print(f"   📄 处理页面 {slide_data.id}: {l_type}")
+    # layout 由客户端传入，指标标签只用模板里已知的布局，其他值归为 "other"
+    layout_label = l_type if l_type in layout_map else "other"
+    with telemetry.stage("slide_render", logging.DEBUG, log_fields={"slide_id": slide_data.id}, layout=layout_label) as labels:
+        slide = _render_slide(prs, layout_map, slide_data, images, font_name, normalized)
+        if slide is None:
+            labels["outcome"] = "error"
+    return slide
 
-    layout_map = config["layouts"]
-    
-    # 定义全局字体，方便统一修改
-    global_font = "Microsoft YaHei"
+def _normalized_image(prompt: str, img_bytes: bytes, width_in: float, normalized: dict) -> BytesIO:
+    """按显示宽度压缩图片；传了 normalized 时按 (prompt, 宽度) 复用已压缩的结果"""
+    if normalized is None:
+        return normalize_image(img_bytes, width_in=width_in)
+    key = (prompt, width_in)
+    if key not in normalized:
+        normalized[key] = normalize_image(img_bytes, width_in=width_in).getvalue()
+    return BytesIO(normalized[key])
 
-    for slide_data in data.slides:
-        l_type = slide_data.layout
-        print(f"   📄 处理页面 {slide_data.id}: {l_type}")
+def _render_slide(prs, layout_map: dict, slide_data, images: dict, font_name: str, normalized: dict = None):
+    l_type = slide_data.layout
 
-        # 1. 获取布局配置
-        cfg = layout_map.get(l_type, layout_map["content_list"])
-        slide_layout = prs.slide_layouts[cfg["idx"]]
-        slide = prs.slides.add_slide(slide_layout)
+    # 1. 获取布局配置
+    cfg = layout_map.get(l_type, layout_map["content_list"])
+    slide_layout = prs.slide_layouts[cfg["idx"]]
+    slide = prs.slides.add_slide(slide_layout)
+    
+    # 2. 填充通用标题
+    try:
+        if slide_data.title:
+            slide.placeholders[cfg["title"]].text = slide_data.title
+    except: pass
         
-        # 2. 填充通用标题
-        try:
-            if slide_data.title:
-                slide.placeholders[cfg["title"]].text = slide_data.title
-        except: pass
-            
-        # 3. 根据类型分发处理逻辑
-        try:
-            # --- Case A: 封面页 ---
-            if l_type == "title_cover" and slide_data.subtitle:
-                if slide_data.subtitle:
-                    slide.placeholders[cfg["sub"]].text = slide_data.subtitle
-
-            # --- Case B: 列表内容页 (使用 Auto-fit) ---
-            elif l_type == "content_list":
-                if slide_data.content and slide_data.content.bullet_points:
-                    body_ph = slide.placeholders[cfg["body"]]
-                    auto_fit_text(body_ph.text_frame, slide_data.content.bullet_points, font_name=global_font)
-                elif slide_data.content and slide_data.content.text_body:
-                    body_ph = slide.placeholders[cfg["body"]]
-                    auto_fit_text(body_ph.text_frame, [slide_data.content.text_body], font_name=global_font)
-
-            # --- Case C: 左右栏布局 ---
-            elif l_type == "two_column":
-                if slide_data.content:
-                    if slide_data.content.content_left:
-                        ph_left = slide.placeholders[cfg["left"]]
-                        auto_fit_text(ph_left.text_frame, slide_data.content.content_left, font_name=global_font)
-                    if slide_data.content.content_right:
-                        ph_right = slide.placeholders[cfg["right"]]
-                        auto_fit_text(ph_right.text_frame, slide_data.content.content_right, font_name=global_font)
-
-            # --- Case D: 表格页 (新增) ---
-            elif l_type == "table" and slide_data.table_data:
-                # 如果有正文占位符，先清空或删除，防止遮挡
-                if "body" in cfg and len(slide.placeholders) > cfg["body"]:
-                    sp = slide.placeholders[cfg["body"]]
+    # 3. 根据类型分发处理逻辑
+    try:
+        # --- Case A: 封面页 ---
+        if l_type == "title_cover" and slide_data.subtitle:
+            if slide_data.subtitle:
+                slide.placeholders[cfg["sub"]].text = slide_data.subtitle
+
+        # --- Case B: 列表内容页 (使用 Auto-fit) ---
+        elif l_type == "content_list":
+            if slide_data.content and slide_data.content.bullet_points:
+                body_ph = slide.placeholders[cfg["body"]]
+                auto_fit_text(body_ph.text_frame, slide_data.content.bullet_points, font_name=font_name)
+            elif slide_data.content and slide_data.content.text_body:
+                body_ph = slide.placeholders[cfg["body"]]
+                auto_fit_text(body_ph.text_frame, [slide_data.content.text_body], font_name=font_name)
+
+        # --- Case C: 左右栏布局 ---
+        elif l_type == "two_column":
+            if slide_data.content:
+                if slide_data.content.content_left:
+                    ph_left = slide.placeholders[cfg["left"]]
+                    auto_fit_text(ph_left.text_frame, slide_data.content.content_left, font_name=font_name)
+                if slide_data.content.content_right:
+                    ph_right = slide.placeholders[cfg["right"]]
+                    auto_fit_text(ph_right.text_frame, slide_data.content.content_right, font_name=font_name)
+
+        # --- Case D: 表格页 (新增) ---
+        elif l_type == "table" and slide_data.table_data:
+            # 如果有正文占位符，先清空或删除，防止遮挡
+            def remove_body(target):
+                if "body" in cfg and len(target.placeholders) > cfg["body"]:
+                    sp = target.placeholders[cfg["body"]]
                     sp.element.getparent().remove(sp.element)
-                
-                create_manual_table(slide, slide_data.table_data, font_name=global_font)
-
-            # --- Case E: 图表页 ---
-            elif l_type == "chart" and slide_data.chart_data:
-                chart_data = CategoryChartData()
-                chart_data.categories = slide_data.chart_data.labels
-                chart_data.add_series(slide_data.chart_data.title or "Series 1", slide_data.chart_data.values)
-                
-                # 尝试利用模板里的 Chart 占位符
-                if "body" in cfg and len(slide.placeholders) > cfg["body"]:
-                    ph = slide.placeholders[cfg["body"]]
-                    slide.shapes.add_chart(XL_CHART_TYPE.COLUMN_CLUSTERED, ph.left, ph.top, ph.width, ph.height, chart_data)
-                else:
-                    # 默认位置
-                    slide.shapes.add_chart(XL_CHART_TYPE.COLUMN_CLUSTERED, Inches(1), Inches(2), Inches(8), Inches(4.5), chart_data)
-                
+
+            # 表格太长时的续页: 同样的版式，标题加上后缀
+            def continue_slide():
+                extra = prs.slides.add_slide(slide_layout)
+                try:
+                    extra.placeholders[cfg["title"]].text = f"{slide_data.title or ''}{table_engine.TABLE_CONTINUED_SUFFIX}"
+                except: pass
+                remove_body(extra)
+                return extra
+
+            remove_body(slide)
+            create_manual_table(slide, slide_data.table_data, font_name=font_name, continue_slide=continue_slide)
+
+        # --- Case E: 图表页 ---
+        elif l_type == "chart" and slide_data.chart_data:
+            # 图表类型 / 多系列 / 大数据量降采样都在 chart_engine 里处理
+            # 尝试利用模板里的 Chart 占位符
+            if "body" in cfg and len(slide.placeholders) > cfg["body"]:
+                ph = slide.placeholders[cfg["body"]]
+                chart_engine.add_chart(slide, slide_data.chart_data, ph.left, ph.top, ph.width, ph.height)
                 ph.element.getparent().remove(ph.element)
+            else:
+                # 默认位置
+                chart_engine.add_chart(slide, slide_data.chart_data, Inches(1), Inches(2), Inches(8), Inches(4.5))
 
 
-            # --- Case F: 图片处理 (通用) ---
-            if slide_data.visual and slide_data.visual.need_image:
-                prompt = slide_data.visual.image_prompt
-                if prompt:
-                    img_stream = get_image_stream(prompt)
-                    if img_stream:
-                        if l_type == "image_page":
-                            # 大图居中
-                            slide.shapes.add_picture(img_stream, Inches(1), Inches(2), width=Inches(8))
-                            # 如果有 caption
-                            if slide_data.visual.caption:
-                                txBox = slide.shapes.add_textbox(Inches(1), Inches(6.5), Inches(8), Inches(1))
-                                p = txBox.text_frame.add_paragraph()
-                                p.text = slide_data.visual.caption
-                                p.font.size = Pt(12)
-                                p.alignment = 2 # 居中
-                            ph = slide.placeholders[cfg["body"]]
-                            ph.element.getparent().remove(ph.element)
-                        else:
-                            # 装饰性小图 (右上角或右下角)
-                            slide.shapes.add_picture(img_stream, Inches(6.5), Inches(5), width=Inches(3))
-                            
-        except Exception as e:
-            print(f"⚠️ 页面 {slide_data.id} 渲染出错: {e}")
-            continue
+        # --- Case F: 图片处理 (通用) ---
+        if slide_data.visual and slide_data.visual.need_image:
+            prompt = slide_data.visual.image_prompt
+            if prompt:
+                img_bytes = images.get(prompt)
+                if img_bytes:
+                    if l_type == "image_page":
+                        # 大图居中 (按显示尺寸压缩后再插入)
+                        img_stream = _normalized_image(prompt, img_bytes, 8, normalized)
+                        slide.shapes.add_picture(img_stream, Inches(1), Inches(2), width=Inches(8))
+                        # 如果有 caption
+                        if slide_data.visual.caption:
+                            txBox = slide.shapes.add_textbox(Inches(1), Inches(6.5), Inches(8), Inches(1))
+                            p = txBox.text_frame.add_paragraph()
+                            p.text = slide_data.visual.caption
+                            p.font.size = Pt(12)
+                            p.alignment = 2 # 居中
+                        ph = slide.placeholders[cfg["body"]]
+                        ph.element.getparent().remove(ph.element)
+                    else:
+                        # 装饰性小图 (右上角或右下角)
+                        img_stream = _normalized_image(prompt, img_bytes, 3, normalized)
+                        slide.shapes.add_picture(img_stream, Inches(6.5), Inches(5), width=Inches(3))
+                        
+    except Exception as e:
+        print(f"⚠️ 页面 {slide_data.id} 渲染出错: {e}")
+        return None
 
-    # 保存
-    os.makedirs("generated_ppts", exist_ok=True)
+    return slide
+
+def open_deck(theme: str = "academic"):
+    """返回 (模板副本, 布局映射)，之后逐页调用 render_slide"""
+    config = LAYOUT_CONFIG.get(theme, LAYOUT_CONFIG[theme])
+    # 从模板缓存拿一份副本 (没有模板就用空白的)
+    with telemetry.stage("template_load", log_fields={"theme": theme}):
+        prs = template_cache.get_presentation(config["file"])
+    return prs, config["layouts"]
+
+def save_deck(prs) -> str:
+    """保存到 generated_ppts (按文件名分片)，返回文件名"""
     filename = f"{uuid.uuid4()}.pptx"
-    save_path = os.path.join("generated_ppts", filename)
-    prs.save(save_path)
+    save_path = retention.artifact_path(filename)
+    with telemetry.stage("save", log_fields={"filename": filename, "slides": len(prs.slides)}):
+        prs.save(save_path)
     print(f"✅ 文件已保存: {save_path}")
     
-    return filename
\ No newline at end of file
+    return filename
+
+def changed_slides(data: PresentationData, theme: str = "academic") -> PresentationData:
+    """没有可复用渲染片段、需要重新渲染 (也就需要下载图片) 的页"""
+    template_path = LAYOUT_CONFIG[theme]["file"]
+    slides = [s for s in data.slides if not slide_fragments.has(slide_fragments.make_key(s, theme, template_path))]
+    return PresentationData(topic=data.topic, slides=slides)
+
+def create_pptx_file(data: PresentationData, theme: str = "academic", images: dict = None, missing: list = None) -> str:
+    """
+    :param images: prefetch_images 的结果 (可以只包含 changed_slides 的图片)；缺少的图片在这里并发预取
+    :param missing: 可选，传入列表时把本次渲染缺失 (下载失败 / 超时) 的图片 prompt 追加进去
+    """
+    print(f"🎨 [Render] 开始渲染 PPT: {data.topic} (主题: {theme})")
+
+    # 内容没变的页直接复用之前的渲染片段，只有改动 / 新增的页需要下载图片并重新渲染
+    template_path = LAYOUT_CONFIG[theme]["file"]
+    keys = [slide_fragments.make_key(s, theme, template_path) for s in data.slides]
+    # 调用方预取过的图片直接用；没预取到的 (片段在预取之后被淘汰等) 在这里补下载
+    images = dict(images or {})
+    changed = [s for s, key in zip(data.slides, keys) if not slide_fragments.has(key)]
+    to_fetch = [s for s in changed if not (s.visual and s.visual.image_prompt in images)]
+    images.update(prefetch_images(PresentationData(topic=data.topic, slides=to_fetch)))
+
+    prs, layout_map = open_deck(theme)
+    
+    # 定义全局字体，方便统一修改
+    global_font = "Microsoft YaHei"
+
+    reused = 0
+    normalized = {}  # (prompt, 显示宽度) -> 压缩后的图片，整份 PPT 内共用
+    for slide_data, key in zip(data.slides, keys):
+        if slide_fragments.restore(key, prs):
+            reused += 1
+            telemetry.inc("ppt_cache_requests_total", cache="slide_fragment", result="hit")
+            continue
+        telemetry.inc("ppt_cache_requests_total", cache="slide_fragment", result="miss")
+        before = len(prs.slides)
+        slide = render_slide(prs, layout_map, slide_data, images, font_name=global_font, normalized=normalized)
+        # 图片下载失败的页不缓存，下次还有机会拿到图片；拆成多页的表格也不缓存 (片段只能还原单页)
+        prompt = slide_data.visual.image_prompt if slide_data.visual and slide_data.visual.need_image else None
+        if prompt and not images.get(prompt) and missing is not None:
+            missing.append(prompt)
+        if slide is not None and len(prs.slides) == before + 1 and (not prompt or images.get(prompt)):
+            cfg = layout_map.get(slide_data.layout, layout_map["content_list"])
+            slide_fragments.capture(key, slide, cfg["idx"])
+    if reused:
+        print(f"   ♻️ [Render] 复用 {reused}/{len(data.slides)} 页已渲染片段")
+
+    # 保存
+    return save_deck(prs)
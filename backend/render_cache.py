@@ -0,0 +1,127 @@
+import asyncio
+import hashlib
+import json
+import os
+import uuid
+import retention
+from models import PresentationData
+from render_pool import render_pptx_detailed
+
+# === 渲染结果缓存 (幂等渲染) ===
+# 相同的 PresentationData + 主题 + 模板文件版本 + 渲染器版本及渲染配置 (slide_fragments.renderer_version) -> 直接返回已经生成过的文件，不再重复渲染。
+# 同一进程内并发的相同请求共享同一次渲染 (in-flight 去重)。
+# 缓存条目只记录 key -> 文件名，文件本身仍受 retention 的 TTL / 容量管理。
+
+RENDER_CACHE_DIR = os.getenv("RENDER_CACHE_DIR", os.path.join("cache", "renders"))
+
+stats = {"hits": 0, "misses": 0, "shared": 0}
+_inflight = {}  # key -> asyncio.Future[str]
+
+
+def _template_version(theme: str) -> str:
+    # 延迟导入，API 进程启动时不加载 python-pptx
+    from ppt_engine import LAYOUT_CONFIG
+    from slide_fragments import renderer_version
+    config = LAYOUT_CONFIG.get(theme)
+    if not config or not os.path.exists(config["file"]):
+        return f"{renderer_version()}-blank"
+    st = os.stat(config["file"])
+    return f"{renderer_version()}-{st.st_mtime_ns}-{st.st_size}"
+
+
+def make_key(data: PresentationData, theme: str) -> str:
+    canonical = json.dumps(data.model_dump(mode="json"), sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    raw = f"{theme}|{_template_version(theme)}|{canonical}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def _entry_path(key: str) -> str:
+    return os.path.join(RENDER_CACHE_DIR, key[:2], key)
+
+
+def _discard(path: str):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def lookup(key: str):
+    """返回仍可下载的文件名，否则 None"""
+    path = _entry_path(key)
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            filename = f.read().strip()
+    except OSError:
+        return None
+    state, artifact = retention.lookup(filename)
+    if state != "ok":
+        # 文件已被清理，缓存条目一并作废
+        _discard(path)
+        return None
+    # 续期: 被复用的文件从现在起重新计算 TTL
+    try:
+        os.utime(artifact)
+    except OSError:
+        # 检查之后刚好被 retention 清理掉，按未命中处理
+        _discard(path)
+        return None
+    return filename
+
+
+def store(key: str, filename: str):
+    path = _entry_path(key)
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(filename)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        print(f"   ⚠️ [RenderCache] 写入缓存失败: {e}")
+
+
+async def render_cached(data: PresentationData, theme: str = "academic", images: dict = None, prefetch=None) -> str:
+    """
+    带缓存的渲染，返回文件名。参数同 render_pool.render_pptx_async。
+    有图片缺失的渲染结果不写入缓存。
+    :param prefetch: 可选，无参 async 函数，返回要交给渲染进程的图片；只在缓存未命中、真正需要渲染时调用
+    """
+    key = make_key(data, theme)
+    filename = lookup(key)
+    if filename:
+        stats["hits"] += 1
+        print(f"💾 [RenderCache] 命中，复用已有文件: {filename}")
+        return filename
+
+    # 同样的渲染正在进行，等它完成
+    pending = _inflight.get(key)
+    if pending is not None:
+        stats["shared"] += 1
+        print("🔗 [RenderCache] 相同渲染进行中，等待共享结果")
+        return await asyncio.shield(pending)
+
+    stats["misses"] += 1
+    future = asyncio.get_running_loop().create_future()
+    _inflight[key] = future
+    try:
+        if prefetch is not None:
+            images = await prefetch()
+        filename, missing = await render_pptx_detailed(data, theme, images=images)
+        if missing:
+            # 有图片没下载到: 这次的文件照常返回，但不缓存，下次相同请求还有机会补上图片
+            print(f"   ⚠️ [RenderCache] {len(missing)} 张图片缺失，本次结果不缓存")
+        else:
+            store(key, filename)
+        future.set_result(filename)
+        return filename
+    except asyncio.CancelledError:
+        future.cancel()
+        raise
+    except Exception as e:
+        future.set_exception(e)
+        # 没有其他人等待时，避免 "Future exception was never retrieved" 警告
+        future.exception()
+        raise
+    finally:
+        _inflight.pop(key, None)
@@ -0,0 +1,194 @@
+import asyncio
+import multiprocessing
+import os
+import signal
+import sys
+import threading
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from models import PresentationData
+import telemetry
+
+# === 渲染进程池配置 (可通过 .env 覆盖) ===
+# RENDER_WORKERS: 同时渲染的进程数
+# RENDER_TIMEOUT: 单个 PPT 渲染的最长时间 (秒，从子进程开始执行算起，不含排队)
+# RENDER_MAX_TASKS_PER_CHILD: 每个子进程处理多少个任务后重启 (防止内存泄漏)
+RENDER_WORKERS = int(os.getenv("RENDER_WORKERS", max(1, (os.cpu_count() or 2) - 1)))
+RENDER_TIMEOUT = float(os.getenv("RENDER_TIMEOUT", 120))
+RENDER_MAX_TASKS_PER_CHILD = int(os.getenv("RENDER_MAX_TASKS_PER_CHILD", 20))
+
+_executor = None
+_generation = 0              # 进程池每重建一次加 1
+_killed_generations = set()  # 因为超时被我们主动杀掉过子进程的进程池
+_start_queue = None          # 子进程开始执行任务时报告 (token, pid)
+_pending_starts = {}         # token -> (loop, asyncio.Future)，收到开始通知后填入 pid
+
+
+class RenderTimeoutError(Exception):
+    """渲染超过 RENDER_TIMEOUT 仍未完成"""
+
+
+def _get_executor() -> ProcessPoolExecutor:
+    global _executor, _start_queue
+    if _executor is None:
+        kwargs = {"max_workers": RENDER_WORKERS, "initializer": _init_worker}
+        ctx = multiprocessing.get_context()
+        # max_tasks_per_child 需要 Python 3.11+，低版本只能不回收
+        if sys.version_info >= (3, 11) and RENDER_MAX_TASKS_PER_CHILD > 0:
+            kwargs["max_tasks_per_child"] = RENDER_MAX_TASKS_PER_CHILD
+            # 回收子进程只支持 spawn；开始通知队列必须和进程池用同一个 context 创建
+            ctx = multiprocessing.get_context("spawn")
+        _start_queue = ctx.Queue()
+        threading.Thread(target=_listen_starts, args=(_start_queue,), daemon=True).start()
+        _executor = ProcessPoolExecutor(mp_context=ctx, initargs=(_start_queue,), **kwargs)
+        print(f"⚙️ [RenderPool] 启动渲染进程池: workers={RENDER_WORKERS}, recycle={RENDER_MAX_TASKS_PER_CHILD}")
+    return _executor
+
+
+def _listen_starts(queue):
+    """主进程里的后台线程: 把子进程的 "任务开始" 通知转给等待中的协程"""
+    while True:
+        try:
+            message = queue.get()
+        except (EOFError, OSError):
+            return
+        if message is None:
+            return
+        token, pid = message
+        pending = _pending_starts.get(token)
+        if pending is not None:
+            loop, started = pending
+            loop.call_soon_threadsafe(lambda f=started, p=pid: f.done() or f.set_result(p))
+
+
+def _reset(generation: int):
+    """丢弃已损坏的进程池 (同一个进程池只重建一次)"""
+    global _executor, _generation
+    if generation != _generation or _executor is None:
+        return
+    executor, queue = _executor, _start_queue
+    _executor = None
+    _generation += 1
+    executor.shutdown(wait=False, cancel_futures=True)
+    queue.put(None)
+
+
+def _kill_worker(pid: int, generation: int):
+    """
+    超时的任务所在的子进程直接杀掉，而不是让它继续占着名额。
+    ProcessPoolExecutor 发现子进程死亡后会把整个池标记为损坏，同池里其他进行中的任务由 run_in_pool 重新提交。
+    """
+    _killed_generations.add(generation)
+    try:
+        os.kill(pid, getattr(signal, "SIGKILL", signal.SIGTERM))
+        print(f"🔪 [RenderPool] 已终止超时的渲染进程 pid={pid}")
+    except OSError:
+        pass
+
+
+def _init_worker(start_queue=None):
+    global _start_queue
+    _start_queue = start_queue
+    # 子进程启动时预解析模板，之后每次渲染只需拷贝
+    from ppt_engine import preload_templates
+    preload_templates()
+
+
+def _run_task(token: str, fn, args: tuple):
+    # 在子进程里执行: 先报告任务开始 (主进程从这一刻开始计超时)，再执行真正的函数
+    if _start_queue is not None:
+        _start_queue.put((token, os.getpid()))
+    return fn(*args)
+
+
+def _render_job(data: PresentationData, theme: str, images: dict = None, request_id: str = None):
+    # 在子进程里执行，延迟导入渲染引擎
+    # 返回 (文件名, 错误信息, 本次渲染产生的指标, 缺失的图片)，指标由主进程合并后在 /metrics 暴露
+    from ppt_engine import create_pptx_file, LAYOUT_CONFIG
+    telemetry.request_id_var.set(request_id)
+    missing = []
+    # 指标标签只用已知主题，任意字符串会让时间序列无限增长
+    theme_label = theme if theme in LAYOUT_CONFIG else "other"
+    try:
+        with telemetry.stage("render", theme=theme_label, log_fields={"slides": len(data.slides)}):
+            filename = create_pptx_file(data, theme, images=images, missing=missing)
+    except Exception as e:
+        # 失败时也把已经记录的指标带回去
+        return None, f"{type(e).__name__}: {e}", telemetry.drain(), missing
+    return filename, None, telemetry.drain(), missing
+
+
+async def run_in_pool(fn, *args, timeout: float = None):
+    """
+    把同步函数丢到渲染进程池里执行，并等待结果。
+    超时从子进程真正开始执行时计算，排队等待空闲进程的时间不计入；超时后杀掉该子进程。
+    :param fn: 可 pickle 的模块级函数
+    :param timeout: 超时时间 (秒)，默认 RENDER_TIMEOUT
+    """
+    timeout = timeout or RENDER_TIMEOUT
+    loop = asyncio.get_running_loop()
+    for attempt in range(2):
+        generation = _generation
+        token = uuid.uuid4().hex
+        started = loop.create_future()
+        _pending_starts[token] = (loop, started)
+        try:
+            future = loop.run_in_executor(_get_executor(), _run_task, token, fn, args)
+            # 被放弃的 future 之后会以 BrokenProcessPool 结束，这里吞掉，避免 "exception was never retrieved"
+            future.add_done_callback(lambda f: f.cancelled() or f.exception())
+            await asyncio.wait({future, started}, return_when=asyncio.FIRST_COMPLETED)
+            if future.done():
+                return future.result()
+            pid = started.result()
+            try:
+                return await asyncio.wait_for(asyncio.shield(future), timeout=timeout)
+            except asyncio.TimeoutError:
+                print(f"⏰ [RenderPool] 任务超时 ({timeout}s)")
+                _kill_worker(pid, generation)
+                _reset(generation)
+                raise RenderTimeoutError(f"render exceeded {timeout}s")
+        except BrokenProcessPool:
+            # 子进程意外退出 (OOM / 崩溃) 或被我们因超时杀掉，重建进程池供后续请求使用
+            print("❌ [RenderPool] 进程池已损坏，正在重建...")
+            _reset(generation)
+            if attempt == 0 and generation in _killed_generations:
+                # 是别的任务超时连带的，本任务重新提交一次 (计时重新开始)
+                continue
+            raise
+        finally:
+            _pending_starts.pop(token, None)
+
+
+async def render_pptx_detailed(data: PresentationData, theme: str = "academic", images: dict = None, timeout: float = None):
+    """
+    同 render_pptx_async，但同时返回缺失图片的 prompt 列表: (文件名, [缺失的 image_prompt])
+    """
+    filename, error, metrics, missing = await run_in_pool(_render_job, data, theme, images, telemetry.request_id_var.get(), timeout=timeout)
+    telemetry.merge(metrics)
+    if error:
+        raise RuntimeError(f"render failed: {error}")
+    return filename, missing
+
+
+async def render_pptx_async(data: PresentationData, theme: str = "academic", images: dict = None, timeout: float = None) -> str:
+    """
+    异步渲染 PPT，返回生成的文件名
+    :param images: 已经下载好的图片 (prefetch_images 的结果)，不传时由子进程自行下载
+    """
+    filename, _ = await render_pptx_detailed(data, theme, images=images, timeout=timeout)
+    return filename
+
+
+def _noop() -> int:
+    return os.getpid()
+
+
+async def warmup(workers: int = None):
+    """提前拉起渲染子进程 (子进程启动时会预加载模板)，避免第一个请求承担进程启动开销"""
+    count = min(workers or RENDER_WORKERS, RENDER_WORKERS)
+    await asyncio.gather(*(run_in_pool(_noop) for _ in range(count)))
+
+
+def shutdown():
+    _reset(_generation)
@@ -0,0 +1,106 @@
+import asyncio
+import os
+import time
+
+# === 生成文件的生命周期管理 ===
+# 1. 分片存储: generated_ppts/<文件名前两位>/<文件名>，避免单个目录下文件过多
+# 2. 过期清理: 超过 ARTIFACT_TTL 的文件由后台清理任务删除
+# 3. 容量上限: 总大小超过 ARTIFACT_MAX_BYTES 时，从最旧的开始删除
+# 删除时留下一个空的 .gone 标记文件，下载接口据此返回 410 (而不是 404)，
+# 标记文件本身在 TOMBSTONE_TTL 后清掉。
+
+OUTPUT_DIR = "generated_ppts"
+ARTIFACT_TTL = float(os.getenv("ARTIFACT_TTL", 24 * 3600))
+ARTIFACT_MAX_BYTES = int(os.getenv("ARTIFACT_MAX_BYTES", 2 * 1024 * 1024 * 1024))
+SWEEP_INTERVAL = float(os.getenv("SWEEP_INTERVAL", 300))
+TOMBSTONE_TTL = float(os.getenv("TOMBSTONE_TTL", 7 * 24 * 3600))
+
+GONE_SUFFIX = ".gone"
+
+
+def artifact_path(filename: str) -> str:
+    """文件名 -> 分片后的完整路径 (目录不存在时自动创建)"""
+    shard_dir = os.path.join(OUTPUT_DIR, filename[:2])
+    os.makedirs(shard_dir, exist_ok=True)
+    return os.path.join(shard_dir, filename)
+
+
+def lookup(filename: str):
+    """
+    查找可下载的文件。
+    :return: ("ok", 路径) / ("gone", None) 已过期删除 / ("missing", None) 从未存在
+    """
+    path = os.path.join(OUTPUT_DIR, filename[:2], filename)
+    if os.path.isfile(path):
+        return "ok", path
+    if os.path.exists(path + GONE_SUFFIX):
+        return "gone", None
+    return "missing", None
+
+
+def _remove(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        return False
+    # 留下墓碑，之后访问返回 410
+    open(path + GONE_SUFFIX, "w").close()
+    return True
+
+
+def sweep() -> dict:
+    """执行一次清理，返回删除统计"""
+    now = time.time()
+    artifacts, tombstones = [], []
+    for root, _, files in os.walk(OUTPUT_DIR):
+        for name in files:
+            path = os.path.join(root, name)
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                continue
+            if name.endswith(GONE_SUFFIX):
+                tombstones.append((st.st_mtime, path))
+            else:
+                artifacts.append((st.st_mtime, st.st_size, path))
+
+    expired = evicted = 0
+    artifacts.sort()
+    total = sum(size for _, size, _ in artifacts)
+    kept = []
+    # 1. 删除过期文件
+    for mtime, size, path in artifacts:
+        if now - mtime > ARTIFACT_TTL:
+            if _remove(path):
+                expired += 1
+            total -= size
+        else:
+            kept.append((mtime, size, path))
+    # 2. 超出容量时从最旧的开始删
+    for mtime, size, path in kept:
+        if total <= ARTIFACT_MAX_BYTES:
+            break
+        if _remove(path):
+            evicted += 1
+        total -= size
+    # 3. 清理太旧的墓碑
+    for mtime, path in tombstones:
+        if now - mtime > TOMBSTONE_TTL:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    if expired or evicted:
+        print(f"🧹 [Retention] 清理完成: 过期 {expired} 个, 超额淘汰 {evicted} 个, 剩余 {total / 1024 / 1024:.1f} MB")
+    return {"expired": expired, "evicted": evicted, "total_bytes": total}
+
+
+async def sweeper_loop():
+    """后台定时清理 (在 FastAPI lifespan 里启动)"""
+    while True:
+        try:
+            await asyncio.to_thread(sweep)
+        except Exception as e:
+            print(f"⚠️ [Retention] 清理出错: {e}")
+        await asyncio.sleep(SWEEP_INTERVAL)
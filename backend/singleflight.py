@@ -0,0 +1,192 @@
+import asyncio
+import hashlib
+import os
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+import telemetry
+
+try:
+    import fcntl
+except ImportError:  # Windows: 只做进程内合并
+    fcntl = None
+
+# === 相同请求合并 (single-flight) ===
+# 同一时刻多个相同的上游请求 (同主题的大纲、同 prompt 的配图) 只真正发出一次:
+# 1. 进程内: 第一个调用方 (leader) 执行，其余调用方等待同一个 Future / Event，直接共享结果 (包括异常)
+# 2. 跨进程 (多个 uvicorn worker / 渲染进程): leader 执行期间持有 SINGLEFLIGHT_DIR 下该 key 的文件锁 (flock)，
+#    其他进程拿到锁后先调用 lookup() 查共享存储 (大纲缓存 / 图片磁盘缓存)，leader 已写入就直接用，不再请求上游
+# 进程崩溃时操作系统自动释放 flock，不会死锁；等锁超过 SINGLEFLIGHT_WAIT 秒就放弃合并、自己请求。
+# 锁文件在释放前删除，不会越积越多；拿到锁后核对 inode，锁住的是已被删除的旧文件时重新打开再抢。
+# 结果对象在多个调用方之间共享，调用方不要修改它。
+
+SINGLEFLIGHT_ENABLED = os.getenv("SINGLEFLIGHT", "1") == "1"
+SINGLEFLIGHT_DIR = os.getenv("SINGLEFLIGHT_DIR", os.path.join("cache", "locks"))
+SINGLEFLIGHT_WAIT = float(os.getenv("SINGLEFLIGHT_WAIT", 180))
+SINGLEFLIGHT_POLL = 0.05
+
+_async_inflight = {}  # key -> asyncio.Task
+_sync_inflight = {}   # key -> [threading.Event, result, exception]
+_sync_lock = threading.Lock()
+
+
+def _lock_path(key: str) -> str:
+    return os.path.join(SINGLEFLIGHT_DIR, hashlib.sha256(key.encode("utf-8")).hexdigest()[:32] + ".lock")
+
+
+def _try_lock(key: str, f):
+    """
+    尝试加锁一次，返回 (文件对象, 是否拿到锁)。
+    上一个持有者释放时会删除锁文件，等待者此时锁住的是已删除的旧 inode: 换成新打开的文件，下次再抢
+    """
+    try:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        return f, False
+    try:
+        if os.fstat(f.fileno()).st_ino == os.stat(_lock_path(key)).st_ino:
+            return f, True
+    except OSError:
+        pass
+    f.close()  # 关闭即释放旧 inode 上的锁
+    return _open_lock(key), False
+
+
+def _open_lock(key: str):
+    try:
+        os.makedirs(SINGLEFLIGHT_DIR, exist_ok=True)
+        return open(_lock_path(key), "a+b")
+    except OSError as e:
+        print(f"   ⚠️ [SingleFlight] 无法创建锁文件，跳过跨进程合并: {e}")
+        return None
+
+
+def _release(key: str, f):
+    # 先删除再解锁: 删除时仍持有锁，不会删掉别人刚创建并锁住的新文件
+    try:
+        os.remove(_lock_path(key))
+    except OSError:
+        pass
+    try:
+        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+    finally:
+        f.close()
+
+
+@asynccontextmanager
+async def _process_lock_async(key: str):
+    """跨进程文件锁 (异步轮询，不占线程)，产出是否等待过别的进程"""
+    f = _open_lock(key) if fcntl is not None else None
+    if f is None:
+        yield False
+        return
+    waited, deadline = False, time.monotonic() + SINGLEFLIGHT_WAIT
+    f, locked = _try_lock(key, f)
+    while f is not None and not locked and time.monotonic() < deadline:
+        waited = True
+        await asyncio.sleep(SINGLEFLIGHT_POLL)
+        f, locked = _try_lock(key, f)
+    try:
+        yield waited
+    finally:
+        if locked:
+            _release(key, f)
+        elif f is not None:
+            f.close()
+
+
+@contextmanager
+def _process_lock(key: str):
+    """跨进程文件锁 (同步版，给下载线程用)"""
+    f = _open_lock(key) if fcntl is not None else None
+    if f is None:
+        yield False
+        return
+    waited, deadline = False, time.monotonic() + SINGLEFLIGHT_WAIT
+    f, locked = _try_lock(key, f)
+    while f is not None and not locked and time.monotonic() < deadline:
+        waited = True
+        time.sleep(SINGLEFLIGHT_POLL)
+        f, locked = _try_lock(key, f)
+    try:
+        yield waited
+    finally:
+        if locked:
+            _release(key, f)
+        elif f is not None:
+            f.close()
+
+
+def _shared(kind: str, scope: str):
+    telemetry.inc("ppt_singleflight_shared_total", kind=kind, scope=scope)
+
+
+# === 1. 异步版 (LLM 大纲) ===
+async def run(key: str, fn, lookup=None, kind: str = "outline"):
+    """
+    合并相同 key 的并发调用。
+    :param fn: 无参 async 函数，真正请求上游 (并把结果写进共享存储)
+    :param lookup: 无参同步函数，从共享存储读取结果，没有返回 None；拿到跨进程锁后调用
+    """
+    if not SINGLEFLIGHT_ENABLED:
+        return await fn()
+    task = _async_inflight.get(key)
+    if task is not None:
+        _shared(kind, "process")
+        # shield: 某个调用方被取消 (客户端断开) 不影响其他等待者
+        return await asyncio.shield(task)
+
+    async def lead():
+        try:
+            async with _process_lock_async(key) as waited:
+                # 锁是别的进程刚释放的，或者调用方检查缓存之后结果才写入: 先查一次共享存储
+                result = lookup() if lookup is not None else None
+                if result is not None:
+                    _shared(kind, "worker" if waited else "store")
+                    return result
+                return await fn()
+        finally:
+            _async_inflight.pop(key, None)
+
+    task = asyncio.ensure_future(lead())
+    _async_inflight[key] = task
+    return await asyncio.shield(task)
+
+
+# === 2. 同步版 (图片下载线程) ===
+def run_sync(key: str, fn, lookup=None, kind: str = "image"):
+    """run 的线程版: 同一进程里相同 key 的线程等待第一个线程的结果"""
+    if not SINGLEFLIGHT_ENABLED:
+        return fn()
+    with _sync_lock:
+        call = _sync_inflight.get(key)
+        leader = call is None
+        if leader:
+            call = _sync_inflight[key] = [threading.Event(), None, None]
+    if not leader:
+        _shared(kind, "process")
+        call[0].wait()
+        if call[2] is not None:
+            raise call[2]
+        return call[1]
+
+    try:
+        with _process_lock(key) as waited:
+            result = lookup() if lookup is not None else None
+            if result is not None:
+                _shared(kind, "worker" if waited else "store")
+            else:
+                result = fn()
+        call[1] = result
+        return result
+    except Exception as e:
+        call[2] = e
+        raise
+    finally:
+        with _sync_lock:
+            _sync_inflight.pop(key, None)
+        call[0].set()
+
+
+def get_stats() -> dict:
+    return {"inflight": len(_async_inflight) + len(_sync_inflight), "cross_process": fcntl is not None}
@@ -0,0 +1,191 @@
+import hashlib
+import io
+import json
+import os
+import threading
+import uuid
+import zipfile
+from lxml import etree
+from pptx.opc.constants import RELATIONSHIP_TYPE as RT
+from pptx.oxml import parse_xml
+
+# === 单页渲染片段缓存 (增量重渲染) ===
+# 每页渲染完后把 "幻灯片 XML + 引用的图片" 存成一个片段，key = hash(渲染器版本 + Slide 内容 + 主题 + 模板版本)。
+# 用户只改了一两页再渲染时，没变的页直接从片段还原，只有改动 / 新增的页才重新渲染 (也不用重新下载图片)。
+# 片段以 zip 形式存在磁盘上，所有渲染进程共享；总大小超过 FRAGMENT_CACHE_MAX_BYTES 时按 LRU 淘汰。
+# 含图表等其他关联部件的页面不缓存 (图表自带内嵌 Excel，还原成本和重新渲染差不多)。
+
+FRAGMENT_CACHE_DIR = os.getenv("FRAGMENT_CACHE_DIR", os.path.join("cache", "fragments"))
+FRAGMENT_CACHE_MAX_BYTES = int(os.getenv("FRAGMENT_CACHE_MAX_BYTES", 300 * 1024 * 1024))
+
+# 渲染代码 (ppt_engine / slide_fragments) 的输出格式版本，参与片段缓存和整份渲染缓存的 key。
+# 改动了渲染逻辑 (版式、字体、图片处理等) 时递增，旧的缓存自然失效，不会还原出旧版本的页面。
+# 影响渲染结果的配置 (AUTOFIT_* / IMAGE_* / TABLE_* / CHART_* 等) 由 renderer_version() 一并算进 key，改配置不用手动递增。
+RENDERER_VERSION = "1"
+
+R_NS = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+
+stats = {"hits": 0, "misses": 0, "writes": 0, "evictions": 0}
+_lock = threading.Lock()
+_total_bytes = None  # 当前缓存体积 (首次写入时扫描目录得到)
+_renderer_version = None
+
+
+def renderer_version() -> str:
+    """RENDERER_VERSION + 当前生效的渲染配置的摘要 (配置在进程启动时读取，结果只算一次)"""
+    global _renderer_version
+    if _renderer_version is None:
+        # 延迟导入: ppt_engine 反过来依赖本模块
+        import chart_engine
+        import image_processing
+        import ppt_engine
+        import table_engine
+        settings = {
+            "AUTOFIT_MIN_SIZE": ppt_engine.AUTOFIT_MIN_SIZE,
+            "AUTOFIT_MAX_SIZE": ppt_engine.AUTOFIT_MAX_SIZE,
+            "IMAGE_DPI": image_processing.IMAGE_DPI,
+            "IMAGE_JPEG_QUALITY": image_processing.IMAGE_JPEG_QUALITY,
+            "TABLE_HEADER_SIZE": table_engine.TABLE_HEADER_SIZE,
+            "TABLE_BODY_SIZE": table_engine.TABLE_BODY_SIZE,
+            "TABLE_MIN_ROW_HEIGHT": table_engine.TABLE_MIN_ROW_HEIGHT,
+            "TABLE_BOTTOM_MARGIN": table_engine.TABLE_BOTTOM_MARGIN,
+            "TABLE_CONTINUED_SUFFIX": table_engine.TABLE_CONTINUED_SUFFIX,
+            "CHART_MAX_POINTS": chart_engine.CHART_MAX_POINTS,
+            "CHART_PIE_MAX_SLICES": chart_engine.CHART_PIE_MAX_SLICES,
+            "TEXT_FONT_PATH": os.getenv("TEXT_FONT_PATH"),
+        }
+        digest = hashlib.sha256(json.dumps(settings, sort_keys=True).encode("utf-8")).hexdigest()[:12]
+        _renderer_version = f"{RENDERER_VERSION}-{digest}"
+    return _renderer_version
+
+
+def make_key(slide_data, theme: str, template_path: str) -> str:
+    try:
+        st = os.stat(template_path)
+        version = f"{st.st_mtime_ns}-{st.st_size}"
+    except (OSError, TypeError):
+        version = "blank"
+    canonical = json.dumps(slide_data.model_dump(mode="json"), sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(f"{renderer_version()}|{theme}|{version}|{canonical}".encode("utf-8")).hexdigest()
+
+
+def _path(key: str) -> str:
+    return os.path.join(FRAGMENT_CACHE_DIR, key[:2], f"{key}.zip")
+
+
+def has(key: str) -> bool:
+    return os.path.exists(_path(key))
+
+
+# === 1. 保存片段 ===
+def capture(key: str, slide, layout_idx: int):
+    """把刚渲染好的一页存成片段；页面引用了图片以外的部件时不缓存"""
+    global _total_bytes
+    images = {}
+    for r_id, rel in slide.part.rels.items():
+        if rel.reltype == RT.SLIDE_LAYOUT:
+            continue
+        if rel.reltype != RT.IMAGE or rel.is_external:
+            return
+        images[r_id] = rel.target_part.blob
+
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w", zipfile.ZIP_DEFLATED) as zf:
+        zf.writestr("meta.json", json.dumps({"layout_idx": layout_idx, "images": list(images)}))
+        zf.writestr("slide.xml", etree.tostring(slide.part._element))
+        for r_id, blob in images.items():
+            zf.writestr(f"media/{r_id}", blob)
+    content = buf.getvalue()
+
+    path = _path(key)
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        print(f"   ⚠️ [Fragment] 写入缓存失败: {e}")
+        return
+    with _lock:
+        stats["writes"] += 1
+        if _total_bytes is None:
+            _total_bytes = sum(size for _, size, _ in _scan())
+        else:
+            _total_bytes += len(content)
+        if _total_bytes > FRAGMENT_CACHE_MAX_BYTES:
+            _evict()
+
+
+# === 2. 还原片段 ===
+def restore(key: str, prs) -> bool:
+    """把片段追加到 prs 末尾，成功返回 True"""
+    path = _path(key)
+    try:
+        with zipfile.ZipFile(path) as zf:
+            meta = json.loads(zf.read("meta.json"))
+            xml = zf.read("slide.xml")
+            blobs = {r_id: zf.read(f"media/{r_id}") for r_id in meta["images"]}
+        os.utime(path)  # 刷新 LRU 时间
+    except (OSError, KeyError, ValueError, zipfile.BadZipFile):
+        with _lock:
+            stats["misses"] += 1
+        return False
+
+    # 新建一页 (带上版式关系)，再用片段 XML 替换其内容
+    slide = prs.slides.add_slide(prs.slide_layouts[meta["layout_idx"]])
+    part = slide.part
+    rid_map = {}
+    for old_rid, blob in blobs.items():
+        image_part = part.package.get_or_add_image_part(io.BytesIO(blob))
+        rid_map[old_rid] = part.relate_to(image_part, RT.IMAGE)
+
+    element = parse_xml(xml)
+    if rid_map:
+        for el in element.iter():
+            for attr, value in el.attrib.items():
+                if attr.startswith(f"{{{R_NS}}}") and value in rid_map:
+                    el.set(attr, rid_map[value])
+    part._element = element
+    # SlidePart.slide 是惰性属性，丢掉指向旧 XML 的缓存对象
+    part.__dict__.pop("slide", None)
+
+    with _lock:
+        stats["hits"] += 1
+    return True
+
+
+def _scan():
+    entries = []
+    for root, _, files in os.walk(FRAGMENT_CACHE_DIR):
+        for name in files:
+            p = os.path.join(root, name)
+            try:
+                st = os.stat(p)
+            except FileNotFoundError:
+                continue
+            entries.append((st.st_mtime, st.st_size, p))
+    return entries
+
+
+def _evict():
+    """按 mtime 从旧到新删除，直到低于容量的 90%"""
+    global _total_bytes
+    entries = sorted(_scan())
+    total = sum(size for _, size, _ in entries)
+    target = FRAGMENT_CACHE_MAX_BYTES * 0.9
+    for _, size, p in entries:
+        if total <= target:
+            break
+        try:
+            os.remove(p)
+            total -= size
+            stats["evictions"] += 1
+        except FileNotFoundError:
+            pass
+    _total_bytes = total
+
+
+def get_stats() -> dict:
+    with _lock:
+        return dict(stats)
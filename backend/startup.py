@@ -0,0 +1,90 @@
+import asyncio
+import os
+import time
+import telemetry
+
+# === 启动预热 & 就绪探针 ===
+# 重量级依赖 (openai / python-pptx / requests) 在 API 进程里都是延迟导入的，进程可以很快开始监听端口。
+# 开启 STARTUP_WARMUP 时，服务启动后在后台依次预热:
+#   imports (渲染引擎 + OpenAI 客户端) -> templates -> fonts -> mock_data -> models -> render_pool
+# 全部完成后 /ready 才返回 200；关闭预热时启动即就绪 (第一个请求自己承担加载开销)。
+# 每个阶段的耗时记录在 state["stages"] 里，同时写进 /metrics 和日志。
+
+STARTUP_WARMUP = os.getenv("STARTUP_WARMUP", "1") == "1"
+# 预热时顺便拉起的渲染进程数 (0 = 不预热进程池)
+WARMUP_RENDER_WORKERS = int(os.getenv("WARMUP_RENDER_WORKERS", 1))
+
+state = {"ready": False, "stages": {}, "error": None}
+
+
+def record(stage: str, seconds: float):
+    state["stages"][stage] = round(seconds, 4)
+    telemetry.observe(telemetry.STAGE_METRIC, seconds, stage=f"startup_{stage}", outcome="ok")
+
+
+async def _timed(stage: str, fn, *args):
+    start = time.perf_counter()
+    result = await asyncio.to_thread(fn, *args)
+    record(stage, time.perf_counter() - start)
+    return result
+
+
+def _warm_imports():
+    import ppt_engine  # noqa: F401  (python-pptx / lxml / requests / PIL)
+    from llm_service import get_client
+    get_client()
+
+
+def _warm_templates():
+    from ppt_engine import preload_templates
+    preload_templates()
+
+
+def _warm_fonts():
+    from text_metrics import get_metrics
+    metrics = get_metrics("Microsoft YaHei")
+    # 常用 ASCII 字符的字宽先查一遍
+    metrics.text_width("".join(chr(c) for c in range(32, 127)))
+
+
+def _warm_mock_data():
+    from llm_service import _read_mock_data
+    _read_mock_data()
+
+
+def _warm_models(app):
+    from llm_service import _load_mock_dict
+    from models import PresentationData
+    # 第一次校验 / 序列化时 pydantic 才会构建校验器，先用 mock 数据走一遍
+    data = PresentationData(**_load_mock_dict("warmup"))
+    data.model_dump_json()
+    # /docs 用到的 OpenAPI schema 也是首次访问时才生成
+    app.openapi()
+
+
+async def warmup(app):
+    """后台执行所有预热阶段，完成后标记就绪"""
+    import render_pool
+    started = time.perf_counter()
+    try:
+        await _timed("imports", _warm_imports)
+        await _timed("templates", _warm_templates)
+        await _timed("fonts", _warm_fonts)
+        await _timed("mock_data", _warm_mock_data)
+        await _timed("models", _warm_models, app)
+        if WARMUP_RENDER_WORKERS > 0:
+            start = time.perf_counter()
+            await render_pool.warmup(WARMUP_RENDER_WORKERS)
+            record("render_pool", time.perf_counter() - start)
+    except Exception as e:
+        # 预热失败不影响服务，只是首个请求会慢一些
+        state["error"] = f"{type(e).__name__}: {e}"
+        print(f"⚠️ [Startup] 预热失败: {e}")
+    record("warmup_total", time.perf_counter() - started)
+    state["ready"] = True
+    telemetry.log("startup_ready", stages=state["stages"], error=state["error"])
+    print(f"🟢 [Startup] 预热完成，服务就绪: {state['stages']}")
+
+
+def mark_ready():
+    state["ready"] = True
@@ -0,0 +1,127 @@
+import os
+import re
+from xml.sax.saxutils import escape, quoteattr
+from pptx.oxml import parse_xml
+from pptx.util import Emu, Pt, Inches
+from text_metrics import count_text_lines
+
+# === 表格引擎 ===
+# 逐个单元格通过 python-pptx 代理对象设置文字 / 字号 / 字体很慢 (每个属性都是一次 XML 查找和改写)，
+# 这里改为: 表头 / 数据单元格各预先生成一个带样式的 XML 模板，所有行拼成一段字符串后一次性解析插入。
+# 行高用 text_metrics 按列宽估算换行，放不下的行自动拆到续页 (每个续页重复表头)。
+
+TABLE_HEADER_SIZE = float(os.getenv("TABLE_HEADER_SIZE", 18))
+TABLE_BODY_SIZE = float(os.getenv("TABLE_BODY_SIZE", 16))
+TABLE_MIN_ROW_HEIGHT = Inches(float(os.getenv("TABLE_MIN_ROW_HEIGHT", 0.4)))
+TABLE_BOTTOM_MARGIN = Inches(0.5)
+TABLE_CONTINUED_SUFFIX = os.getenv("TABLE_CONTINUED_SUFFIX", " (cont.)")
+
+HEADER_FILL = "0070C0"  # 经典蓝
+HEADER_COLOR = "FFFFFF"
+
+# 单元格默认内边距: 左右 0.1 英寸，上下 0.05 英寸
+CELL_MARGIN_X = Inches(0.1)
+CELL_MARGIN_Y = Inches(0.05)
+LINE_SPACING = 1.2
+
+A_NS = "http://schemas.openxmlformats.org/drawingml/2006/main"
+
+# XML 1.0 不允许的控制字符
+_INVALID_XML_CHARS = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f]")
+
+
+def _cell_template(size_pt: float, font_name: str, bold: bool = False, color: str = None, fill: str = None) -> tuple:
+    """生成 (单元格模板, 段落模板)，分别在 {paragraphs} / {text} 处填入内容"""
+    font = quoteattr(font_name)
+    bold_attr = ' b="1"' if bold else ""
+    color_xml = f'<a:solidFill><a:srgbClr val="{color}"/></a:solidFill>' if color else ""
+    r_pr = (f'<a:rPr sz="{int(size_pt * 100)}"{bold_attr}>'
+            f'{color_xml}<a:latin typeface={font}/><a:ea typeface={font}/></a:rPr>')
+    tc_pr = f'<a:tcPr><a:solidFill><a:srgbClr val="{fill}"/></a:solidFill></a:tcPr>' if fill else "<a:tcPr/>"
+    # 用 str.replace 填充而不是 format，避免字体名里的花括号出问题
+    return ("<a:tc><a:txBody><a:bodyPr/><a:lstStyle/>{paragraphs}</a:txBody>" + tc_pr + "</a:tc>",
+            "<a:p><a:r>" + r_pr + "<a:t>{text}</a:t></a:r></a:p>")
+
+
+def _fill(template, text) -> str:
+    cell, para = template
+    text = _INVALID_XML_CHARS.sub("", str(text))
+    paragraphs = "".join(para.replace("{text}", escape(line)) for line in text.split("\n"))
+    return cell.replace("{paragraphs}", paragraphs)
+
+
+# === 1. 行高估算 ===
+def estimate_row_height(cells: list, col_width: int, size_pt: float, font_name: str) -> int:
+    """一行里最高的单元格决定行高 (EMU)"""
+    text_width_pt = Emu(col_width - 2 * CELL_MARGIN_X).pt
+    lines = max((count_text_lines(c, font_name, size_pt, text_width_pt) for c in cells), default=1)
+    height = Pt(lines * size_pt * LINE_SPACING) + 2 * CELL_MARGIN_Y
+    return max(int(height), TABLE_MIN_ROW_HEIGHT)
+
+
+def paginate(header_height: int, row_heights: list, available_height: int) -> list:
+    """
+    按可用高度把数据行分页，返回 [(起始行, 结束行)]。每页至少放一行 (单行超高时只能溢出)。
+    """
+    pages = []
+    start, used = 0, header_height
+    for i, h in enumerate(row_heights):
+        if i > start and used + h > available_height:
+            pages.append((start, i))
+            start, used = i, header_height
+        used += h
+    pages.append((start, len(row_heights)))
+    return pages
+
+
+# === 2. 批量生成表格 ===
+def _add_table(slide, header_xml: str, row_xmls: list, heights: list, n_cols: int, left, top, width):
+    """先用 python-pptx 建一个 1 行的表格 (拿到 graphicFrame / 表格样式)，再整体替换所有行"""
+    shape = slide.shapes.add_table(1, n_cols, left, top, width, sum(heights))
+    tbl = shape._element.graphic.graphicData.tbl
+    for tr in tbl.tr_lst:
+        tbl.remove(tr)
+    rows = [header_xml] + row_xmls
+    xml = f'<a:tbl xmlns:a="{A_NS}">' + "".join(
+        f'<a:tr h="{h}">{cells}</a:tr>' for h, cells in zip(heights, rows)
+    ) + "</a:tbl>"
+    for tr in list(parse_xml(xml)):
+        tbl.append(tr)
+    return shape
+
+
+def render_table(slide, headers: list, rows: list, left, top, width, font_name: str = "Microsoft YaHei",
+                 continue_slide=None) -> list:
+    """
+    把表格画到 slide 上；放不下时调用 continue_slide() 新建续页继续画 (重复表头)。
+    不传 continue_slide 时所有行都画在当前页。
+    :return: 用到的所有 slide (第一个就是传入的 slide)
+    """
+    n_cols = len(headers)
+    if n_cols == 0:
+        return [slide]
+    col_width = int(width / n_cols)
+    # 行比表头短就补空，长就截掉
+    rows = [(list(r) + [""] * n_cols)[:n_cols] for r in rows]
+
+    header_tpl = _cell_template(TABLE_HEADER_SIZE, font_name, bold=True, color=HEADER_COLOR, fill=HEADER_FILL)
+    body_tpl = _cell_template(TABLE_BODY_SIZE, font_name)
+    header_xml = "".join(_fill(header_tpl, h) for h in headers)
+    row_xmls = ["".join(_fill(body_tpl, v) for v in row) for row in rows]
+
+    header_height = estimate_row_height(headers, col_width, TABLE_HEADER_SIZE, font_name)
+    row_heights = [estimate_row_height(row, col_width, TABLE_BODY_SIZE, font_name) for row in rows]
+
+    if continue_slide is None:
+        pages = [(0, len(rows))]
+    else:
+        slide_height = slide.part.package.presentation_part.presentation.slide_height
+        pages = paginate(header_height, row_heights, slide_height - top - TABLE_BOTTOM_MARGIN)
+
+    slides = []
+    for page_no, (start, end) in enumerate(pages):
+        target = slide if page_no == 0 else continue_slide()
+        _add_table(target, header_xml, row_xmls[start:end], [header_height] + row_heights[start:end],
+                   n_cols, left, top, width)
+        slides.append(target)
+    return slides
@@ -0,0 +1,176 @@
+import bisect
+import contextvars
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+# === 可观测性: 分阶段耗时指标 + 结构化日志 ===
+# - stage("xxx", **labels) 给一个阶段计时，结果记到直方图 ppt_stage_duration_seconds{stage="xxx", ...}
+#   并输出一条带 request_id 的 JSON 日志
+# - inc() 记计数器，render_prometheus() 输出 Prometheus 文本格式 (/metrics)
+# - request_id 用 contextvars 传递；线程池 / 渲染进程里需要显式带过去 (见 ppt_engine / render_pool)
+# 渲染子进程里的指标在每次任务结束时 drain() 出来，随结果返回主进程再 merge()。
+# 标签只放低基数的值 (阶段、布局、来源、结果)，主题 / prompt 等高基数信息只写日志。
+
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")  # json=结构化日志, off=关闭
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+METRICS_BUCKETS = tuple(float(b) for b in os.getenv(
+    "METRICS_BUCKETS", "0.005,0.01,0.025,0.05,0.1,0.25,0.5,1,2.5,5,10,30,60,120").split(","))
+
+STAGE_METRIC = "ppt_stage_duration_seconds"
+HELP = {
+    STAGE_METRIC: "Duration of each pipeline stage in seconds",
+    "ppt_http_request_duration_seconds": "HTTP request latency in seconds (until response headers)",
+    "ppt_http_requests_total": "HTTP requests by route and status code",
+    "ppt_cache_requests_total": "Cache lookups by cache and result",
+}
+
+request_id_var = contextvars.ContextVar("request_id", default=None)
+
+_lock = threading.Lock()
+_histograms = {}  # (name, labels) -> [每个桶的计数..., +Inf 计数, sum]
+_counters = {}    # (name, labels) -> value
+
+logger = logging.getLogger("ppt")
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname.lower(),
+            "event": record.getMessage(),
+            "request_id": getattr(record, "request_id", None),
+            "pid": record.process,
+        }
+        entry.update(getattr(record, "fields", {}))
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+def _setup_logging():
+    if logger.handlers:
+        return
+    logger.propagate = False
+    if LOG_FORMAT == "off":
+        logger.addHandler(logging.NullHandler())
+        return
+    handler = logging.StreamHandler(sys.stdout)
+    handler.setFormatter(JsonFormatter())
+    logger.addHandler(handler)
+    logger.setLevel(LOG_LEVEL)
+
+
+_setup_logging()
+
+
+# === 1. 结构化日志 ===
+def log(event: str, level: int = logging.INFO, **fields):
+    if logger.isEnabledFor(level):
+        logger.log(level, event, extra={"request_id": request_id_var.get(), "fields": fields})
+
+
+# === 2. 指标 ===
+def _key(name: str, labels: dict):
+    return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def observe(name: str, value: float, **labels):
+    """往直方图里记一个值"""
+    key = _key(name, labels)
+    with _lock:
+        hist = _histograms.get(key)
+        if hist is None:
+            hist = _histograms[key] = [0] * (len(METRICS_BUCKETS) + 1) + [0.0]
+        hist[bisect.bisect_left(METRICS_BUCKETS, value)] += 1
+        hist[-1] += value
+
+
+def inc(name: str, value: float = 1, **labels):
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+@contextmanager
+def stage(name: str, level: int = logging.INFO, log_fields: dict = None, **labels):
+    """
+    给一个阶段计时。yield 出的 dict 是指标标签，可以在阶段内部补充 (如 labels["cache"] = "hit")。
+    阶段内抛异常时 outcome=error；捕获了异常但想标记失败时，手动设置 labels["outcome"] = "error"。
+    :param log_fields: 只写进日志、不作为标签的字段
+    """
+    labels = {"stage": name, "outcome": "ok", **labels}
+    start = time.perf_counter()
+    try:
+        yield labels
+    except BaseException:
+        labels["outcome"] = "error"
+        raise
+    finally:
+        duration = time.perf_counter() - start
+        observe(STAGE_METRIC, duration, **labels)
+        log("stage", level, duration_ms=round(duration * 1000, 2), **labels, **(log_fields or {}))
+
+
+def drain() -> dict:
+    """取出并清空当前进程的指标 (渲染子进程把它随结果带回主进程)"""
+    with _lock:
+        snapshot = {"histograms": list(_histograms.items()), "counters": list(_counters.items())}
+        _histograms.clear()
+        _counters.clear()
+    return snapshot
+
+
+def merge(snapshot: dict):
+    with _lock:
+        for key, values in snapshot["histograms"]:
+            hist = _histograms.get(key)
+            if hist is None:
+                _histograms[key] = list(values)
+            else:
+                for i, v in enumerate(values):
+                    hist[i] += v
+        for key, value in snapshot["counters"]:
+            _counters[key] = _counters.get(key, 0) + value
+
+
+# === 3. Prometheus 文本格式 ===
+def _fmt_labels(labels, extra=()):
+    items = list(labels) + list(extra)
+    if not items:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in items)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(items, escaped)) + "}"
+
+
+def render_prometheus() -> str:
+    with _lock:
+        histograms = sorted(_histograms.items())
+        counters = sorted(_counters.items())
+
+    lines = []
+    seen = set()
+
+    def header(name, kind):
+        if name not in seen:
+            seen.add(name)
+            lines.append(f"# HELP {name} {HELP.get(name, name)}")
+            lines.append(f"# TYPE {name} {kind}")
+
+    for (name, labels), hist in histograms:
+        header(name, "histogram")
+        cumulative = 0
+        for bound, count in zip(METRICS_BUCKETS + (float("inf"),), hist[:-1]):
+            cumulative += count
+            le = "+Inf" if bound == float("inf") else f"{bound:g}"
+            lines.append(f"{name}_bucket{_fmt_labels(labels, [('le', le)])} {cumulative}")
+        lines.append(f"{name}_sum{_fmt_labels(labels)} {hist[-1]:.6f}")
+        lines.append(f"{name}_count{_fmt_labels(labels)} {cumulative}")
+
+    for (name, labels), value in counters:
+        header(name, "counter")
+        lines.append(f"{name}{_fmt_labels(labels)} {value:g}")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,189 @@
+import os
+import re
+import unicodedata
+from functools import lru_cache
+
+# === 文本测量引擎 ===
+# 用真实字体文件的字形宽度 (advance width) 估算文字排版，替代 "每个字符 = 0.6 * 字号" 的粗略估算。
+# - 字宽表按字体缓存 (以 1000 单位/em 记录)，不同字号直接线性缩放
+# - 模拟真实换行: 英文按单词换行，中日韩字符可以在任意位置换行
+# - 在连续字号区间里二分查找能放下的最大字号
+# 找不到字体文件时退回到按字符类别的经验宽度表。
+
+UNITS_PER_EM = 1000
+
+# 常见字体的文件名 (按顺序尝试)，可用 TEXT_FONT_PATH 直接指定
+FONT_FILES = {
+    "Microsoft YaHei": ["msyh.ttc", "msyh.ttf", "Microsoft YaHei.ttf"],
+    "Arial": ["arial.ttf", "Arial.ttf", "LiberationSans-Regular.ttf"],
+    "Calibri": ["calibri.ttf", "Calibri.ttf", "Carlito-Regular.ttf"],
+}
+# 兜底字体: 通用无衬线字体，Latin 字宽比雅黑略宽，估算偏保守
+FALLBACK_FONT_FILES = ["DejaVuSans.ttf", "LiberationSans-Regular.ttf", "Arial.ttf", "arial.ttf"]
+
+FONT_DIRS = [
+    "fonts",
+    "C:/Windows/Fonts",
+    "/Library/Fonts",
+    "/System/Library/Fonts",
+    "/System/Library/Fonts/Supplemental",
+    "/usr/share/fonts",
+    os.path.expanduser("~/.fonts"),
+]
+
+# 匹配一个 "不可拆分" 的单元: 连续的拉丁字母/数字/标点 (单词)、连续空白、或单个其他字符 (如汉字)
+_TOKEN_RE = re.compile(r"[^\s\u2e80-\uffff]+|\s+|.", re.S)
+
+
+def _find_font_file(font_name: str):
+    env_path = os.getenv("TEXT_FONT_PATH")
+    if env_path and os.path.exists(env_path):
+        return env_path
+    names = FONT_FILES.get(font_name, []) + FALLBACK_FONT_FILES
+    for name in names:
+        for font_dir in FONT_DIRS:
+            if not os.path.isdir(font_dir):
+                continue
+            direct = os.path.join(font_dir, name)
+            if os.path.exists(direct):
+                return direct
+            # /usr/share/fonts 下面还有子目录
+            for root, _, files in os.walk(font_dir):
+                if name in files:
+                    return os.path.join(root, name)
+    return None
+
+
+def _heuristic_width(ch: str) -> float:
+    """没有字体文件时的经验字宽 (单位: 1/1000 em)"""
+    if ch in "ilj.,;:!|'`":
+        return 280
+    if ch == " ":
+        return 300
+    if ch.isdigit():
+        return 560
+    if ch.isupper() or ch in "mwMW@%&":
+        return 680
+    return 520
+
+
+class FontMetrics:
+    """某个字体的字宽表 (按字符懒加载并缓存)"""
+
+    def __init__(self, font_name: str):
+        self.font_name = font_name
+        self.font_path = _find_font_file(font_name)
+        self._font = None
+        if self.font_path:
+            try:
+                from PIL import ImageFont
+                self._font = ImageFont.truetype(self.font_path, size=UNITS_PER_EM)
+            except Exception as e:
+                print(f"   ⚠️ [TextMetrics] 字体加载失败 ({self.font_path}): {e}")
+        self._widths = {}
+
+    def char_width(self, ch: str) -> float:
+        w = self._widths.get(ch)
+        if w is None:
+            if unicodedata.east_asian_width(ch) in ("W", "F"):
+                # 中日韩全角字符固定为 1 em，且不依赖兜底字体是否有该字形
+                w = UNITS_PER_EM
+            elif self._font is not None:
+                w = self._font.getlength(ch)
+            else:
+                w = _heuristic_width(ch)
+            self._widths[ch] = w
+        return w
+
+    def text_width(self, text: str) -> float:
+        """文本宽度 (单位: 1/1000 em)"""
+        return sum(self.char_width(ch) for ch in text)
+
+
+@lru_cache(maxsize=16)
+def get_metrics(font_name: str) -> FontMetrics:
+    return FontMetrics(font_name)
+
+
+def _tokenize(text: str, metrics: FontMetrics):
+    """拆成 (是否空白, 总宽度, 每个字符的宽度, 换行符个数) 的列表，宽度单位 1/1000 em"""
+    tokens = []
+    for tok in _TOKEN_RE.findall(text):
+        widths = [metrics.char_width(ch) for ch in tok]
+        tokens.append((tok.isspace(), sum(widths), widths, tok.count("\n")))
+    return tokens
+
+
+def count_lines(tokens, line_width_em: float) -> int:
+    """
+    模拟贪心换行，返回一个段落需要的行数。
+    :param tokens: _tokenize 的结果
+    :param line_width_em: 一行的宽度 (单位: 1/1000 em)
+    """
+    lines = 1
+    current = 0.0
+    for is_space, width, char_widths, newlines in tokens:
+        if newlines:
+            lines += newlines
+            current = 0.0
+            continue
+        if is_space:
+            # 行尾空格不会引起换行
+            if current > 0:
+                current += width
+            continue
+        if current + width <= line_width_em:
+            current += width
+        elif width <= line_width_em:
+            lines += 1
+            current = width
+        else:
+            # 单词比一行还宽，只能按字符硬拆
+            for ch_w in char_widths:
+                if current + ch_w > line_width_em and current > 0:
+                    lines += 1
+                    current = 0.0
+                current += ch_w
+    return lines
+
+
+def count_text_lines(text: str, font_name: str, size_pt: float, box_width_pt: float) -> int:
+    """一段文本在给定宽度、字号下需要的行数"""
+    metrics = get_metrics(font_name)
+    return count_lines(_tokenize(str(text), metrics), box_width_pt / size_pt * UNITS_PER_EM)
+
+
+def measure_height(paragraphs: list, font_name: str, size_pt: float, box_width_pt: float,
+                   line_spacing: float = 1.2, space_after_pt: float = 10) -> float:
+    """估算若干段落在给定宽度、字号下的总高度 (pt)"""
+    metrics = get_metrics(font_name)
+    line_width_em = box_width_pt / size_pt * UNITS_PER_EM
+    total_lines = sum(count_lines(_tokenize(str(text), metrics), line_width_em) for text in paragraphs)
+    return total_lines * size_pt * line_spacing + space_after_pt * len(paragraphs)
+
+
+def fit_font_size(paragraphs: list, box_width_pt: float, box_height_pt: float, font_name: str = "Microsoft YaHei",
+                  min_size: float = 18, max_size: float = 32, step: float = 0.5,
+                  line_spacing: float = 1.2, space_after_pt: float = 10) -> float:
+    """
+    二分查找能放进文本框的最大字号 (按 step 取整)。
+    连最小字号都放不下时返回 min_size。
+    """
+    metrics = get_metrics(font_name)
+    tokenized = [_tokenize(str(text), metrics) for text in paragraphs]
+
+    def fits(size):
+        line_width_em = box_width_pt / size * UNITS_PER_EM
+        lines = sum(count_lines(tokens, line_width_em) for tokens in tokenized)
+        return lines * size * line_spacing + space_after_pt * len(paragraphs) <= box_height_pt
+
+    lo, hi = 0, int(round((max_size - min_size) / step))
+    if not fits(min_size):
+        return min_size
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if fits(min_size + mid * step):
+            lo = mid
+        else:
+            hi = mid - 1
+    return min_size + lo * step
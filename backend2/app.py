@@ -1,14 +1,38 @@
 # app.py
 import os
+import uuid
+from contextlib import asynccontextmanager
 import uvicorn
 from fastapi import FastAPI, HTTPException
 from fastapi.responses import FileResponse
+from starlette.background import BackgroundTask
 from pydantic import BaseModel
 
 # 导入新的生成函数
-from main_backend import generate_ppt_file
+import main_backend
+from main_backend import generate_ppt_file_async
 
-app = FastAPI(title="PPT Generator Pro API")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    # 关闭共享的 OpenAI / 图片 HTTP 连接池和渲染线程池
+    await main_backend.aclose()
+    main_backend.shutdown()
+
+
+app = FastAPI(title="PPT Generator Pro API", lifespan=lifespan)
+
+# 生成的文件只在返回响应期间需要，发送完就删除，不在工作目录里堆积
+OUTPUT_DIR = "generated_ppts"
+os.makedirs(OUTPUT_DIR, exist_ok=True)
+
+
+def _remove_file(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
 
 # 定义请求的数据格式 (增加参数)
 class PPTRequest(BaseModel):
@@ -26,6 +50,8 @@ async def generate_ppt_endpoint(request: PPTRequest):
     # 清理文件名中的非法字符
     safe_topic = "".join([c for c in request.topic if c.isalnum() or c in (' ','-','_')]).strip()
     filename = f"output_{safe_topic}.pptx"
+    # 磁盘上用唯一文件名，避免同主题的并发请求互相覆盖
+    output_file = os.path.join(OUTPUT_DIR, f"{uuid.uuid4().hex}.pptx")
     
     # 检查模版文件是否存在
     template_path = request.template_name
@@ -34,10 +60,10 @@ async def generate_ppt_endpoint(request: PPTRequest):
     
     print(f"收到请求: Topic={request.topic}, Template={template_path}, Font={request.font_name}")
 
-    # 调用核心逻辑
-    output_path = generate_ppt_file(
+    # 调用核心逻辑 (LLM / 图片下载是异步的，渲染在线程池里，不阻塞其他请求)
+    output_path = await generate_ppt_file_async(
         topic=request.topic, 
-        output_filename=filename, 
+        output_filename=output_file, 
         template_path=template_path,
         font_name=request.font_name,
         use_ai=request.use_ai
@@ -47,7 +73,8 @@ async def generate_ppt_endpoint(request: PPTRequest):
         return FileResponse(
             path=output_path,
             filename=filename,
-            media_type='application/vnd.openxmlformats-officedocument.presentationml.presentation'
+            media_type='application/vnd.openxmlformats-officedocument.presentationml.presentation',
+            background=BackgroundTask(_remove_file, output_path)
         )
     else:
         raise HTTPException(status_code=500, detail="PPT 生成失败，请检查后端日志")
@@ -0,0 +1,102 @@
+import hashlib
+import os
+import threading
+import uuid
+
+# === 图片磁盘缓存 (内容寻址 + LRU 淘汰) ===
+# key = sha256(规范化的 prompt + 宽高)，文件按 key 前两位分目录存放。
+# 每次命中都会刷新文件 mtime，超出容量时按 mtime 从旧到新删除。
+# 多个渲染进程共享同一个目录，写入使用 "临时文件 + os.replace" 保证原子性。
+
+IMAGE_CACHE_DIR = os.getenv("IMAGE_CACHE_DIR", os.path.join("cache", "images"))
+IMAGE_CACHE_MAX_BYTES = int(os.getenv("IMAGE_CACHE_MAX_BYTES", 500 * 1024 * 1024))
+
+stats = {"hits": 0, "misses": 0, "writes": 0, "evictions": 0}
+_lock = threading.Lock()
+_total_bytes = None  # 当前缓存体积 (首次使用时扫描目录得到)
+
+
+def make_key(prompt: str, width: int = 1280, height: int = 720) -> str:
+    normalized = " ".join(prompt.lower().split())
+    return hashlib.sha256(f"{normalized}|{width}x{height}".encode("utf-8")).hexdigest()
+
+
+def _path(key: str) -> str:
+    return os.path.join(IMAGE_CACHE_DIR, key[:2], key)
+
+
+def _scan():
+    entries = []
+    for root, _, files in os.walk(IMAGE_CACHE_DIR):
+        for name in files:
+            path = os.path.join(root, name)
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+    return entries
+
+
+def get(key: str):
+    """命中返回图片字节，否则返回 None"""
+    path = _path(key)
+    try:
+        with open(path, "rb") as f:
+            content = f.read()
+        os.utime(path)  # 刷新 LRU 时间
+    except (FileNotFoundError, OSError):
+        with _lock:
+            stats["misses"] += 1
+        return None
+    with _lock:
+        stats["hits"] += 1
+    return content
+
+
+def put(key: str, content: bytes):
+    global _total_bytes
+    if not content or len(content) > IMAGE_CACHE_MAX_BYTES:
+        return
+    path = _path(key)
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        print(f"   ⚠️ [ImageCache] 写入缓存失败: {e}")
+        return
+
+    with _lock:
+        stats["writes"] += 1
+        if _total_bytes is None:
+            _total_bytes = sum(size for _, size, _ in _scan())
+        else:
+            _total_bytes += len(content)
+        if _total_bytes > IMAGE_CACHE_MAX_BYTES:
+            _evict()
+
+
+def _evict():
+    """按 mtime 从旧到新删除，直到低于容量的 90%"""
+    global _total_bytes
+    entries = sorted(_scan())
+    total = sum(size for _, size, _ in entries)
+    target = IMAGE_CACHE_MAX_BYTES * 0.9
+    for _, size, path in entries:
+        if total <= target:
+            break
+        try:
+            os.remove(path)
+            total -= size
+            stats["evictions"] += 1
+        except FileNotFoundError:
+            pass
+    _total_bytes = total
+
+
+def get_stats() -> dict:
+    with _lock:
+        return dict(stats)
@@ -1,20 +1,74 @@
 # main_backend.py
+import asyncio
 import json
-import time
 import os
-import requests
+from concurrent.futures import ThreadPoolExecutor
 from io import BytesIO
-from pptx import Presentation
+import httpx
 from pptx.util import Pt, Inches
 from pptx.dml.color import RGBColor
-from openai import OpenAI
+from openai import AsyncOpenAI
+import template_cache
+import image_cache
+
+# === 0. 共享客户端 & 渲染线程池 ===
+# LLM 和图片下载都走异步客户端，整个进程共用一个 (连接池 + keep-alive)，不再每次请求新建；
+# python-pptx 渲染和保存是同步的 CPU / 磁盘操作，放到线程池里执行，不阻塞事件循环。
+IMAGE_MAX_CONNECTIONS = int(os.getenv("IMAGE_MAX_CONNECTIONS", 20))
+IMAGE_TIMEOUT = float(os.getenv("IMAGE_TIMEOUT", 10))
+RENDER_THREADS = int(os.getenv("RENDER_THREADS", 4))
+
+HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
+}
+
+_llm_client = None
+_http_client = None
+_render_executor = ThreadPoolExecutor(max_workers=RENDER_THREADS, thread_name_prefix="render")
+
+
+def get_llm_client() -> AsyncOpenAI:
+    global _llm_client
+    if _llm_client is None:
+        #  Key (优先读环境变量)
+        api_key = os.getenv("OPENAI_API_KEY", "sk-xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx")
+        _llm_client = AsyncOpenAI(api_key=api_key)
+    return _llm_client
+
+
+def get_http_client() -> httpx.AsyncClient:
+    global _http_client
+    if _http_client is None:
+        _http_client = httpx.AsyncClient(
+            headers=HEADERS,
+            timeout=IMAGE_TIMEOUT,
+            follow_redirects=True,  # Picsum 会 302 跳转到 CDN
+            limits=httpx.Limits(max_connections=IMAGE_MAX_CONNECTIONS, max_keepalive_connections=IMAGE_MAX_CONNECTIONS),
+        )
+    return _http_client
+
+
+async def aclose():
+    """关闭共享客户端 (服务退出时调用)"""
+    global _llm_client, _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+    if _llm_client is not None:
+        await _llm_client.close()
+        _llm_client = None
+
+
+def shutdown():
+    _render_executor.shutdown(wait=False, cancel_futures=True)
+
 
 # === 1. 定义数据结构与 LLM 接口 ===
-def get_content_from_llm(topic, use_ai=False):
+async def get_content_from_llm(topic, use_ai=False):
     # --- 1.1 模拟模式 (Mock) ---
     if not use_ai:
         print("(测试模式) 使用预设数据，包含网络图片关键词...")
-        time.sleep(0.5)
+        await asyncio.sleep(0.5)
         return {
             "title": f"{topic} 深度解析",
             "subtitle": "Generated by AI Generator",
@@ -45,10 +99,6 @@ def get_content_from_llm(topic, use_ai=False):
     # --- 1.2 AI 模式 (调用 OpenAI) ---
     print(f"🤖 (AI 模式) 正在请求 OpenAI 构思 PPT 内容...")
     
-    #  Key
-    api_key = "sk-xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx" 
-    client = OpenAI(api_key=api_key)
-    
     # 核心 Prompt：教 AI 如何返回 JSON
     prompt = f"""
     你是一个专业的 PPT 生成助手。请为主题 "{topic}" 生成 4-5 页 PPT 内容。
@@ -84,7 +134,7 @@ def get_content_from_llm(topic, use_ai=False):
     """
     
     try:
-        response = client.chat.completions.create(
+        response = await get_llm_client().chat.completions.create(
             model="gpt-3.5-turbo", # 如果你有 gpt-4，建议改成 gpt-4-turbo，JSON 格式更稳
             messages=[{"role": "user", "content": prompt}],
             temperature=0.7
@@ -116,46 +166,71 @@ def auto_fit_text(text_frame, content_list, font_name="Microsoft YaHei"):
 
 
 # === 3. 下载网络图片 ===
-def get_image_stream(query):
+async def _download(url):
+    response = await get_http_client().get(url)
+    if response.status_code == 200 and response.content:
+        return response.content
+    print(f"   ⚠️ 图片源返回状态码 {response.status_code}: {url}")
+    return None
+
+
+async def fetch_image(query):
     """
     尝试从 AI 接口下载图片。如果失败，自动降级使用随机风景图。
+    :return: 图片字节，全部失败时为 None
     """
-    # 1. 准备请求头 (假装自己是浏览器，防止被拦截)
-    headers = {
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
-    }
-
-    # 2. 定义图片源
+    # 1. 定义图片源
     safe_query = query.replace(" ", "%20")
     # 首选：AI 生成源
     url_primary = f"https://image.pollinations.ai/prompt/{safe_query}?width=1280&height=720&nologo=true"
     # 备选：随机风景源 (如果不通，就用这个兜底)
     url_backup = "https://picsum.photos/1280/720"
 
+    # 先查本地缓存
+    cache_key = image_cache.make_key(query, 1280, 720)
+    cached = await asyncio.to_thread(image_cache.get, cache_key)
+    if cached:
+        print(f"   💾 图片缓存命中: {query}")
+        return cached
+
     print(f"   ⬇️ 正在下载图片: {query} ...")
     
-    # 3. 尝试下载 (主源)
+    # 2. 尝试下载 (主源)
     try:
-        response = requests.get(url_primary, headers=headers, timeout=10)
-        if response.status_code == 200:
-            return BytesIO(response.content)
-        else:
-            print(f"   ⚠️ AI 图片源失败 (状态码 {response.status_code})，尝试备用源...")
+        content = await _download(url_primary)
+        if content:
+            await asyncio.to_thread(image_cache.put, cache_key, content)
+            return content
+        print("   ⚠️ AI 图片源失败，尝试备用源...")
     except Exception as e:
-        print(f"   ⚠️ AI 图片源连接错误: {e}")
+        print(f"   ⚠️ AI 图片源连接错误: {e!r}")
 
-    # 4. 尝试下载 (备用源)
+    # 3. 尝试下载 (备用源，按 query 分别缓存，避免每页都是同一张图)
+    backup_key = image_cache.make_key(f"__picsum__:{query}", 1280, 720)
+    cached = await asyncio.to_thread(image_cache.get, backup_key)
+    if cached:
+        return cached
     try:
         print(f"   🔄 正在切换到备用图片源 (Picsum)...")
-        response = requests.get(url_backup, headers=headers, timeout=10)
-        if response.status_code == 200:
-            return BytesIO(response.content)
+        content = await _download(url_backup)
+        if content:
+            await asyncio.to_thread(image_cache.put, backup_key, content)
+            return content
     except Exception as e:
-        print(f"   ❌ 备用源也失败了: {e}")
+        print(f"   ❌ 备用源也失败了: {e!r}")
 
     return None
 
 
+async def fetch_images(data):
+    """并发下载所有 image 页需要的图片，返回 {image_query: 图片字节或 None}"""
+    queries = list(dict.fromkeys(
+        page.get("image_query", "technology") for page in data.get("pages", []) if page.get("type") == "image"
+    ))
+    results = await asyncio.gather(*(fetch_image(q) for q in queries))
+    return dict(zip(queries, results))
+
+
 # === 4. 页面生成逻辑 ===
 def create_table_slide(slide, data, font_name):
     left = Inches(1); top = Inches(2); width = Inches(8); height = Inches(4)
@@ -186,11 +261,9 @@ def create_table_slide(slide, data, font_name):
                 p.font.name = font_name
                 p.font.size = Pt(14)
 
-def create_image_slide(slide, image_query, caption, font_name):
-    # 1. 下载图片流
-    image_stream = get_image_stream(image_query)
-    
-    if not image_stream:
+def create_image_slide(slide, image_query, image_bytes, caption, font_name):
+    # 1. 图片已经提前并发下载好
+    if not image_bytes:
         # 如果下载失败就放一个文本框提示
         txBox = slide.shapes.add_textbox(Inches(3), Inches(3), Inches(4), Inches(1))
         txBox.text_frame.text = f"[ 图片下载失败: {image_query} ]"
@@ -198,7 +271,7 @@ def create_image_slide(slide, image_query, caption, font_name):
 
     # 2. 插入图片
     left = Inches(1.5); top = Inches(2); height = Inches(4.5)
-    slide.shapes.add_picture(image_stream, left, top, height=height)
+    slide.shapes.add_picture(BytesIO(image_bytes), left, top, height=height)
 
     # 3. 添加说明
     if caption:
@@ -210,16 +283,13 @@ def create_image_slide(slide, image_query, caption, font_name):
         p.font.name = font_name
 
 
-# === 5. 主入口 ===
-def generate_ppt_file(topic, output_filename="final_output.pptx", template_path="template.pptx", font_name="Microsoft YaHei", use_ai=False):
-    
-    data = get_content_from_llm(topic, use_ai=use_ai)
-    if not data: return None
-
-    if os.path.exists(template_path):
-        prs = Presentation(template_path)
-    else:
-        prs = Presentation()
+# === 5. 渲染 (同步，在线程池里执行) ===
+def render_ppt_file(data, images, output_filename, template_path="template.pptx", font_name="Microsoft YaHei"):
+    """
+    :param images: fetch_images 的结果 {image_query: 图片字节}
+    """
+    # 从模板缓存拿一份副本 (不存在时为空白模板)
+    prs = template_cache.get_presentation(template_path)
 
     # 封面
     slide = prs.slides.add_slide(prs.slide_layouts[0])
@@ -255,7 +325,7 @@ def generate_ppt_file(topic, output_filename="final_output.pptx", template_path=
             # 传入 image_query 而不是 path
             query = page.get("image_query", "technology")
             caption = page.get("caption", "")
-            create_image_slide(slide, query, caption, font_name)
+            create_image_slide(slide, query, images.get(query), caption, font_name)
 
     try:
         prs.save(output_filename)
@@ -263,4 +333,26 @@ def generate_ppt_file(topic, output_filename="final_output.pptx", template_path=
         return output_filename
     except Exception as e:
         print(f"保存异常: {e}")
-        return None
\ No newline at end of file
+        return None
+
+
+# === 6. 主入口 ===
+async def generate_ppt_file_async(topic, output_filename="final_output.pptx", template_path="template.pptx", font_name="Microsoft YaHei", use_ai=False):
+    data = await get_content_from_llm(topic, use_ai=use_ai)
+    if not data: return None
+
+    images = await fetch_images(data)
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        _render_executor, render_ppt_file, data, images, output_filename, template_path, font_name
+    )
+
+
+def generate_ppt_file(topic, output_filename="final_output.pptx", template_path="template.pptx", font_name="Microsoft YaHei", use_ai=False):
+    """同步版本 (命令行 / 脚本调用)"""
+    async def run():
+        try:
+            return await generate_ppt_file_async(topic, output_filename, template_path, font_name, use_ai)
+        finally:
+            await aclose()
+    return asyncio.run(run())
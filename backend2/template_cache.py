@@ -0,0 +1,49 @@
+import copy
+import os
+import threading
+from pptx import Presentation
+
+# === 模板缓存 ===
+# 每个模板文件只解析一次 (zip 解压 + 所有 master/layout 的 XML 解析)，
+# 之后每次渲染拿到的是内存里原始模板的深拷贝，原件永远不会被修改。
+# 模板文件的 mtime 变化时自动重新加载。
+
+_cache = {}  # path -> (mtime, Presentation)
+_lock = threading.Lock()
+
+
+def _load(template_path):
+    if template_path and os.path.exists(template_path):
+        return os.path.getmtime(template_path), Presentation(template_path)
+    # 没有模板就用空白的
+    return None, Presentation()
+
+
+def get_presentation(template_path: str):
+    """
+    返回模板的一个独立副本，可以随意添加幻灯片。
+    :param template_path: 模板路径，不存在时返回空白 Presentation
+    """
+    with _lock:
+        mtime = os.path.getmtime(template_path) if template_path and os.path.exists(template_path) else None
+        cached = _cache.get(template_path)
+        if cached is None or cached[0] != mtime:
+            if cached is not None:
+                print(f"   🔁 [Template] 模板已更新，重新加载: {template_path}")
+            cached = _load(template_path)
+            _cache[template_path] = cached
+        pristine = cached[1]
+    return copy.deepcopy(pristine)
+
+
+def preload(template_paths):
+    """启动时预加载模板，避免第一次渲染时才解析"""
+    for path in template_paths:
+        with _lock:
+            _cache[path] = _load(path)
+        print(f"   📦 [Template] 已预加载: {path}")
+
+
+def clear():
+    with _lock:
+        _cache.clear()
@@ -221,6 +221,7 @@ export default function Home() {
   
   const [isGenerating, setIsGenerating] = useState(false);
   const [loadingText, setLoadingText] = useState("Initializing...");
+  const [isStreaming, setIsStreaming] = useState(false);
   
   const [pptData, setPptData] = useState<any>(null); 
   const [downloadUrl, setDownloadUrl] = useState("");
@@ -242,7 +243,8 @@ export default function Home() {
         const timer1 = setTimeout(() => setLoadingText("Researching topic..."), 2000);
         const timer2 = setTimeout(() => setLoadingText("Structuring logic..."), 5000);
         
-        const res = await fetch('http://127.0.0.1:8000/api/generate_outline', {
+        // 流式接口: 每收到一页就显示出来，不用等整个大纲生成完
+        const res = await fetch('http://127.0.0.1:8000/api/generate_outline/stream', {
             method: 'POST',
             headers: {'Content-Type': 'application/json'},
             body: JSON.stringify({ 
@@ -252,19 +254,55 @@ export default function Home() {
                 use_ai: true 
             })
         });
-        clearTimeout(timer1);
-        clearTimeout(timer2);
 
-        if (!res.ok) throw new Error("Connection failed");
-        const jsonRes = await res.json();
-        if (jsonRes.status !== "success" || !jsonRes.data) throw new Error("Invalid response");
+        if (!res.ok || !res.body) throw new Error("Connection failed");
+        const reader = res.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = "";
+        let slides: any[] = [];
+        let finished = false;
+
+        while (!finished) {
+            const { value, done } = await reader.read();
+            if (done) break;
+            buffer += decoder.decode(value, { stream: true });
 
-        setPptData(jsonRes.data); 
+            // SSE 事件之间用空行分隔
+            let sep: number;
+            while ((sep = buffer.indexOf("\n\n")) >= 0) {
+                const raw = buffer.slice(0, sep);
+                buffer = buffer.slice(sep + 2);
+                const event = raw.match(/^event: (.*)$/m)?.[1];
+                const data = raw.match(/^data: (.*)$/m)?.[1];
+                if (!event || !data) continue;
+
+                if (event === "slide") {
+                    slides = [...slides, JSON.parse(data)];
+                    setPptData({ topic: inputValue, slides });
+                    if (slides.length === 1) {
+                        clearTimeout(timer1);
+                        clearTimeout(timer2);
+                        setIsGenerating(false);
+                        setIsStreaming(true);
+                        setStep('outline');
+                    }
+                } else if (event === "done") {
+                    setPptData(JSON.parse(data));
+                    finished = true;
+                } else if (event === "error") {
+                    throw new Error(JSON.parse(data).detail);
+                }
+            }
+        }
+        clearTimeout(timer1);
+        clearTimeout(timer2);
+        if (!finished) throw new Error("Invalid response");
         setStep('outline');
     } catch (e: any) {
         alert("Generation Error: " + e.message);
     } finally {
         setIsGenerating(false);
+        setIsStreaming(false);
     }
   };
 
@@ -397,8 +435,8 @@ export default function Home() {
             </div>
             <div className="flex justify-center pb-8 gap-4">
                 <button onClick={() => setStep('input')} className="px-8 py-4 rounded-full font-bold text-gray-500 hover:text-white transition-colors">Back</button>
-                <button onClick={handleRenderAndDownload} disabled={isGenerating} className="bg-gradient-to-r from-purple-600 to-pink-600 text-white px-16 py-4 rounded-full font-bold text-xl shadow-[0_0_40px_rgba(168,85,247,0.4)] hover:shadow-[0_0_60px_rgba(168,85,247,0.6)] hover:scale-[1.02] transition-all flex items-center gap-2">
-                    {isGenerating ? "Rendering..." : "✨ Confirm & Preview"}
+                <button onClick={handleRenderAndDownload} disabled={isGenerating || isStreaming} className="bg-gradient-to-r from-purple-600 to-pink-600 text-white px-16 py-4 rounded-full font-bold text-xl shadow-[0_0_40px_rgba(168,85,247,0.4)] hover:shadow-[0_0_60px_rgba(168,85,247,0.6)] hover:scale-[1.02] transition-all flex items-center gap-2">
+                    {isGenerating ? "Rendering..." : isStreaming ? "Writing slides..." : "✨ Confirm & Preview"}
                 </button>
             </div>
         </div>